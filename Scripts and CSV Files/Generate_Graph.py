@@ -3,15 +3,22 @@
 The script loads logged portfolio equity, fetches S&P 500 data, and
 renders a comparison chart. Core behaviour remains unchanged; the code
 is simply reorganised and commented for clarity.
+
+With ``--out`` the chart is rendered headless through ``charts`` and
+written as PNG, SVG and/or JSON instead of being shown on screen.
 """
 
 import argparse
+import sys
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import pandas as pd
-import yfinance as yf
-from typing import cast
+
+# Allow importing the shared modules from the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from charts import CHART_FORMATS, MAX_CHART_POINTS, ChartData, ChartRenderer, load_benchmark, load_equity
+from storage import open_backend
 
 DATA_DIR = Path(__file__).resolve().parent
 PORTFOLIO_CSV = DATA_DIR / "chatgpt_portfolio_update.csv"
@@ -42,46 +49,42 @@ def load_portfolio_details(
         set to ``pd.Timestamp.today()``.
     """
 
-    if not PORTFOLIO_CSV.exists():
+    storage = open_backend(DATA_DIR)
+    if not storage.exists():
         msg = (
             f"Portfolio file '{PORTFOLIO_CSV}' not found. Run Trading_Script.py "
             "to generate it."
         )
         raise SystemExit(msg)
 
-    chatgpt_df = pd.read_csv(PORTFOLIO_CSV)
-    chatgpt_totals = chatgpt_df[chatgpt_df["Ticker"] == "TOTAL"].copy()
-    chatgpt_totals["Date"] = pd.to_datetime(chatgpt_totals["Date"])
+    return load_equity(DATA_DIR, baseline_equity, baseline_date)
 
-    if baseline_date is None:
-        if not chatgpt_totals.empty:
-            baseline_date = chatgpt_totals["Date"].min()
-        else:
-            baseline_date = pd.Timestamp.today()
-
-    baseline_row = pd.DataFrame({"Date": [baseline_date], "Total Equity": [baseline_equity]})
-    return pd.concat([baseline_row, chatgpt_totals], ignore_index=True).sort_values("Date")
 
+def download_sp500(
+    start_date: pd.Timestamp, end_date: pd.Timestamp, offline: bool | None = None
+) -> pd.DataFrame:
+    """Load S&P 500 prices and normalise to a $100 baseline.
 
-def download_sp500(start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
-    """Download S&P 500 prices and normalise to a $100 baseline."""
-    sp500 = yf.download(
-        "^SPX", start=start_date, end=end_date + pd.Timedelta(days=1), progress=False
-    )
-    sp500 = cast(pd.DataFrame, sp500)
-    sp500 = sp500.reset_index()
-    if isinstance(sp500.columns, pd.MultiIndex):
-        sp500.columns = sp500.columns.get_level_values(0)
-    spx_27_price = 6173.07
-    scaling_factor = 100 / spx_27_price
-    sp500["SPX Value ($100 Invested)"] = sp500["Close"] * scaling_factor
-    return sp500
+    Prices are read through the on-disk cache in ``DATA_DIR`` so only bars
+    missing since the last run are downloaded.
+    """
+    return load_benchmark(start_date, end_date, DATA_DIR, offline)
 
 
 def main(
-    baseline_equity: float, start_date: pd.Timestamp | None, end_date: pd.Timestamp | None
+    baseline_equity: float,
+    start_date: pd.Timestamp | None,
+    end_date: pd.Timestamp | None,
+    offline: bool | None = None,
+    out: Path | None = None,
+    formats: tuple[str, ...] = ("png",),
+    max_points: int = MAX_CHART_POINTS,
 ) -> None:
-    """Generate and display the comparison graph."""
+    """Generate the comparison graph.
+
+    It is shown on screen unless ``out`` is given, in which case it is
+    written to ``out`` plus one suffix per entry of ``formats``.
+    """
     if baseline_equity <= 0:
         raise SystemError("Baseline equity must be positive.")
 
@@ -110,45 +113,18 @@ def main(
     if start_date > end_date:
         raise SystemExit("Start date must be on or before end date.")
 
-    sp500 = download_sp500(start_date, end_date)
-
-    plt.figure(figsize=(10, 6))
-    plt.style.use("seaborn-v0_8-whitegrid")
-    plt.plot(
-        chatgpt_totals["Date"],
-        chatgpt_totals["Total Equity"],
-        label="ChatGPT ($100 Invested)",
-        marker="o",
-        color="blue",
-        linewidth=2,
-    )
-    plt.plot(
-        sp500["Date"],
-        sp500["SPX Value ($100 Invested)"],
-        label="S&P 500 ($100 Invested)",
-        marker="o",
-        color="orange",
-        linestyle="--",
-        linewidth=2,
-    )
+    sp500 = download_sp500(start_date, end_date, offline)
 
-    final_date = chatgpt_totals["Date"].iloc[-1]
-    final_chatgpt = float(chatgpt_totals["Total Equity"].iloc[-1])
-    final_spx = sp500["SPX Value ($100 Invested)"].iloc[-1]
+    chart = ChartData("ChatGPT", chatgpt_totals, sp500, baseline_equity)
+    if out is not None:
+        written = ChartRenderer(max_points).render(chart, out, formats)
+        print("Wrote", ", ".join(str(path) for path in written))
+        return
 
-    plt.text(
-        final_date, final_chatgpt + 0.3, f"+{final_chatgpt - baseline_equity:.1f}%", color="blue", fontsize=9
-    )
-    plt.text(
-        final_date, final_spx + 0.9, f"+{final_spx - 100:.1f}%", color="orange", fontsize=9
-    )
-    plt.title("ChatGPT's Micro Cap Portfolio vs. S&P 500")
-    plt.xlabel("Date")
-    plt.ylabel("Value of $100 Investment")
-    plt.xticks(rotation=15)
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
+    import matplotlib.pyplot as plt
+
+    renderer = ChartRenderer(max_points, figure=plt.figure(figsize=(10, 6)))
+    renderer.draw(chart)
     plt.show()
 
 
@@ -170,10 +146,42 @@ if __name__ == "__main__":
         type=str,
         help="End date for the chart (YYYY-MM-DD)",
     )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        default=None,
+        help="Use only cached S&P 500 prices, without network access",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        help="Write the chart to this path (without suffix) instead of showing it",
+    )
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=CHART_FORMATS,
+        default=["png"],
+        help="Output formats for --out",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=MAX_CHART_POINTS,
+        help="Downsample each plotted line to at most this many points",
+    )
     args = parser.parse_args()
 
     start = parse_date(args.start_date, "start date") if args.start_date else None
     end = parse_date(args.end_date, "end date") if args.end_date else None
 
-    main(args.baseline_equity, start, end)
+    main(
+        args.baseline_equity,
+        start,
+        end,
+        args.offline,
+        out=args.out,
+        formats=tuple(args.format),
+        max_points=args.max_points,
+    )
 
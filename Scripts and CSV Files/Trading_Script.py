@@ -1,15 +1,53 @@
 """Wrapper for the shared trading script using local data directory."""
 
+import argparse
 from pathlib import Path
 import sys
 
 # Allow importing the shared module from the repository root
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+from stops import StopRules
 from trading_script import main
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the portfolio and log trades")
+    parser.add_argument(
+        "--orders",
+        type=Path,
+        help="JSON or CSV file of buys and sells to apply without prompting",
+    )
+    parser.add_argument(
+        "--from-log",
+        action="store_true",
+        help="rebuild positions and cash from the trade log instead of the list below",
+    )
+    parser.add_argument(
+        "--trailing-stop",
+        type=float,
+        metavar="PCT",
+        help="sell after the price falls PCT%% below its highest price since buying",
+    )
+    parser.add_argument(
+        "--atr-stop",
+        type=float,
+        metavar="N",
+        help="sell after the price falls N average true ranges below that high",
+    )
+    parser.add_argument(
+        "--take-profit",
+        type=float,
+        metavar="PCT",
+        help="sell once the price is PCT%% above the buy price",
+    )
+    args = parser.parse_args()
+    rules = StopRules(
+        trailing=args.trailing_stop / 100 if args.trailing_stop is not None else None,
+        atr_multiple=args.atr_stop,
+        take_profit=args.take_profit / 100 if args.take_profit is not None else None,
+    )
+
     starting_cash = 100
 
     chatgpt_portfolio = [
@@ -20,5 +58,8 @@ if __name__ == "__main__":
     cash = 31.58
 
     data_dir = Path(__file__).resolve().parent
-    main(chatgpt_portfolio, cash, data_dir)
+    if args.from_log:
+        main(None, None, data_dir, orders=args.orders, rules=rules)
+    else:
+        main(chatgpt_portfolio, cash, data_dir, orders=args.orders, rules=rules)
 
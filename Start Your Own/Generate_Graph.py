@@ -3,11 +3,21 @@
 The script loads logged portfolio equity, fetches S&P 500 data, and
 renders a comparison chart. Core behaviour remains unchanged; the code
 is simply reorganised and commented for clarity.
+
+With ``--out`` the chart is rendered headless through ``charts`` and
+written as PNG, SVG and/or JSON instead of being shown on screen.
 """
 
-import matplotlib.pyplot as plt
+import argparse
+import sys
+from pathlib import Path
+
 import pandas as pd
-import yfinance as yf
+
+# Allow importing the shared modules from the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from charts import CHART_FORMATS, MAX_CHART_POINTS, ChartData, ChartRenderer, load_benchmark, load_equity
 
 DATA_DIR = "Scripts and CSV Files"
 PORTFOLIO_CSV = f"{DATA_DIR}/chatgpt_portfolio_update.csv"
@@ -15,76 +25,64 @@ PORTFOLIO_CSV = f"{DATA_DIR}/chatgpt_portfolio_update.csv"
 
 def load_portfolio_totals() -> pd.DataFrame:
     """Load portfolio equity history including a baseline row."""
-    chatgpt_df = pd.read_csv(PORTFOLIO_CSV)
-    chatgpt_totals = chatgpt_df[chatgpt_df["Ticker"] == "TOTAL"].copy()
-    chatgpt_totals["Date"] = pd.to_datetime(chatgpt_totals["Date"])
-
-    baseline_date = pd.Timestamp("2025-06-27")
-    baseline_equity = 100
-    baseline_row = pd.DataFrame({"Date": [baseline_date], "Total Equity": [baseline_equity]})
-    return pd.concat([baseline_row, chatgpt_totals], ignore_index=True).sort_values("Date")
-
-
-def download_sp500(start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
-    """Download S&P 500 prices and normalise to a $100 baseline."""
-    sp500 = yf.download("^SPX", start=start_date, end=end_date + pd.Timedelta(days=1), progress=False)
-    sp500 = sp500.reset_index()
-    if isinstance(sp500.columns, pd.MultiIndex):
-        sp500.columns = sp500.columns.get_level_values(0)
-    spx_27_price = 6173.07
-    scaling_factor = 100 / spx_27_price
-    sp500["SPX Value ($100 Invested)"] = sp500["Close"] * scaling_factor
-    return sp500
-
-
-def main() -> None:
-    """Generate and display the comparison graph."""
+    return load_equity(Path(DATA_DIR), 100, pd.Timestamp("2025-06-27"))
+
+
+def download_sp500(
+    start_date: pd.Timestamp, end_date: pd.Timestamp, offline: bool | None = None
+) -> pd.DataFrame:
+    """Load S&P 500 prices and normalise to a $100 baseline.
+
+    Prices are read through the on-disk cache in ``DATA_DIR`` so only bars
+    missing since the last run are downloaded.
+    """
+    return load_benchmark(start_date, end_date, Path(DATA_DIR), offline)
+
+
+def main(
+    out: Path | None = None,
+    formats: tuple[str, ...] = ("png",),
+    offline: bool | None = None,
+) -> None:
+    """Generate the comparison graph, on screen or into ``out`` when given."""
     chatgpt_totals = load_portfolio_totals()
 
     start_date = pd.Timestamp("2025-06-27")
     end_date = chatgpt_totals["Date"].max()
-    sp500 = download_sp500(start_date, end_date)
-
-    plt.figure(figsize=(10, 6))
-    plt.style.use("seaborn-v0_8-whitegrid")
-    plt.plot(
-        chatgpt_totals["Date"],
-        chatgpt_totals["Total Equity"],
-        label="ChatGPT ($100 Invested)",
-        marker="o",
-        color="blue",
-        linewidth=2,
-    )
-    plt.plot(
-        sp500["Date"],
-        sp500["SPX Value ($100 Invested)"],
-        label="S&P 500 ($100 Invested)",
-        marker="o",
-        color="orange",
-        linestyle="--",
-        linewidth=2,
-    )
+    sp500 = download_sp500(start_date, end_date, offline)
 
-    final_date = chatgpt_totals["Date"].iloc[-1]
-    final_chatgpt = float(chatgpt_totals["Total Equity"].iloc[-1])
-    final_spx = sp500["SPX Value ($100 Invested)"].iloc[-1]
+    if out is None:
+        import matplotlib.pyplot as plt
 
-    plt.text(final_date, final_chatgpt + 0.3, f"+{final_chatgpt - 100:.1f}%", color="blue", fontsize=9)
-    plt.text(final_date, final_spx + 0.9, f"+{final_spx - 100:.1f}%", color="orange", fontsize=9)
+        renderer = ChartRenderer(MAX_CHART_POINTS, figure=plt.figure(figsize=(10, 6)))
+    else:
+        renderer = ChartRenderer(MAX_CHART_POINTS)
+    chart = ChartData("ChatGPT", chatgpt_totals, sp500)
+    renderer.draw(chart)
 
     drawdown_date = pd.Timestamp("2025-07-11")
     drawdown_value = 102.46
-    plt.text(drawdown_date + pd.Timedelta(days=0.5), drawdown_value - 0.5, "-7% Drawdown", color="red", fontsize=9)
-    plt.title("ChatGPT's Micro Cap Portfolio vs. S&P 500")
-    plt.xlabel("Date")
-    plt.ylabel("Value of $100 Investment")
-    plt.xticks(rotation=15)
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
+    renderer.axes.text(
+        drawdown_date + pd.Timedelta(days=0.5), drawdown_value - 0.5, "-7% Drawdown", color="red", fontsize=9
+    )
+    if out is not None:
+        written = renderer.save(chart, out, formats)
+        print("Wrote", ", ".join(str(path) for path in written))
+        return
     plt.show()
 
 
 if __name__ == "__main__":
-    main()
-
+    parser = argparse.ArgumentParser(description="Plot portfolio performance")
+    parser.add_argument("--out", type=Path, help="Write the chart to this path (without suffix)")
+    parser.add_argument(
+        "--format", nargs="+", choices=CHART_FORMATS, default=["png"], help="Output formats for --out"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        default=None,
+        help="Use only cached S&P 500 prices, without network access",
+    )
+    args = parser.parse_args()
+    main(args.out, tuple(args.format), args.offline)
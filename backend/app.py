@@ -1,10 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import yfinance as yf
 import openai
 import os
-from datetime import datetime
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+import hashlib
 import json
+import math
+
+from jobs import JOB_MAX_PENDING, JOB_WORKERS, JobQueue, QueueFull
+from portfolio import (
+    DEFAULT_DATA_DIR,
+    TRADES_PER_PAGE,
+    WATCH_INTERVAL_SECONDS,
+    PortfolioData,
+    PortfolioWatcher,
+    paginate,
+    since_filter,
+)
+from research import (
+    BATCH_MAX_TICKERS,
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL_SECONDS,
+    RATE_BURST,
+    RATE_PER_MINUTE,
+    RateLimiter,
+    ResearchCache,
+    ResearchHistory,
+    analyze,
+    fetch_prices,
+    matches,
+)
+# From the repository root, which portfolio.py and research.py put on sys.path
+from instrumentation import configure, enabled, prometheus_text
 
 app = Flask(__name__)
 CORS(app)
@@ -12,90 +42,323 @@ CORS(app)
 # Load OpenAI API key from environment
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Shared by every request handled by this process
+research_cache = ResearchCache(
+    ttl=float(os.getenv('RESEARCH_CACHE_TTL', CACHE_TTL_SECONDS)),
+    max_entries=int(os.getenv('RESEARCH_CACHE_SIZE', CACHE_MAX_ENTRIES)),
+)
+rate_limiter = RateLimiter(
+    rate_per_minute=float(os.getenv('RESEARCH_RATE_PER_MINUTE', RATE_PER_MINUTE)),
+    burst=int(os.getenv('RESEARCH_RATE_BURST', RATE_BURST)),
+)
+research_history = ResearchHistory(
+    os.getenv('RESEARCH_HISTORY_PATH', Path(__file__).resolve().parent / 'research_history.jsonl')
+)
+research_history.warm(research_cache)
+
+
+def client_id():
+    """Address the rate limit is applied to."""
+    return request.remote_addr or 'unknown'
+
+
+def rate_limited(cost=1):
+    """A 429 response when the client cannot spend ``cost`` tokens, else ``None``."""
+    wait = rate_limiter.acquire(client_id(), cost)
+    if not wait:
+        return None
+    response = jsonify({'error': 'Too many research requests, please slow down'})
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response, 429
+
+
+def research_key(data):
+    """The (ticker, analysisType, timeframe) cache key of a request body."""
+    data = data or {}
+    return (
+        str(data.get('ticker', '')).upper(),
+        data.get('analysisType', 'comprehensive'),
+        data.get('timeframe', '6 months'),
+    )
+
+
+def run_research(key, prices=None):
+    """Return the cached or freshly computed result for ``key``.
+
+    Every endpoint prices a fresh result from the same market data source,
+    so a cached result holds the same price whichever endpoint computed
+    it. ``prices`` holds closes the caller already fetched for a batch.
+    """
+    def compute():
+        latest = prices if prices is not None else fetch_prices([key[0]])
+        return analyze(*key, current_price=latest.get(key[0]))
+
+    result, computed = research_cache.get_or_compute(key, compute)
+    if computed:
+        research_history.add(result)
+    return result, computed
+
+
+# Slow research runs here instead of in the request thread. Its workers
+# start with the first request, so only the process serving requests runs
+# them and not the debug reloader's parent.
+research_jobs = JobQueue(
+    os.getenv('RESEARCH_JOBS_PATH', Path(__file__).resolve().parent / 'research_jobs.sqlite'),
+    handler=lambda payload: run_research(research_key(payload))[0],
+    workers=int(os.getenv('RESEARCH_JOB_WORKERS', JOB_WORKERS)),
+    max_pending=int(os.getenv('RESEARCH_JOB_MAX_PENDING', JOB_MAX_PENDING)),
+)
+# Aggregates of the portfolio CSVs, rebuilt when the files change
+portfolio_data = PortfolioData(os.getenv('PORTFOLIO_DATA_DIR', DEFAULT_DATA_DIR))
+# One watcher feeds every /api/portfolio/stream connection
+portfolio_watcher = PortfolioWatcher(
+    portfolio_data, interval=float(os.getenv('PORTFOLIO_WATCH_INTERVAL', WATCH_INTERVAL_SECONDS))
+)
+# Comment lines keep idle streams open through proxies
+STREAM_HEARTBEAT_SECONDS = 15
+# Analyses of a batch screen run side by side on this pool
+batch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('RESEARCH_BATCH_WORKERS', 8)), thread_name_prefix='research-batch'
+)
+# GET /metrics serves span totals in the Prometheus text format when set to 1
+METRICS_ENDPOINT = os.getenv('METRICS_ENDPOINT') == '1'
+if METRICS_ENDPOINT and not enabled():
+    # Collect totals without logging every span (MICROCAP_TRACE adds the log)
+    configure()
+
+
+@app.before_request
+def start_workers():
+    research_jobs.start()
+
+
 @app.route('/api/research', methods=['POST'])
 def generate_research():
     try:
-        data = request.json
-        ticker = data.get('ticker', '').upper()
-        analysis_type = data.get('analysisType', 'comprehensive')
-        timeframe = data.get('timeframe', '6 months')
-        
-        if not ticker:
+        limited = rate_limited()
+        if limited:
+            return limited
+
+        key = research_key(request.json)
+        if not key[0]:
             return jsonify({'error': 'Ticker is required'}), 400
-            
-        # For demo purposes, simulate different recommendations based on ticker
-        # This allows us to test the BUY filter functionality
-        mock_responses = {
-            'AAPL': {
-                "recommendation": "BUY",
-                "confidence": 85,
-                "target_price": 190.0,
-                "stop_loss": 160.0,
-                "key_strengths": ["Strong brand loyalty", "Innovation pipeline", "Solid financials"],
-                "risk_factors": ["Market saturation", "Regulatory pressures", "Supply chain risks"],
-                "catalysts": ["New product launches", "Services growth"],
-                "analysis": "Apple shows strong fundamentals with excellent cash flow generation and a loyal customer base. The company's ecosystem creates significant switching costs and recurring revenue opportunities."
-            },
-            'TSLA': {
-                "recommendation": "HOLD",
-                "confidence": 65,
-                "target_price": 250.0,
-                "stop_loss": 180.0,
-                "key_strengths": ["EV market leader", "Vertical integration", "Energy business"],
-                "risk_factors": ["Valuation concerns", "Competition increasing", "Execution risks"],
-                "catalysts": ["FSD deployment", "Energy storage growth"],
-                "analysis": "Tesla remains the EV leader but faces increasing competition. Valuation appears stretched relative to near-term fundamentals, suggesting a more cautious stance."
-            },
-            'ABEO': {
-                "recommendation": "BUY",
-                "confidence": 75,
-                "target_price": 12.50,
-                "stop_loss": 8.00,
-                "key_strengths": ["Gene therapy pipeline", "Rare disease focus", "Recent approvals"],
-                "risk_factors": ["Clinical trial risks", "Regulatory hurdles", "Limited cash runway"],
-                "catalysts": ["Pipeline developments", "Partnership opportunities"],
-                "analysis": "Abeona Therapeutics presents compelling micro-cap opportunity in gene therapy space with recent product launches showing promise for revenue growth."
-            },
-            'DEFAULT': {
-                "recommendation": "SELL",
-                "confidence": 45,
-                "target_price": 50.0,
-                "stop_loss": 55.0,
-                "key_strengths": ["Market presence", "Brand recognition", "Operational efficiency"],
-                "risk_factors": ["Declining margins", "Market headwinds", "Competitive pressure"],
-                "catalysts": ["Cost reduction initiatives", "Market recovery"],
-                "analysis": "The company faces significant headwinds with declining fundamentals and increasing competitive pressure suggesting a cautious approach."
-            }
-        }
-        
-        # Get mock response (use DEFAULT if ticker not found)
-        analysis_data = mock_responses.get(ticker, mock_responses['DEFAULT'])
-        
-        # Add metadata
-        result = {
-            **analysis_data,
-            "id": f"{ticker}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-            "ticker": ticker,
-            "current_price": 100.0,  # Mock price
-            "timestamp": datetime.now().isoformat(),
-            "analysis_type": analysis_type,
-            "timeframe": timeframe,
-            "keyPoints": analysis_data["key_strengths"],  # Map to expected field name
-            "risks": analysis_data["risk_factors"],  # Map to expected field name
-            "catalysts": analysis_data["catalysts"],
-            "targetPrice": analysis_data["target_price"],  # Map to expected field name
-            "stopLoss": analysis_data["stop_loss"]  # Map to expected field name
-        }
-        
-        return jsonify(result)
+
+        # Identical requests share one computation and its cached result
+        result, computed = run_research(key)
+
+        response = jsonify(result)
+        response.headers['X-Cache'] = 'MISS' if computed else 'HIT'
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/research/jobs', methods=['POST'])
+def submit_research_job():
+    limited = rate_limited()
+    if limited:
+        return limited
+
+    data = request.json or {}
+    key = research_key(data)
+    if not key[0]:
+        return jsonify({'error': 'Ticker is required'}), 400
+    payload = {'ticker': key[0], 'analysisType': key[1], 'timeframe': key[2]}
+    # A cached result completes the job straight away
+    cached = research_cache.peek(key)
+    try:
+        job_id = research_jobs.submit(payload, cached)
+    except QueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    response = jsonify(research_jobs.get(job_id))
+    response.headers['Location'] = f'/api/research/jobs/{job_id}'
+    return response, 202
+
+
+@app.route('/api/research/jobs/<job_id>', methods=['GET'])
+def get_research_job(job_id):
+    # ?wait=N holds the request up to N seconds until the job finishes
+    wait = min(request.args.get('wait', 0, type=float), 30.0)
+    job = research_jobs.wait(job_id, wait)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/research/batch', methods=['POST'])
+def research_batch():
+    """Screen many tickers at once, streaming results as NDJSON.
+
+    Each line is a result that passed the filters (``recommendation``, one
+    value or a list, and ``minConfidence``) or ``{"ticker", "error"}``.
+    Lines arrive in completion order and a final ``{"summary": ...}`` line
+    closes the stream.
+
+    Every ticker the cache does not answer costs one rate-limit token, and
+    the whole batch is turned away when the client cannot cover them.
+    """
+    data = request.json or {}
+    tickers = data.get('tickers')
+    if not isinstance(tickers, list) or not tickers:
+        return jsonify({'error': 'tickers must be a non-empty list'}), 400
+    tickers = list(dict.fromkeys(str(t).strip().upper() for t in tickers if str(t).strip()))
+    if len(tickers) > BATCH_MAX_TICKERS:
+        return jsonify({'error': f'At most {BATCH_MAX_TICKERS} tickers per batch'}), 400
+    _, analysis_type, timeframe = research_key(data)
+    wanted = data.get('recommendation')
+    if isinstance(wanted, str):
+        wanted = [wanted]
+    recommendations = {str(r).upper() for r in wanted} if wanted else None
+    try:
+        min_confidence = data.get('minConfidence')
+        min_confidence = float(min_confidence) if min_confidence is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'minConfidence must be a number'}), 400
+
+    # One market data request covers every ticker not answered by the cache
+    keys = {t: (t, analysis_type, timeframe) for t in tickers}
+    uncached = [t for t in tickers if research_cache.peek(keys[t]) is None]
+    if len(uncached) > rate_limiter.burst:
+        # No amount of waiting refills the bucket beyond its burst
+        return jsonify({
+            'error': f'{len(uncached)} tickers need fresh research, at most '
+                     f'{rate_limiter.burst} per batch'
+        }), 400
+    limited = rate_limited(max(len(uncached), 1))
+    if limited:
+        return limited
+    prices = fetch_prices(uncached)
+    futures = {batch_pool.submit(run_research, keys[t], prices): t for t in tickers}
+
+    def stream():
+        matched = failed = 0
+        for future in as_completed(futures):
+            try:
+                result = future.result()[0]
+            except Exception as e:
+                failed += 1
+                yield json.dumps({'ticker': futures[future], 'error': str(e)}) + '\n'
+                continue
+            if matches(result, recommendations, min_confidence):
+                matched += 1
+                yield json.dumps(result) + '\n'
+        summary = {'requested': len(tickers), 'matched': matched, 'failed': failed}
+        yield json.dumps({'summary': summary}) + '\n'
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+
 @app.route('/api/research/history', methods=['GET'])
 def get_research_history():
-    # For now, return empty history
-    return jsonify([])
+    limit = request.args.get('limit', type=int)
+    return jsonify(research_history.items(limit))
+
+
+def cached_json(payload, aggregates):
+    """JSON response validated by the data files' ETag and Last-Modified."""
+    response = jsonify(payload)
+    # Lets the dashboard match what it loaded against the live stream
+    response.headers['X-Portfolio-Version'] = aggregates.version
+    tag = hashlib.sha1(f'{aggregates.version}|{request.full_path}'.encode()).hexdigest()
+    response.set_etag(tag[:16])
+    response.last_modified = aggregates.last_modified
+    # Browsers must revalidate, which costs a 304 when nothing changed
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/api/portfolio/equity', methods=['GET'])
+def get_portfolio_equity():
+    # ?since=YYYY-MM-DD returns only the days after the client's last one
+    aggregates = portfolio_data.load()
+    rows = since_filter(aggregates.equity, request.args.get('since'), 'date')
+    return cached_json(rows, aggregates)
+
+
+@app.route('/api/portfolio/holdings', methods=['GET'])
+def get_portfolio_holdings():
+    aggregates = portfolio_data.load()
+    return cached_json(aggregates.holdings, aggregates)
+
+
+@app.route('/api/portfolio/metrics', methods=['GET'])
+def get_portfolio_metrics():
+    aggregates = portfolio_data.load()
+    return cached_json(aggregates.metrics, aggregates)
+
+
+@app.route('/api/portfolio/trades', methods=['GET'])
+def get_portfolio_trades():
+    # Newest first, paginated; ?since=YYYY-MM-DD limits to newer trades
+    aggregates = portfolio_data.load()
+    rows = since_filter(aggregates.trades, request.args.get('since'), 'Date')
+    page = paginate(
+        rows,
+        request.args.get('page', 1, type=int),
+        request.args.get('per_page', TRADES_PER_PAGE, type=int),
+    )
+    return cached_json(page, aggregates)
+
+
+def sse(event, data):
+    """One Server-Sent Events message."""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+@app.route('/api/portfolio/stream', methods=['GET'])
+def stream_portfolio():
+    """Push portfolio changes to the dashboard as Server-Sent Events.
+
+    A ``ready`` event comes first with the ``version`` the deltas start
+    from; it matches the ``X-Portfolio-Version`` header of the REST
+    endpoints. After that, each change to the data files arrives as one
+    ``delta`` event with ``base`` and ``version`` and with ``equity``,
+    ``holdings``, ``removed``, ``trades`` and ``metrics`` as far as they
+    changed. A ``reset`` delta means the client should reload from the
+    REST endpoints.
+    """
+    updates = portfolio_watcher.subscribe()
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event, payload = updates.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield sse(event, payload)
+        finally:
+            portfolio_watcher.unsubscribe(updates)
+
+    return Response(
+        stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Span totals (time, calls, errors, rows, bytes) for Prometheus."""
+    if not METRICS_ENDPOINT:
+        return jsonify({'error': 'Metrics are disabled, set METRICS_ENDPOINT=1'}), 404
+    lines = [
+        '# HELP research_cache_requests_total Research lookups by cache outcome.',
+        '# TYPE research_cache_requests_total counter',
+        f'research_cache_requests_total{{outcome="hit"}} {research_cache.hits}',
+        f'research_cache_requests_total{{outcome="miss"}} {research_cache.misses}',
+        f'research_cache_requests_total{{outcome="coalesced"}} {research_cache.coalesced}',
+        '# HELP portfolio_stream_subscribers Open /api/portfolio/stream connections.',
+        '# TYPE portfolio_stream_subscribers gauge',
+        f'portfolio_stream_subscribers {portfolio_watcher.subscribers}',
+    ]
+    body = prometheus_text() + '\n'.join(lines) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8000)
\ No newline at end of file
+    app.run(debug=True, port=8000)
@@ -0,0 +1,287 @@
+"""Persistent background job queue for slow research requests.
+
+Jobs are rows in a local SQLite database, so queued work survives a
+restart without an external broker. A fixed pool of worker threads
+claims queued jobs one at a time and stores each result or error back in
+the database. The workers start with ``start``, which the API calls on
+its first request, so the reloader's parent process never runs any.
+A running job whose lease has expired, because the process running it
+stopped, is claimed again like a queued one. Only the worker holding the
+latest claim can store the outcome, so a run that outlived its lease
+cannot overwrite the one that replaced it.
+
+The number of queued jobs is capped. ``submit`` raises ``QueueFull``
+beyond ``max_pending``, so a burst of requests is turned away instead of
+piling up.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+JOB_WORKERS = 4
+JOB_MAX_PENDING = 100
+# Finished jobs older than this are deleted when new ones are submitted
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+# A job still running after this long is assumed lost and run again
+JOB_LEASE_SECONDS = 10 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+FINISHED = ('done', 'failed')
+
+
+class QueueFull(Exception):
+    """Raised by ``JobQueue.submit`` when too many jobs are waiting."""
+
+
+class JobQueue:
+    """SQLite-backed job queue with a bounded pool of worker threads.
+
+    Parameters
+    ----------
+    path:
+        Location of the SQLite database. Parent directories are created.
+    handler:
+        Called with a job's payload in a worker thread; returns the result.
+        Exceptions mark the job as failed with their message.
+    workers:
+        Number of worker threads, i.e. jobs running at once.
+    max_pending:
+        Queued jobs allowed before ``submit`` raises ``QueueFull``.
+    lease:
+        Seconds after which a running job is assumed lost and run again.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        handler: Callable[[dict], dict],
+        workers: int = JOB_WORKERS,
+        max_pending: int = JOB_MAX_PENDING,
+        lease: float = JOB_LEASE_SECONDS,
+    ) -> None:
+        self.path = Path(path)
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lease = lease
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        self._wakeup = threading.Condition()
+        # Job id -> (event set when it finishes, number of waiters on it)
+        self._finished: dict[str, tuple[threading.Event, int]] = {}
+        self._finished_lock = threading.Lock()
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the worker threads; later calls do nothing."""
+
+        with self._start_lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f'research-job-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection that commits on success and always closes."""
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def submit(self, payload: dict, result: dict | None = None) -> str:
+        """Queue ``payload`` and return the new job id.
+
+        When ``result`` is given the job is stored as already done, for
+        requests answered from a cache.
+        """
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?',
+                (*FINISHED, now - JOB_RETENTION_SECONDS),
+            )
+            if result is None:
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFull(f'{pending} research jobs are already waiting')
+            conn.execute(
+                'INSERT INTO jobs (id, payload, status, result, created, started, finished) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    job_id,
+                    json.dumps(payload),
+                    'queued' if result is None else 'done',
+                    None if result is None else json.dumps(result),
+                    now,
+                    None if result is None else now,
+                    None if result is None else now,
+                ),
+            )
+        if result is None:
+            with self._wakeup:
+                self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        """Status of a job as returned by the API, or ``None`` if unknown."""
+
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'status': row['status'],
+            'request': json.loads(row['payload']),
+            'created': row['created'],
+            'started': row['started'],
+            'finished': row['finished'],
+        }
+        if row['status'] == 'queued':
+            with self._connect() as conn:
+                job['position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?",
+                    (row['created'],),
+                ).fetchone()[0]
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def wait(self, job_id: str, timeout: float) -> dict | None:
+        """Like ``get``, but first wait up to ``timeout`` seconds for the job to finish."""
+
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED or timeout <= 0:
+            return job
+        with self._finished_lock:
+            event, waiters = self._finished.get(job_id, (threading.Event(), 0))
+            self._finished[job_id] = (event, waiters + 1)
+        try:
+            # Re-check after registering, in case the job finished in between
+            job = self.get(job_id)
+            if job is not None and job['status'] not in FINISHED:
+                event.wait(timeout)
+                job = self.get(job_id)
+        finally:
+            # The last waiter removes the entry, however the wait ended
+            with self._finished_lock:
+                event, waiters = self._finished[job_id]
+                if waiters > 1:
+                    self._finished[job_id] = (event, waiters - 1)
+                else:
+                    del self._finished[job_id]
+        return job
+
+    def _claim(self) -> tuple[str, dict, float] | None:
+        """Next job to run as ``(id, payload, started)``, or ``None``."""
+
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND started < ?) ORDER BY created LIMIT 1",
+                (now - self.lease,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                (now, row['id']),
+            )
+        return row['id'], json.loads(row['payload']), now
+
+    def _finish(self, job_id: str, started: float, result: dict | None, error: str | None) -> None:
+        """Store the outcome of the claim made at ``started``.
+
+        Nothing is written if the job has been claimed again since, i.e.
+        this run's lease expired.
+        """
+
+        with self._connect() as conn:
+            updated = conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? '
+                "WHERE id = ? AND status = 'running' AND started = ?",
+                (
+                    'failed' if error is not None else 'done',
+                    None if result is None else json.dumps(result),
+                    error,
+                    time.time(),
+                    job_id,
+                    started,
+                ),
+            ).rowcount
+        if not updated:
+            print(f'Dropped the result of research job {job_id}, its lease had expired')
+            return
+        with self._finished_lock:
+            waiting = self._finished.get(job_id)
+        if waiting is not None:
+            waiting[0].set()
+
+    def _work(self) -> None:
+        while not self._stopping:
+            claimed = self._claim()
+            if claimed is None:
+                # Also poll, in case another process queued the job
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+                continue
+            job_id, payload, started = claimed
+            try:
+                result = self.handler(payload)
+            except Exception as exc:
+                self._finish(job_id, started, None, str(exc))
+            else:
+                self._finish(job_id, started, result, None)
+
+    def close(self) -> None:
+        """Stop the workers after their current jobs."""
+
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,350 @@
+"""Aggregated portfolio data for the dashboard API.
+
+The dashboard used to download both CSV files and aggregate them in the
+browser. ``PortfolioData`` reads them once through the shared storage
+backend and keeps the aggregates (equity curve, latest holdings, metrics
+and the trade history) in memory. They are rebuilt only when a file's
+modification time or size changes, and that same signature is used for
+the ETag and Last-Modified validators of every response.
+
+``PortfolioWatcher`` polls that signature in a single background thread
+and publishes what changed between two versions (new or rewritten equity
+rows, changed holdings, new trades) to every subscribed stream. Each
+delta names the version it applies to, so a client can tell whether its
+REST data is the one the stream continues from.
+"""
+
+import hashlib
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+# Allow importing the shared modules from the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from instrumentation import span  # noqa: E402
+from metrics import RISK_FREE_ANNUAL, summarize  # noqa: E402
+from storage import open_backend  # noqa: E402
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parents[1] / 'Scripts and CSV Files'
+TRADES_PER_PAGE = 50
+MAX_TRADES_PER_PAGE = 500
+WATCH_INTERVAL_SECONDS = 2.0
+# Updates buffered per subscriber before it is told to reload instead
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _clean(value):
+    """JSON-safe scalar: NaN becomes ``None`` and numpy types become Python ones."""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+@dataclass
+class Aggregates:
+    """Everything the dashboard endpoints serve, for one version of the files."""
+
+    version: str
+    last_modified: float
+    equity: list[dict]
+    holdings: list[dict]
+    metrics: dict
+    trades: list[dict]
+
+
+class PortfolioData:
+    """Cached aggregates of one portfolio data directory.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the portfolio history and trade log, in either
+        storage layout.
+    """
+
+    def __init__(self, data_dir: Path | str = DEFAULT_DATA_DIR) -> None:
+        self.data_dir = Path(data_dir)
+        self._cached: Aggregates | None = None
+        self._lock = threading.Lock()
+
+    def _files(self) -> list[Path]:
+        storage = open_backend(self.data_dir)
+        paths = [
+            getattr(storage, name)
+            for name in ('portfolio_path', 'trade_log_path', 'portfolio_dir', 'trade_log_dir')
+            if hasattr(storage, name)
+        ]
+        files = []
+        for path in paths:
+            files += sorted(path.glob('*.parquet')) if path.is_dir() else [path]
+        return files
+
+    def signature(self) -> tuple[str, float]:
+        """Version hash and newest modification time of the data files."""
+        parts = []
+        newest = 0.0
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                parts.append(f'{path.name}:-')
+                continue
+            parts.append(f'{path.name}:{stat.st_mtime_ns}:{stat.st_size}')
+            newest = max(newest, stat.st_mtime)
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16], newest
+
+    def load(self) -> Aggregates:
+        """Current aggregates, rebuilt only when the files have changed."""
+        version, last_modified = self.signature()
+        with self._lock:
+            if self._cached is None or self._cached.version != version:
+                with span('portfolio.aggregate'):
+                    self._cached = self._build(version, last_modified)
+            return self._cached
+
+    def _build(self, version: str, last_modified: float) -> Aggregates:
+        storage = open_backend(self.data_dir)
+        if not storage.exists():
+            return Aggregates(version, last_modified, [], [], {}, [])
+        history = storage.read_portfolio()
+        totals = history[history['Ticker'] == 'TOTAL'].drop_duplicates('Date', keep='last')
+        equity_values = totals['Total Equity'].astype(float)
+        daily = equity_values.pct_change() * 100
+        equity = [
+            {
+                'date': _clean(date),
+                'equity': _clean(value),
+                'cash': _clean(cash),
+                'invested': _clean(invested),
+                'pnl': _clean(pnl),
+                'dailyReturn': _clean(change) if i else 0.0,
+            }
+            for i, (date, value, cash, invested, pnl, change) in enumerate(
+                zip(
+                    totals['Date'], equity_values, totals['Cash Balance'],
+                    totals['Total Value'], totals['PnL'], daily,
+                )
+            )
+        ]
+
+        latest_date = history['Date'].max()
+        latest = history[(history['Date'] == latest_date) & (history['Ticker'] != 'TOTAL')]
+        latest = latest.rename(columns=lambda name: name.replace(' ', '_'))
+        holdings = []
+        for row in latest.itertuples(index=False):
+            shares = float(row.Shares)
+            # "Cost Basis" in the history is the buy price per share
+            cost = float(row.Cost_Basis) * shares
+            pnl = _clean(row.PnL)
+            holdings.append(
+                {
+                    'ticker': str(row.Ticker),
+                    'shares': shares,
+                    'costBasis': _clean(row.Cost_Basis),
+                    'currentPrice': _clean(row.Current_Price),
+                    'totalValue': _clean(row.Total_Value),
+                    'pnl': pnl,
+                    'pnlPercent': pnl / cost * 100 if pnl is not None and cost > 0 else None,
+                    'stopLoss': _clean(row.Stop_Loss),
+                    'action': _clean(row.Action),
+                }
+            )
+
+        metrics = {}
+        if len(totals):
+            curve = pd.DataFrame({'equity': equity_values.to_numpy()}, index=totals['Date'])
+            scored = summarize(curve, rf_annual=RISK_FREE_ANNUAL).iloc[0]
+            last, first = equity[-1], equity[0]
+            previous = equity[-2]['equity'] if len(equity) > 1 else first['equity']
+            metrics = {
+                'date': last['date'],
+                'totalEquity': last['equity'],
+                'cash': last['cash'],
+                'investedValue': last['invested'],
+                'startingEquity': first['equity'],
+                'dayChange': last['equity'] - previous,
+                'dayChangePercent': (last['equity'] / previous - 1) * 100 if previous else None,
+                **{name: _clean(value) for name, value in scored.items()},
+            }
+
+        log = storage.read_trade_log()
+        trades = [
+            {name: _clean(value) for name, value in row.items()}
+            for row in log.iloc[::-1].to_dict(orient='records')
+        ]
+        return Aggregates(version, last_modified, equity, holdings, metrics, trades)
+
+
+def since_filter(rows: list[dict], since: str | None, field: str) -> list[dict]:
+    """Rows whose ``field`` date is after ``since`` (all rows when ``None``)."""
+    if not since:
+        return rows
+    return [row for row in rows if row.get(field) is not None and row[field] > since]
+
+
+def paginate(rows: list[dict], page: int, per_page: int) -> dict:
+    """One page of ``rows``, with the page count and total for the client."""
+    per_page = max(1, min(per_page, MAX_TRADES_PER_PAGE))
+    page = max(1, page)
+    start = (page - 1) * per_page
+    return {
+        'items': rows[start:start + per_page],
+        'page': page,
+        'perPage': per_page,
+        'total': len(rows),
+        'pages': math.ceil(len(rows) / per_page),
+    }
+
+
+def diff(old: Aggregates, new: Aggregates) -> dict | None:
+    """What changed from ``old`` to ``new``, or ``None`` if nothing did.
+
+    The delta holds ``equity`` (new or rewritten days), ``holdings``
+    (changed positions), ``removed`` (tickers no longer held), ``trades``
+    (newest first) and ``metrics`` when they changed, plus ``base`` and
+    ``version``: the versions it goes from and to. If the trade log was
+    rewritten rather than appended to, the delta is ``{"reset": True}`` and
+    clients should reload everything.
+    """
+
+    versions = {'base': old.version, 'version': new.version}
+    added = len(new.trades) - len(old.trades)
+    if added < 0 or new.trades[added:] != old.trades:
+        return {**versions, 'reset': True}
+
+    before = {row['date']: row for row in old.equity}
+    held = {row['ticker']: row for row in old.holdings}
+    delta = {
+        'equity': [row for row in new.equity if before.get(row['date']) != row],
+        'holdings': [row for row in new.holdings if held.get(row['ticker']) != row],
+        'removed': sorted(set(held) - {row['ticker'] for row in new.holdings}),
+        'trades': new.trades[:added],
+    }
+    if new.metrics != old.metrics:
+        delta['metrics'] = new.metrics
+    delta = {name: value for name, value in delta.items() if value}
+    if not delta:
+        return None
+    return {**versions, **delta}
+
+
+class PortfolioWatcher:
+    """One shared poller of a data directory for all live subscribers.
+
+    The thread starts with the first subscriber and stops after the last
+    one leaves. Every change is read and diffed once, then the delta is
+    put on each subscriber's queue. A subscriber that falls behind gets a
+    single ``{"reset": True}`` in place of its backlog.
+
+    Queues carry ``(event, payload)`` pairs. The first is always
+    ``("ready", {"version": ...})`` with the version the following
+    ``"delta"`` events start from.
+
+    Parameters
+    ----------
+    data:
+        Aggregates to watch. Its cache is shared with the REST endpoints.
+    interval:
+        Seconds between checks of the files' modification times.
+    """
+
+    def __init__(self, data: PortfolioData, interval: float = WATCH_INTERVAL_SECONDS) -> None:
+        self.data = data
+        self.interval = interval
+        self._subscribers: set[queue.Queue] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        # Version the next delta starts from, None until the first load
+        self._version: str | None = None
+
+    def subscribe(self) -> queue.Queue:
+        """Register a subscriber and return the queue its updates arrive on."""
+
+        updates: queue.Queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(updates)
+            if self._version is not None:
+                updates.put_nowait(('ready', {'version': self._version}))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='portfolio-watcher', daemon=True)
+                self._thread.start()
+        return updates
+
+    def unsubscribe(self, updates: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(updates)
+
+    @property
+    def subscribers(self) -> int:
+        """Number of live subscribers."""
+        with self._lock:
+            return len(self._subscribers)
+
+    def _publish(self, event: str, payload: dict) -> None:
+        # Moving to the new version and choosing who gets told about it
+        # happen together, so a new subscriber's ready event and the deltas
+        # it receives always line up
+        with self._lock:
+            self._version = payload['version']
+            subscribers = list(self._subscribers)
+        for updates in subscribers:
+            try:
+                updates.put_nowait((event, payload))
+            except queue.Full:
+                # Too far behind for deltas to be useful: replace them with a reset
+                while True:
+                    try:
+                        updates.get_nowait()
+                    except queue.Empty:
+                        break
+                updates.put_nowait(('delta', {'version': payload['version'], 'reset': True}))
+
+    def _run(self) -> None:
+        current = None
+        try:
+            while True:
+                if current is not None:
+                    time.sleep(self.interval)
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        self._version = None
+                        return
+                if current is not None and self.data.signature()[0] == current.version:
+                    continue
+                try:
+                    latest = self.data.load()
+                except Exception as exc:
+                    # Most likely a file caught mid-write; try again next time
+                    print(f'Portfolio watcher could not reload data: {exc}')
+                    if current is None:
+                        time.sleep(self.interval)
+                    continue
+                if current is None:
+                    self._publish('ready', {'version': latest.version})
+                else:
+                    # Files rewritten without a visible change still get a
+                    # (empty) delta, or clients would lose track of the version
+                    delta = diff(current, latest) or {'base': current.version, 'version': latest.version}
+                    self._publish('delta', delta)
+                current = latest
+        finally:
+            # Let the next subscriber start a new watcher if this one died
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    self._version = None
@@ -0,0 +1,351 @@
+"""Research computation, caching and rate limiting for the Flask API.
+
+Analyses are keyed by (ticker, analysis type, timeframe). ``ResearchCache``
+keeps recent results for ``ttl`` seconds, evicts the least recently used
+entry beyond ``max_entries``, and coalesces concurrent requests for the
+same key so only one of them runs the analysis while the others wait for
+its result. Every freshly computed result is appended to a
+``ResearchHistory`` file, which serves ``/api/research/history`` and warms
+the cache after a restart. ``RateLimiter`` gives each client a token
+bucket.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable
+
+# Allow importing the shared modules from the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from market_client import AsyncMarketDataClient  # noqa: E402
+
+# Defaults, overridable through environment variables in app.py
+CACHE_TTL_SECONDS = 15 * 60
+CACHE_MAX_ENTRIES = 256
+RATE_PER_MINUTE = 30
+RATE_BURST = 10
+HISTORY_LIMIT = 500
+BATCH_MAX_TICKERS = 500
+# A request waits for prices at most this long per attempt
+PRICE_TIMEOUT_SECONDS = 10.0
+PRICE_RETRIES = 1
+
+# For demo purposes, simulate different recommendations based on ticker
+# This allows us to test the BUY filter functionality
+MOCK_RESPONSES = {
+    'AAPL': {
+        "recommendation": "BUY",
+        "confidence": 85,
+        "target_price": 190.0,
+        "stop_loss": 160.0,
+        "key_strengths": ["Strong brand loyalty", "Innovation pipeline", "Solid financials"],
+        "risk_factors": ["Market saturation", "Regulatory pressures", "Supply chain risks"],
+        "catalysts": ["New product launches", "Services growth"],
+        "analysis": "Apple shows strong fundamentals with excellent cash flow generation and a loyal customer base. The company's ecosystem creates significant switching costs and recurring revenue opportunities."
+    },
+    'TSLA': {
+        "recommendation": "HOLD",
+        "confidence": 65,
+        "target_price": 250.0,
+        "stop_loss": 180.0,
+        "key_strengths": ["EV market leader", "Vertical integration", "Energy business"],
+        "risk_factors": ["Valuation concerns", "Competition increasing", "Execution risks"],
+        "catalysts": ["FSD deployment", "Energy storage growth"],
+        "analysis": "Tesla remains the EV leader but faces increasing competition. Valuation appears stretched relative to near-term fundamentals, suggesting a more cautious stance."
+    },
+    'ABEO': {
+        "recommendation": "BUY",
+        "confidence": 75,
+        "target_price": 12.50,
+        "stop_loss": 8.00,
+        "key_strengths": ["Gene therapy pipeline", "Rare disease focus", "Recent approvals"],
+        "risk_factors": ["Clinical trial risks", "Regulatory hurdles", "Limited cash runway"],
+        "catalysts": ["Pipeline developments", "Partnership opportunities"],
+        "analysis": "Abeona Therapeutics presents compelling micro-cap opportunity in gene therapy space with recent product launches showing promise for revenue growth."
+    },
+    'DEFAULT': {
+        "recommendation": "SELL",
+        "confidence": 45,
+        "target_price": 50.0,
+        "stop_loss": 55.0,
+        "key_strengths": ["Market presence", "Brand recognition", "Operational efficiency"],
+        "risk_factors": ["Declining margins", "Market headwinds", "Competitive pressure"],
+        "catalysts": ["Cost reduction initiatives", "Market recovery"],
+        "analysis": "The company faces significant headwinds with declining fundamentals and increasing competitive pressure suggesting a cautious approach."
+    }
+}
+
+ResearchKey = tuple[str, str, str]
+
+
+def fetch_prices(
+    tickers: Iterable[str], client: AsyncMarketDataClient | None = None
+) -> dict[str, float]:
+    """Latest close of every ticker, through the shared market data client.
+
+    Tickers without data or whose download failed are left out, so the
+    analysis can still run on its defaults.
+    """
+
+    symbols = list(dict.fromkeys(tickers))
+    if not symbols:
+        return {}
+    client = client or AsyncMarketDataClient(timeout=PRICE_TIMEOUT_SECONDS, retries=PRICE_RETRIES)
+    result = client.fetch_sync(symbols, period='5d')
+    prices = {}
+    for ticker, frame in result.frames.items():
+        close = frame['Close'].dropna()
+        if not close.empty:
+            prices[ticker] = round(float(close.iloc[-1]), 2)
+    return prices
+
+
+def analyze(
+    ticker: str, analysis_type: str, timeframe: str, current_price: float | None = None
+) -> dict:
+    """Run the analysis for one key and return the API result."""
+
+    # Get mock response (use DEFAULT if ticker not found)
+    analysis_data = MOCK_RESPONSES.get(ticker, MOCK_RESPONSES['DEFAULT'])
+    now = datetime.now()
+    return {
+        **analysis_data,
+        "id": f"{ticker}_{now.strftime('%Y%m%d_%H%M%S')}",
+        "ticker": ticker,
+        "current_price": current_price if current_price is not None else 100.0,  # Mock price
+        "timestamp": now.isoformat(),
+        "analysis_type": analysis_type,
+        "timeframe": timeframe,
+        "keyPoints": analysis_data["key_strengths"],  # Map to expected field name
+        "risks": analysis_data["risk_factors"],  # Map to expected field name
+        "catalysts": analysis_data["catalysts"],
+        "targetPrice": analysis_data["target_price"],  # Map to expected field name
+        "stopLoss": analysis_data["stop_loss"]  # Map to expected field name
+    }
+
+
+def matches(result: dict, recommendations: set[str] | None, min_confidence: float | None) -> bool:
+    """Whether ``result`` passes the batch screen's filters."""
+
+    if recommendations and str(result.get('recommendation', '')).upper() not in recommendations:
+        return False
+    if min_confidence is not None and float(result.get('confidence', 0)) < min_confidence:
+        return False
+    return True
+
+
+class ResearchCache:
+    """TTL + LRU cache of research results with request coalescing.
+
+    Parameters
+    ----------
+    ttl:
+        Seconds a result stays fresh.
+    max_entries:
+        Results kept before the least recently used one is evicted.
+    clock:
+        Monotonic time source, replaceable in tests.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict[ResearchKey, tuple[float, dict]] = OrderedDict()
+        self._pending: dict[ResearchKey, Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _fresh(self, key: ResearchKey) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.clock() - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def peek(self, key: ResearchKey) -> dict | None:
+        """The fresh cached result for ``key``, without computing it."""
+
+        with self._lock:
+            return self._fresh(key)
+
+    def put(self, key: ResearchKey, value: dict, age: float = 0.0) -> None:
+        """Store ``value`` as computed ``age`` seconds ago."""
+
+        with self._lock:
+            self._entries[key] = (self.clock() - age, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: ResearchKey, compute: Callable[[], dict]) -> tuple[dict, bool]:
+        """Return the cached result for ``key`` or compute it once.
+
+        Concurrent callers with the same key wait for the first caller's
+        computation instead of starting their own. Returns the result and
+        whether this call computed it.
+        """
+
+        with self._lock:
+            value = self._fresh(key)
+            if value is not None:
+                self.hits += 1
+                return value, False
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result(), False
+
+        try:
+            value = compute()
+        except BaseException as exc:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(exc)
+            raise
+        # Cache before clearing the pending entry so no caller sees neither
+        self.put(key, value)
+        with self._lock:
+            del self._pending[key]
+        future.set_result(value)
+        return value, True
+
+
+class RateLimiter:
+    """Per-client token buckets.
+
+    Each client may make ``burst`` requests at once and then
+    ``rate_per_minute`` requests per minute on average.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = RATE_PER_MINUTE,
+        burst: int = RATE_BURST,
+        clock: Callable[[], float] = time.monotonic,
+        max_clients: int = 10_000,
+    ) -> None:
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.clock = clock
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str, cost: float = 1) -> float:
+        """Take ``cost`` tokens for ``client``.
+
+        Returns ``0.0`` when the request may proceed, otherwise the number
+        of seconds until enough tokens are available. Nothing is taken
+        then. A cost above ``burst`` can never be covered and waits
+        forever (``inf``).
+        """
+
+        now = self.clock()
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            elif cost > self.burst or self.rate <= 0:
+                wait = float('inf')
+            else:
+                wait = (cost - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            # Forget the clients seen least recently once there are too many
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class ResearchHistory:
+    """Computed research results, persisted as JSON lines.
+
+    Only the newest ``limit`` results are kept in memory. The file is
+    compacted to that size when it grows to twice as many lines.
+    """
+
+    def __init__(self, path: Path | str, limit: int = HISTORY_LIMIT) -> None:
+        self.path = Path(path)
+        self.limit = limit
+        self._items: list[dict] = []
+        self._lines = 0
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path) as handle:
+                for line in handle:
+                    try:
+                        self._items.append(json.loads(line))
+                    except ValueError:
+                        continue
+                    self._lines += 1
+            self._items = self._items[-limit:]
+
+    def add(self, result: dict) -> None:
+        with self._lock:
+            self._items.append(result)
+            del self._items[:-self.limit]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self._lines + 1 >= 2 * self.limit:
+                self._rewrite()
+            else:
+                with open(self.path, 'a') as handle:
+                    handle.write(json.dumps(result) + '\n')
+                self._lines += 1
+
+    def _rewrite(self) -> None:
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as handle:
+            for item in self._items:
+                handle.write(json.dumps(item) + '\n')
+        os.replace(tmp, self.path)
+        self._lines = len(self._items)
+
+    def items(self, limit: int | None = None) -> list[dict]:
+        """Newest results first."""
+
+        with self._lock:
+            items = self._items[::-1]
+        return items[:limit] if limit is not None else items
+
+    def warm(self, cache: ResearchCache) -> int:
+        """Load results younger than the cache TTL into ``cache``."""
+
+        loaded = 0
+        now = datetime.now()
+        for item in self._items:
+            try:
+                age = (now - datetime.fromisoformat(item['timestamp'])).total_seconds()
+                key = (item['ticker'], item['analysis_type'], item['timeframe'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= age < cache.ttl:
+                cache.put(key, item, age)
+                loaded += 1
+        return loaded
@@ -0,0 +1,441 @@
+"""Replay a portfolio and dated orders over historical daily bars.
+
+``process_portfolio`` checks stop losses against one day's close. A
+backtest applies the same rules to every trading day between two dates:
+- Orders dated that day are applied first, through ``execute_buy`` and
+  ``execute_sell``, so cost basis and cash follow the live rules.
+- Any position whose price is at or below its stop loss is then sold.
+
+The output uses the same ``chatgpt_portfolio_update.csv`` and
+``chatgpt_trade_log.csv`` schemas as a live run, so it can be loaded by
+``metrics.py``, the graph scripts and the dashboard.
+
+Between two order dates the book only changes through stop-loss exits.
+Each such stretch is evaluated as one NumPy date x ticker block: the
+first trigger day per ticker, the daily values and the running cash are
+computed without a Python loop over days.
+
+With ``intraday`` enabled a stop triggers when the day's low reaches it
+and fills at the stop price, or at the open when the day gaps below the
+stop. Otherwise the close decides and the sale fills at the close, as in
+a live run.
+"""
+
+import argparse
+import json
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import cast
+
+import numpy as np
+import pandas as pd
+
+from ledger import RELIEF_METHODS, PositionLedger
+from market_data import MarketDataSession
+from orders import Order, OrderSource, load_orders
+from price_cache import PRICE_CACHE_NAME, PriceCache
+from storage import PORTFOLIO_COLUMNS, TradeRows
+from trading_script import (
+    SPX_TICKER,
+    PortfolioContext,
+    _context,
+    as_portfolio_frame,
+    execute_buy,
+    execute_sell,
+)
+
+STOP_LOSS_REASON = "AUTOMATED SELL - STOPLOSS TRIGGERED"
+
+
+@dataclass
+class BacktestResult:
+    """Output of a replay.
+
+    Parameters
+    ----------
+    snapshots:
+        Daily portfolio rows in the ``chatgpt_portfolio_update.csv`` layout.
+    portfolio:
+        Positions left after the final day.
+    cash:
+        Cash left after the final day.
+    """
+
+    snapshots: pd.DataFrame
+    portfolio: pd.DataFrame
+    cash: float
+
+    @property
+    def equity(self) -> pd.Series:
+        """Total equity per day, taken from the TOTAL rows."""
+
+        totals = self.snapshots[self.snapshots["Ticker"] == "TOTAL"]
+        return pd.Series(
+            totals["Total Equity"].astype(float).to_numpy(),
+            index=pd.to_datetime(totals["Date"]),
+            name="Total Equity",
+        )
+
+
+@dataclass
+class _Bars:
+    """Aligned price matrices, one row per trading day and one column per ticker."""
+
+    dates: pd.DatetimeIndex
+    tickers: list[str]
+    close: np.ndarray
+    low: np.ndarray
+    open: np.ndarray
+
+    def columns(self, tickers: list[str]) -> np.ndarray:
+        lookup = {ticker: i for i, ticker in enumerate(self.tickers)}
+        return np.array([lookup[t] for t in tickers], dtype=int)
+
+
+def _load_bars(
+    session: MarketDataSession,
+    tickers: list[str],
+    start: pd.Timestamp,
+    end: pd.Timestamp | None,
+) -> _Bars:
+    """Align every ticker's bars on the union of trading days in the window.
+
+    Closes are carried forward over days a ticker did not trade, matching
+    the live script which values a position at its latest bar. Lows and
+    opens are left missing on those days so they never trigger a stop.
+    """
+
+    session.prefetch(tickers + [SPX_TICKER])
+    histories = {t: session.history(t) for t in tickers + [SPX_TICKER]}
+    calendar = pd.DatetimeIndex([])
+    for bars in histories.values():
+        calendar = calendar.union(pd.DatetimeIndex(bars.index))
+    in_window = calendar >= start
+    if end is not None:
+        in_window &= calendar <= end
+    dates = calendar[in_window]
+    if dates.empty:
+        raise ValueError("No trading days with price data in the backtest window.")
+
+    shape = (len(dates), len(tickers))
+    close, low, open_ = (np.full(shape, np.nan) for _ in range(3))
+    for j, ticker in enumerate(tickers):
+        bars = histories[ticker]
+        if bars.empty:
+            continue
+        full = bars.reindex(calendar)
+        close[:, j] = full["Close"].ffill().to_numpy()[in_window]
+        low[:, j] = full["Low"].to_numpy()[in_window]
+        open_[:, j] = full["Open"].to_numpy()[in_window]
+    return _Bars(dates=dates, tickers=tickers, close=close, low=low, open=open_)
+
+
+def _segment(
+    bars: _Bars,
+    first: int,
+    stop: int,
+    book: pd.DataFrame,
+    cash: float,
+    intraday: bool,
+) -> tuple[pd.DataFrame, list[dict[str, object]], pd.DataFrame, float]:
+    """Evaluate days ``[first, stop)`` for a book that only loses stopped positions.
+
+    Returns the snapshot rows, the stop-loss trade rows, the remaining book
+    and the cash after the last day.
+    """
+
+    book = book.reset_index(drop=True)
+    days = stop - first
+    cols = bars.columns(list(book["ticker"]))
+    shares = book["shares"].astype(int).to_numpy()
+    cost = book["buy_price"].to_numpy(dtype=float)
+    stop_loss = book["stop_loss"].to_numpy(dtype=float)
+
+    price = np.round(bars.close[first:stop][:, cols], 2)
+    has_data = ~np.isnan(price)
+    with np.errstate(invalid="ignore"):
+        if intraday:
+            low = bars.low[first:stop][:, cols]
+            trigger = low <= stop_loss
+            opening = bars.open[first:stop][:, cols]
+            gapped = opening <= stop_loss
+            fill = np.round(np.where(gapped, opening, stop_loss), 2)
+        else:
+            trigger = price <= stop_loss
+            fill = price
+    trigger &= has_data
+
+    # First trigger day per ticker; positions that never trigger run to the end
+    hit = trigger.any(axis=0)
+    exit_day = np.where(hit, trigger.argmax(axis=0), days)
+    step = np.arange(days)[:, None]
+    alive = step <= exit_day
+    exiting = step == exit_day
+    price = np.where(exiting, fill, price)
+
+    value = np.round(price * shares, 2)
+    pnl = np.round((price - cost) * shares, 2)
+    held = alive & ~exiting & has_data
+    total_value = np.where(held, value, 0.0).sum(axis=1)
+    total_pnl = np.where(held, pnl, 0.0).sum(axis=1)
+    proceeds = np.where(exiting & has_data, value, 0.0).sum(axis=1)
+    cash_path = cash + np.cumsum(proceeds)
+
+    day_idx, pos = np.nonzero(alive)
+    action = np.where(exiting[day_idx, pos], "SELL - Stop Loss Triggered", "HOLD")
+    action = np.where(has_data[day_idx, pos], action, "NO DATA")
+    present = has_data[day_idx, pos]
+    dates = bars.dates[first:stop].strftime("%Y-%m-%d").to_numpy()
+
+    def shown(values: np.ndarray) -> np.ndarray:
+        return np.where(present, values[day_idx, pos].astype(object), "")
+
+    rows = pd.DataFrame(
+        {
+            "Date": dates[day_idx],
+            "Ticker": book["ticker"].to_numpy()[pos],
+            "Shares": shares[pos],
+            "Cost Basis": cost[pos],
+            "Stop Loss": stop_loss[pos],
+            "Current Price": shown(price),
+            "Total Value": shown(value),
+            "PnL": shown(pnl),
+            "Action": action,
+            "Cash Balance": "",
+            "Total Equity": "",
+            "_day": day_idx,
+            "_total": 0,
+        }
+    )
+    totals = pd.DataFrame(
+        {
+            "Date": dates,
+            "Ticker": "TOTAL",
+            "Shares": "",
+            "Cost Basis": "",
+            "Stop Loss": "",
+            "Current Price": "",
+            "Total Value": np.round(total_value, 2),
+            "PnL": np.round(total_pnl, 2),
+            "Action": "",
+            "Cash Balance": np.round(cash_path, 2),
+            "Total Equity": np.round(total_value + cash_path, 2),
+            "_day": np.arange(days),
+            "_total": 1,
+        }
+    )
+    snapshot = pd.concat([rows, totals], ignore_index=True)
+    snapshot = snapshot.sort_values(["_day", "_total"], kind="stable")
+    snapshot = snapshot.drop(columns=["_day", "_total"]).reset_index(drop=True)
+
+    sold_day, sold = np.nonzero(exiting & has_data)
+    order = np.argsort(sold_day, kind="stable")
+    trades = [
+        {
+            "Date": dates[sold_day[i]],
+            "Ticker": book.at[sold[i], "ticker"],
+            "Shares Sold": shares[sold[i]],
+            "Sell Price": price[sold_day[i], sold[i]],
+            "Cost Basis": cost[sold[i]],
+            "PnL": pnl[sold_day[i], sold[i]],
+            "Reason": STOP_LOSS_REASON,
+        }
+        for i in order
+    ]
+    remaining = book[~hit].reset_index(drop=True)
+    return snapshot, trades, remaining, float(cash_path[-1]) if days else cash
+
+
+def _order_days(
+    orders: list[Order], dates: pd.DatetimeIndex, start: pd.Timestamp
+) -> dict[int, list[Order]]:
+    """Group orders by the index of the first trading day on or after their date.
+
+    Orders dated before ``start`` raise ``ValueError`` rather than being
+    applied on the first day.
+    """
+
+    grouped: dict[int, list[Order]] = {}
+    for order in orders:
+        if order.date is None:
+            raise ValueError(f"Order to {order.action} {order.ticker} has no date.")
+        if pd.Timestamp(order.date) < start:
+            raise ValueError(
+                f"Order to {order.action} {order.ticker} on {order.date} is before the start of the backtest."
+            )
+        day = int(dates.searchsorted(pd.Timestamp(order.date)))
+        if day >= len(dates):
+            raise ValueError(
+                f"Order to {order.action} {order.ticker} on {order.date} is after the last trading day."
+            )
+        grouped.setdefault(day, []).append(order)
+    return grouped
+
+
+def replay(
+    portfolio: list[dict[str, object]] | dict | pd.DataFrame,
+    cash: float,
+    orders: OrderSource,
+    session: MarketDataSession,
+    start: str | pd.Timestamp,
+    end: str | pd.Timestamp | None = None,
+    intraday: bool = False,
+    trade_log: TradeRows | None = None,
+    ctx: PortfolioContext | None = None,
+    method: str = "fifo",
+) -> BacktestResult:
+    """Replay ``portfolio`` and dated ``orders`` over the bars in ``session``.
+
+    Parameters
+    ----------
+    portfolio:
+        Positions held at the start of the window.
+    cash:
+        Cash at the start of the window.
+    orders:
+        Orders with a ``date``, as an order file or list. Orders dated on a
+        non-trading day apply on the next trading day; orders dated before
+        ``start`` raise ``ValueError``.
+    session:
+        Source of historical bars. Its window must begin on or before
+        ``start``.
+    start, end:
+        First and last day replayed; ``end`` defaults to the latest bar.
+    intraday:
+        Trigger stops on the day's low instead of the close.
+    trade_log:
+        Receives every trade row in date order. Manual orders are logged
+        by ``execute_buy``/``execute_sell`` and stop-loss sales by the
+        replay itself. When ``None`` the rows are discarded.
+    ctx:
+        Context the orders are logged under; only its date changes during
+        the replay.
+    method:
+        How sells are matched to the lots bought during the replay, one of
+        ``RELIEF_METHODS``.
+    """
+
+    book = as_portfolio_frame(portfolio)
+    if book.empty:
+        book = pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"])
+    orders = load_orders(orders)
+    tickers = list(dict.fromkeys(list(book["ticker"]) + [o.ticker for o in orders]))
+    first = pd.Timestamp(start).normalize()
+    last = pd.Timestamp(end).normalize() if end is not None else None
+    bars = _load_bars(session, tickers, first, last)
+    by_day = _order_days(orders, bars.dates, first)
+
+    # Without a trade log the rows are collected and dropped
+    collected: list[dict[str, object]] = []
+    log: TradeRows = trade_log if trade_log is not None else collected
+    ctx = _context(ctx)
+    ledger = PositionLedger.from_frame(book, method)
+    bounds = sorted(set(by_day) | {0, len(bars.dates)})
+    frames = []
+    for seg_start, seg_stop in zip(bounds, bounds[1:]):
+        for order in by_day.get(seg_start, []):
+            when = bars.dates[seg_start]
+            ctx = replace(ctx, today=when.strftime("%Y-%m-%d"), day=when.weekday())
+            try:
+                if order.action == "buy":
+                    cash, book = execute_buy(
+                        order.price, order.shares, order.ticker,
+                        cast(float, order.stop_loss), cash, book, log, ctx, ledger,
+                        verbose=False,
+                    )
+                else:
+                    cash, book = execute_sell(
+                        order.price, order.shares, order.ticker, cash, book,
+                        order.reason, log, ctx, ledger, verbose=False,
+                    )
+            except (KeyError, ValueError, SystemError) as exc:
+                raise ValueError(
+                    f"Order on {ctx.today} to {order.action} {order.ticker} failed: {exc}"
+                ) from exc
+        snapshot, stops, book, cash = _segment(bars, seg_start, seg_stop, book, cash, intraday)
+        for row in stops:
+            ledger.close(str(row["Ticker"]))
+            log.append(row)
+        frames.append(snapshot)
+
+    snapshots = pd.concat(frames, ignore_index=True)[PORTFOLIO_COLUMNS]
+    return BacktestResult(snapshots=snapshots, portfolio=book, cash=cash)
+
+
+def run_backtest(
+    data_dir: Path | str,
+    portfolio: list[dict[str, object]] | dict | pd.DataFrame,
+    cash: float,
+    orders: OrderSource,
+    session: MarketDataSession,
+    start: str | pd.Timestamp,
+    end: str | pd.Timestamp | None = None,
+    intraday: bool = False,
+    backend: str | None = None,
+    method: str = "fifo",
+) -> BacktestResult:
+    """Replay into ``data_dir`` and write the portfolio history and trade log.
+
+    ``data_dir`` must not already hold a portfolio history, so a backtest
+    can never mix with a live account's files.
+    """
+
+    ctx = PortfolioContext.create(data_dir, backend)
+    if ctx.storage.exists():
+        raise ValueError(f"{ctx.data_dir} already has a portfolio history; use an empty directory.")
+    with ctx.storage.trade_log_writer() as trade_log:
+        result = replay(
+            portfolio, cash, orders, session, start, end, intraday, trade_log, ctx, method
+        )
+    for date, rows in result.snapshots.groupby("Date", sort=True):
+        ctx.storage.write_portfolio_day(str(date), rows.reset_index(drop=True))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a portfolio over historical prices")
+    parser.add_argument("out_dir", type=Path, help="empty directory for the backtest history")
+    parser.add_argument("--start", required=True, help="first day, YYYY-MM-DD")
+    parser.add_argument("--end", help="last day, YYYY-MM-DD (default: latest bar)")
+    parser.add_argument("--cash", type=float, required=True, help="starting cash")
+    parser.add_argument("--portfolio", type=Path, help="JSON list of starting positions")
+    parser.add_argument("--orders", type=Path, help="JSON or CSV file of dated orders")
+    parser.add_argument(
+        "--intraday", action="store_true", help="trigger stops on the daily low"
+    )
+    parser.add_argument("--backend", choices=["csv", "parquet"], help="output layout")
+    parser.add_argument(
+        "--lots", choices=RELIEF_METHODS, default="fifo", help="how sells relieve bought lots"
+    )
+    parser.add_argument(
+        "--cache", type=Path, default=Path(PRICE_CACHE_NAME), help="price cache to read bars from"
+    )
+    parser.add_argument("--offline", action="store_true", help="read bars only from the cache")
+    args = parser.parse_args()
+
+    positions: list[dict[str, object]] = []
+    if args.portfolio is not None:
+        with open(args.portfolio) as handle:
+            positions = json.load(handle)
+    # Start the session early so closes can be carried into the first day
+    session = MarketDataSession(
+        start=pd.Timestamp(args.start) - pd.Timedelta(days=14),
+        cache=PriceCache(args.cache, offline=args.offline or None),
+    )
+    result = run_backtest(
+        args.out_dir,
+        positions,
+        args.cash,
+        args.orders if args.orders is not None else [],
+        session,
+        args.start,
+        args.end,
+        args.intraday,
+        args.backend,
+        args.lots,
+    )
+    equity = result.equity
+    print(
+        f"Replayed {len(equity)} days: equity {equity.iloc[0]:.2f} -> {equity.iloc[-1]:.2f}, "
+        f"cash {result.cash:.2f}, {len(result.portfolio)} positions left."
+    )
@@ -0,0 +1,270 @@
+"""Offline benchmark suite for the daily run.
+
+Each size builds a synthetic history (``synthetic.py``) and times the
+stages of one daily run against it. Prices come from ``FakeProvider``, so
+nothing touches the network and every run sees the same data.
+
+Stages, in the order they run on a fresh copy of the history:
+
+- ``fetch``: prefetching every holding and benchmark into a
+  ``MarketDataSession``.
+- ``process_portfolio``: valuing the book and appending today's rows.
+- ``read_history``: reading the whole portfolio history.
+- ``rewrite_day``: writing today's rows again, as a rerun does.
+- ``metrics_update``: folding today's TOTAL row into the saved metrics.
+- ``metrics_rebuild``: recomputing the metrics from the full history.
+- ``daily_results``: the daily report, benchmarks included.
+- ``append_day``: writing the next day's rows.
+
+Each stage is timed over ``--repeat`` fresh copies. One more pass runs
+under ``tracemalloc`` to record each stage's peak memory, so the timings
+do not pay for tracing. Results are written as JSON together with the
+commit and library versions. Two result files can be compared with
+``--compare OLD NEW``, which exits with status 1 when a stage slowed down
+by more than ``--threshold``.
+
+Usage::
+
+    python bench/bench.py --sizes 1000 10000 100000 1000000 --out bench.json
+    python bench/bench.py --compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+# Allow importing the shared modules from the repository root
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from market_client import AsyncMarketDataClient, FakeProvider  # noqa: E402
+from market_data import MarketDataSession  # noqa: E402
+from metrics import rebuild_running_stats  # noqa: E402
+from synthetic import BENCH_DATE, write_history  # noqa: E402
+from trading_script import (  # noqa: E402
+    BENCHMARK_TICKERS,
+    SPX_START_DATE,
+    SPX_TICKER,
+    PortfolioContext,
+    daily_results,
+    process_portfolio,
+    required_tickers,
+    update_metrics_state,
+)
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+STAGES = (
+    "fetch",
+    "process_portfolio",
+    "read_history",
+    "rewrite_day",
+    "metrics_update",
+    "metrics_rebuild",
+    "daily_results",
+    "append_day",
+)
+# A stage this many times slower than the baseline counts as a regression
+REGRESSION_THRESHOLD = 1.25
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _pipeline(template: Path, work: Path, portfolio: pd.DataFrame, cash: float) -> list[tuple[str, Callable[[], object]]]:
+    """Fresh copy of ``template`` in ``work`` and the stages to run on it, in order."""
+
+    if work.exists():
+        shutil.rmtree(work)
+    shutil.copytree(template, work)
+    ctx = PortfolioContext.create(work, when=datetime.fromisoformat(BENCH_DATE))
+    # Fake prices start from each buy price, so no stop loss triggers
+    prices = dict(zip(portfolio["ticker"], portfolio["buy_price"]))
+    prices.update({ticker: 100.0 for ticker in BENCHMARK_TICKERS + [SPX_TICKER]})
+    client = AsyncMarketDataClient(FakeProvider(prices, last_date=BENCH_DATE))
+    session = MarketDataSession(start=SPX_START_DATE, client=client)
+    state: dict[str, object] = {}
+
+    def process() -> None:
+        state["portfolio"], state["cash"] = process_portfolio(portfolio, cash, session, [], ctx)
+        state["today"] = ctx.storage.read_portfolio(start=ctx.today, end=ctx.today)
+
+    def rewrite() -> None:
+        ctx.storage.write_portfolio_day(ctx.today, _as_rows(state["today"]))
+
+    def append() -> None:
+        rows = _as_rows(state["today"])
+        rows["Date"] = (pd.Timestamp(BENCH_DATE) + pd.offsets.BDay(1)).strftime("%Y-%m-%d")
+        ctx.storage.write_portfolio_day(rows["Date"].iloc[0], rows)
+
+    return [
+        ("fetch", lambda: session.prefetch(required_tickers(portfolio))),
+        ("process_portfolio", process),
+        ("read_history", ctx.storage.read_portfolio),
+        ("rewrite_day", rewrite),
+        ("metrics_update", lambda: update_metrics_state(ctx)),
+        ("metrics_rebuild", lambda: rebuild_running_stats(ctx.storage)),
+        ("daily_results", lambda: daily_results(state["portfolio"], state["cash"], session, ctx)),
+        ("append_day", append),
+    ]
+
+
+def _as_rows(day: pd.DataFrame) -> pd.DataFrame:
+    """Typed rows read back from storage, in the string form the writers take."""
+
+    rows = day.copy()
+    rows["Date"] = rows["Date"].dt.strftime("%Y-%m-%d")
+    return rows.astype(object).where(rows.notna(), "")
+
+
+def run_size(rows: int, positions: int, repeat: int, workdir: Path) -> list[dict]:
+    """Time every stage on a synthetic history of about ``rows`` rows."""
+
+    template = workdir / f"template-{rows}"
+    generated = time.perf_counter()
+    synthetic = write_history(template, rows, positions)
+    generated = time.perf_counter() - generated
+    print(
+        f"{synthetic.rows:>9,} rows ({synthetic.days:,} days x {len(synthetic.portfolio)} positions), "
+        f"generated in {generated:.2f}s"
+    )
+
+    timings: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    peaks: dict[str, int] = {}
+    for attempt in range(repeat + 1):
+        # The last pass only measures memory
+        traced = attempt == repeat
+        stages = _pipeline(template, workdir / "run", synthetic.portfolio, synthetic.cash)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for stage, call in stages:
+                if traced:
+                    tracemalloc.start()
+                    call()
+                    peaks[stage] = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                else:
+                    start = time.perf_counter()
+                    call()
+                    timings[stage].append(time.perf_counter() - start)
+    shutil.rmtree(template)
+    shutil.rmtree(workdir / "run")
+
+    results = []
+    for stage in STAGES:
+        times = timings[stage]
+        results.append(
+            {
+                "size": rows,
+                "rows": synthetic.rows,
+                "days": synthetic.days,
+                "positions": len(synthetic.portfolio),
+                "stage": stage,
+                "repeat": repeat,
+                "seconds_min": min(times),
+                "seconds_median": statistics.median(times),
+                "peak_bytes": peaks[stage],
+            }
+        )
+        print(
+            f"    {stage:<18} {min(times) * 1000:>10.2f} ms min"
+            f" {statistics.median(times) * 1000:>10.2f} ms median"
+            f" {peaks[stage] / 2**20:>9.1f} MiB peak"
+        )
+    return results
+
+
+def run(sizes: list[int], positions: int = 20, repeat: int = 3) -> dict:
+    """Benchmark every size and return the JSON-ready report."""
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="microcap-bench-") as tmp:
+        for rows in sizes:
+            results += run_size(rows, positions, repeat, Path(tmp))
+    return {
+        "commit": _commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "positions": positions,
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = REGRESSION_THRESHOLD) -> list[dict]:
+    """Print both reports' median times side by side; return the regressions.
+
+    Stages are matched by size and name. A regression is a stage whose
+    median time grew by more than ``threshold`` times.
+    """
+
+    before = {(r["size"], r["stage"]): r for r in old["results"]}
+    regressions = []
+    print(f"{old.get('commit') or 'old'} -> {new.get('commit') or 'new'}")
+    for row in new["results"]:
+        base = before.get((row["size"], row["stage"]))
+        if base is None:
+            continue
+        ratio = row["seconds_median"] / base["seconds_median"] if base["seconds_median"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append({**row, "ratio": ratio})
+        print(
+            f"{row['size']:>9,} {row['stage']:<18}"
+            f" {base['seconds_median'] * 1000:>10.2f} -> {row['seconds_median'] * 1000:>10.2f} ms"
+            f" ({ratio:.2f}x){flag}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the daily run on synthetic histories")
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="history sizes in rows"
+    )
+    parser.add_argument("--positions", type=int, default=20, help="positions held per day")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--out", type=Path, help="write the results as JSON to this file")
+    parser.add_argument(
+        "--compare", nargs=2, type=Path, metavar=("OLD", "NEW"), help="compare two result files"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="slowdown factor reported as a regression by --compare",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (json.loads(path.read_text()) for path in args.compare)
+        sys.exit(1 if compare(old, new, args.threshold) else 0)
+
+    report = run(args.sizes, args.positions, args.repeat)
+    if args.out is not None:
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.out}")
@@ -0,0 +1,166 @@
+"""Synthetic portfolio histories for the benchmark suite.
+
+``write_history`` fills a data directory with a deterministic
+``chatgpt_portfolio_update.csv`` of about ``rows`` rows: one row per
+position plus a TOTAL row for every business day. It also writes a
+matching trade log and the saved metrics state, so a daily run on the
+directory behaves like a run on a real portfolio. Prices come from a
+seeded random walk. The same arguments always produce the same files.
+"""
+
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Allow importing the shared modules from the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from metrics import METRICS_STATE_NAME, rebuild_running_stats  # noqa: E402
+from storage import (  # noqa: E402
+    PORTFOLIO_COLUMNS,
+    PORTFOLIO_CSV_NAME,
+    TRADE_LOG_COLUMNS,
+    TRADE_LOG_CSV_NAME,
+)
+
+# Day of the benchmarked run, a Friday; the history ends the day before
+BENCH_DATE = "2025-08-08"
+# Longest history generated (about 115 years of business days); beyond
+# that, larger sizes get more positions instead of more days
+MAX_DAYS = 30_000
+
+
+@dataclass
+class SyntheticPortfolio:
+    """What ``write_history`` produced.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the generated files.
+    rows:
+        Rows in the portfolio history, TOTAL rows included.
+    days:
+        Business days in the history.
+    portfolio:
+        Positions held on the last day, in the shape ``process_portfolio``
+        takes.
+    cash:
+        Cash balance on the last day.
+    """
+
+    data_dir: Path
+    rows: int
+    days: int
+    portfolio: pd.DataFrame
+    cash: float
+
+
+def tickers(count: int) -> list[str]:
+    return [f"S{i:05d}" for i in range(count)]
+
+
+def write_history(
+    data_dir: Path | str, rows: int, positions: int = 20, seed: int = 0
+) -> SyntheticPortfolio:
+    """Write a synthetic history of about ``rows`` rows into ``data_dir``.
+
+    Parameters
+    ----------
+    data_dir:
+        Target directory, created if needed. Existing files are replaced.
+    rows:
+        Approximate number of history rows.
+    positions:
+        Positions held every day. Raised when ``rows`` would otherwise need
+        more than ``MAX_DAYS`` days.
+    seed:
+        Seed of the price paths and share counts.
+    """
+
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    days = max(1, rows // (positions + 1))
+    if days > MAX_DAYS:
+        days = MAX_DAYS
+        positions = max(positions, rows // days - 1)
+
+    rng = np.random.default_rng(seed)
+    symbols = tickers(positions)
+    dates = pd.bdate_range(end=pd.Timestamp(BENCH_DATE) - pd.offsets.BDay(1), periods=days)
+    buy = np.round(rng.uniform(1, 50, positions), 2)
+    shares = rng.integers(1, 100, positions).astype(float)
+    # Daily moves of about 2%, kept well above the stops so nothing is sold
+    walk = np.exp(np.cumsum(rng.normal(0, 0.02, (days, positions)), axis=0))
+    price = np.round(buy * np.clip(walk, 0.6, None), 2)
+    stop = np.round(buy * 0.5, 2)
+    value = np.round(price * shares, 2)
+    pnl = np.round((price - buy) * shares, 2)
+    cash = 100.0
+
+    holdings = pd.DataFrame(
+        {
+            "Date": np.repeat(dates.strftime("%Y-%m-%d"), positions),
+            "Ticker": np.tile(symbols, days),
+            "Shares": np.tile(shares, days),
+            "Cost Basis": np.tile(buy, days),
+            "Stop Loss": np.tile(stop, days),
+            "Current Price": price.ravel(),
+            "Total Value": value.ravel(),
+            "PnL": pnl.ravel(),
+            "Action": "HOLD",
+            "Cash Balance": "",
+            "Total Equity": "",
+        }
+    )
+    invested = value.sum(axis=1).round(2)
+    totals = pd.DataFrame(
+        {
+            "Date": dates.strftime("%Y-%m-%d"),
+            "Ticker": "TOTAL",
+            "Shares": "",
+            "Cost Basis": "",
+            "Stop Loss": "",
+            "Current Price": "",
+            "Total Value": invested,
+            "PnL": pnl.sum(axis=1).round(2),
+            "Action": "",
+            "Cash Balance": cash,
+            "Total Equity": (invested + cash).round(2),
+        }
+    )
+    # Each day's positions followed by its TOTAL row, as the script writes them
+    history = pd.concat([holdings, totals], ignore_index=True)
+    order = np.concatenate([np.arange(days).repeat(positions), np.arange(days)])
+    history = history.iloc[np.argsort(order, kind="stable")][PORTFOLIO_COLUMNS]
+    history.to_csv(data_dir / PORTFOLIO_CSV_NAME, index=False)
+
+    trades = pd.DataFrame(
+        {
+            "Date": dates[0].strftime("%Y-%m-%d"),
+            "Ticker": symbols,
+            "Shares Bought": shares,
+            "Buy Price": buy,
+            "Cost Basis": np.round(buy * shares, 2),
+            "PnL": 0.0,
+            "Reason": "MANUAL BUY - New position",
+            "Shares Sold": "",
+            "Sell Price": "",
+        }
+    )[TRADE_LOG_COLUMNS]
+    trades.to_csv(data_dir / TRADE_LOG_CSV_NAME, index=False)
+    rebuild_running_stats(data_dir).save(data_dir / METRICS_STATE_NAME)
+
+    portfolio = pd.DataFrame(
+        {
+            "ticker": symbols,
+            "shares": shares,
+            "stop_loss": stop,
+            "buy_price": buy,
+            "cost_basis": np.round(buy * shares, 2),
+        }
+    )
+    return SyntheticPortfolio(data_dir, len(history), days, portfolio, cash)
@@ -0,0 +1,279 @@
+"""Benchmark indices as aligned, precomputed growth series.
+
+``daily_results`` and the graph scripts compare the portfolio with "$100
+invested" in the S&P 500 and other benchmarks. ``BenchmarkSeries`` keeps
+every benchmark on one shared date axis, together with its cumulative log
+return since its first bar:
+
+    growth[t] = log(close[t] / close[first bar])
+
+The value of ``amount`` invested at ``start`` is then
+``amount * exp(growth[end] - growth[start])``. Once the two rows are
+located (a binary search on the dates), that is O(1), for any start date
+and without a hard-coded base price. Days on which a benchmark has no bar
+carry its last value forward.
+
+New bars are folded in incrementally. Only the rows from each
+benchmark's last stored bar onward are recomputed; that last bar may have
+been an intraday price. Bars older than a benchmark's stored history
+rebuild that benchmark. The series is saved next to the portfolio CSVs
+as ``benchmarks.npz``, so each run extends it rather than rebuilding it.
+"""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Iterable, Mapping
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from market_data import MarketDataSession
+from price_cache import PRICE_CACHE_NAME, PriceCache
+
+BENCHMARKS = ("^SPX", "^RUT", "IWO", "XBI")
+BENCHMARK_STATE_NAME = "benchmarks.npz"
+
+
+def _days(values: object) -> np.ndarray:
+    """Dates as ``datetime64[D]``, ignoring time of day and time zone."""
+
+    index = pd.DatetimeIndex(pd.to_datetime(values))
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize().to_numpy().astype("datetime64[D]")
+
+
+def _day(value: str | pd.Timestamp) -> np.datetime64:
+    return _days([value])[0]
+
+
+class BenchmarkSeries:
+    """Closes and cumulative log returns of several benchmarks on shared dates.
+
+    Parameters
+    ----------
+    tickers:
+        Benchmarks held. Others are added when ``update`` receives bars for
+        them.
+    """
+
+    def __init__(self, tickers: Iterable[str] = BENCHMARKS) -> None:
+        self.tickers = list(dict.fromkeys(tickers))
+        self.dates = np.empty(0, dtype="datetime64[D]")
+        # Raw closes, NaN on days without a bar
+        self.closes = np.empty((0, len(self.tickers)))
+        # Cumulative log return since each benchmark's first bar, carried over gaps
+        self.growth = np.empty((0, len(self.tickers)))
+        # Log of each benchmark's first close
+        self.base = np.full(len(self.tickers), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def _column(self, ticker: str) -> int:
+        try:
+            return self.tickers.index(ticker)
+        except ValueError:
+            raise KeyError(f"{ticker} is not a tracked benchmark") from None
+
+    def _add_ticker(self, ticker: str) -> None:
+        self.tickers.append(ticker)
+        pad = np.full((len(self.dates), 1), np.nan)
+        self.closes = np.hstack([self.closes, pad])
+        self.growth = np.hstack([self.growth, pad])
+        self.base = np.append(self.base, np.nan)
+
+    def last_bar(self, ticker: str) -> pd.Timestamp | None:
+        """Date of the latest stored bar of ``ticker``."""
+
+        rows = np.flatnonzero(~np.isnan(self.closes[:, self._column(ticker)]))
+        return pd.Timestamp(self.dates[rows[-1]]) if len(rows) else None
+
+    def update(self, histories: Mapping[str, pd.DataFrame]) -> int:
+        """Fold OHLCV frames (as from ``MarketDataSession.history``) into the series.
+
+        Bars before a benchmark's last stored bar are taken as already
+        known and skipped. Returns the number of rows recomputed, ``0``
+        when nothing was new.
+        """
+
+        fresh: dict[str, pd.Series] = {}
+        for ticker, bars in histories.items():
+            if bars is None or bars.empty or "Close" not in bars:
+                continue
+            close = bars["Close"].astype(float)
+            close = pd.Series(close.to_numpy(), index=_days(close.index)).dropna()
+            close = close[~close.index.duplicated(keep="last")].sort_index()
+            if ticker not in self.tickers:
+                self._add_ticker(ticker)
+            column = self._column(ticker)
+            stored = np.flatnonzero(~np.isnan(self.closes[:, column]))
+            if len(stored) and _days(close.index[:1])[0] < self.dates[stored[0]]:
+                # Earlier history than stored: rebuild this benchmark from its new first bar
+                self.base[column] = np.nan
+            elif len(stored):
+                close = close[_days(close.index) >= self.dates[stored[-1]]]
+                # Only the stored last bar again, unchanged
+                if len(close) == 1 and close.iloc[0] == self.closes[stored[-1], column]:
+                    continue
+            if not close.empty:
+                fresh[ticker] = close
+        if not fresh:
+            return 0
+
+        # Recompute from the earliest new bar of any benchmark
+        days = {ticker: _days(close.index) for ticker, close in fresh.items()}
+        k = int(np.searchsorted(self.dates, min(d[0] for d in days.values())))
+        dates = np.union1d(self.dates[k:], np.concatenate(list(days.values())))
+        closes = np.full((len(dates), len(self.tickers)), np.nan)
+        closes[np.searchsorted(dates, self.dates[k:])] = self.closes[k:]
+        for ticker, close in fresh.items():
+            closes[np.searchsorted(dates, days[ticker]), self._column(ticker)] = close.to_numpy()
+
+        base = self.base.copy()
+        first = pd.DataFrame(closes).bfill().to_numpy()[0] if len(closes) else base
+        base = np.where(np.isnan(base), np.log(first), base)
+        # Carry the last known close into the recomputed rows
+        seed = np.exp(self.growth[k - 1] + self.base) if k > 0 else np.full(len(self.tickers), np.nan)
+        carried = pd.DataFrame(np.vstack([seed, closes])).ffill().to_numpy()[1:]
+        growth = np.log(carried) - base
+
+        self.dates = np.concatenate([self.dates[:k], dates])
+        self.closes = np.vstack([self.closes[:k], closes])
+        self.growth = np.vstack([self.growth[:k], growth])
+        self.base = base
+        return len(dates)
+
+    def refresh(self, session: MarketDataSession, tickers: Iterable[str] | None = None) -> int:
+        """``update`` with the bars ``session`` holds for ``tickers`` (all tracked by default)."""
+
+        tickers = list(tickers) if tickers is not None else list(self.tickers)
+        session.prefetch(tickers)
+        return self.update({ticker: session.history(ticker) for ticker in tickers})
+
+    def _window(self, start: str | pd.Timestamp | None, end: str | pd.Timestamp | None) -> tuple[int, int]:
+        """Row of the first bar on or after ``start`` and of the last on or before ``end``."""
+
+        first = 0 if start is None else int(np.searchsorted(self.dates, _day(start), side="left"))
+        last = len(self.dates) - 1
+        if end is not None:
+            last = int(np.searchsorted(self.dates, _day(end), side="right")) - 1
+        return first, last
+
+    def value(
+        self,
+        ticker: str,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+        amount: float = 100.0,
+    ) -> float | None:
+        """What ``amount`` invested at ``start`` was worth at ``end``.
+
+        ``start`` is the first bar on or after that date (the benchmark's
+        own first bar if it starts later) and ``end`` the last bar on or
+        before it. ``None`` when there is no data in the window.
+        """
+
+        column = self.growth[:, self._column(ticker)]
+        first, last = self._window(start, end)
+        if first > last:
+            return None
+        if np.isnan(column[first]):
+            valid = np.flatnonzero(~np.isnan(column[first : last + 1]))
+            if not len(valid):
+                return None
+            first += int(valid[0])
+        return float(amount * np.exp(column[last] - column[first]))
+
+    def rebased(
+        self,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+        amount: float = 100.0,
+        tickers: Iterable[str] | None = None,
+    ) -> pd.DataFrame:
+        """Value of ``amount`` invested at ``start`` in each benchmark, per day.
+
+        One column per ticker, indexed by date from ``start`` to ``end``.
+        A benchmark starting later than ``start`` is rebased at its own
+        first bar.
+        """
+
+        tickers = list(tickers) if tickers is not None else list(self.tickers)
+        columns = [self._column(ticker) for ticker in tickers]
+        first, last = self._window(start, end)
+        growth = self.growth[max(first, 0) : last + 1, columns]
+        base = pd.DataFrame(growth).bfill().to_numpy()[0] if len(growth) else np.zeros(len(columns))
+        values = amount * np.exp(growth - base)
+        index = pd.DatetimeIndex(self.dates[max(first, 0) : last + 1].astype("datetime64[ns]"), name="Date")
+        return pd.DataFrame(values, index=index, columns=tickers)
+
+    def save(self, path: Path | str) -> None:
+        """Write the series to ``path`` atomically."""
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            tickers=np.array(self.tickers, dtype=str),
+            dates=self.dates.astype("int64"),
+            closes=self.closes,
+            growth=self.growth,
+            base=self.base,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path | str) -> "BenchmarkSeries | None":
+        """Series saved at ``path``, or ``None`` if it is missing or unreadable."""
+
+        try:
+            with np.load(path) as data:
+                series = cls(data["tickers"].tolist())
+                series.dates = data["dates"].astype("datetime64[D]")
+                series.closes = data["closes"]
+                series.growth = data["growth"]
+                series.base = data["base"]
+        except (OSError, KeyError, ValueError):
+            return None
+        return series
+
+
+def load_benchmarks(
+    data_dir: Path | str,
+    session: MarketDataSession,
+    tickers: Iterable[str] = BENCHMARKS,
+) -> BenchmarkSeries:
+    """Benchmarks saved in ``data_dir``, extended with ``session``'s new bars.
+
+    ``tickers`` not yet tracked are added. The file is rewritten only
+    when something changed.
+    """
+
+    path = Path(data_dir) / BENCHMARK_STATE_NAME
+    with span("benchmarks.load") as sp:
+        series = BenchmarkSeries.load(path) or BenchmarkSeries(tickers)
+        rows = series.refresh(session, tickers)
+        if rows:
+            series.save(path)
+        sp.set(rows=rows, days=len(series))
+    return series
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show what $100 in each benchmark grew to")
+    parser.add_argument("data_dir", type=Path, help="directory holding the price cache")
+    parser.add_argument("--start", default="2025-06-27", help="investment date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="valuation date (YYYY-MM-DD), default the latest bar")
+    parser.add_argument("--tickers", default=",".join(BENCHMARKS), help="comma-separated benchmarks")
+    parser.add_argument("--offline", action="store_true", help="read prices only from the cache")
+    args = parser.parse_args()
+
+    tickers = [t.strip() for t in args.tickers.split(",") if t.strip()]
+    cache = PriceCache(args.data_dir / PRICE_CACHE_NAME, offline=args.offline or None)
+    series = load_benchmarks(args.data_dir, MarketDataSession(start=args.start, cache=cache), tickers)
+    for ticker in tickers:
+        value = series.value(ticker, args.start, args.end)
+        print(f"{ticker}: " + ("no data" if value is None else f"${value:.2f}"))
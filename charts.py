@@ -0,0 +1,424 @@
+"""Headless rendering of the portfolio vs. S&P 500 chart.
+
+``Generate_Graph`` draws one chart with pyplot and shows it on screen.
+``ChartRenderer`` draws the same chart on a figure attached to the Agg
+canvas, so no display is needed. It writes the chart as PNG and/or SVG,
+and the plotted series as JSON. Each renderer keeps one figure and only
+clears its axes between charts, so many portfolios are drawn without
+building a figure for each.
+
+Equity curves longer than ``max_points`` are downsampled with
+Largest-Triangle-Three-Buckets before plotting. The shape, peaks and
+drawdowns are kept while the line holds a bounded number of vertices.
+The JSON export always has the full series.
+
+The S&P 500 line comes from the ``benchmarks`` series saved next to the
+portfolio, rebased to $100 on each chart's first day.
+
+``render_batch`` charts many data directories. It loads the S&P 500 once
+for the whole date range and renders the directories in a process pool,
+with one renderer per worker process.
+"""
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import matplotlib.style
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from benchmarks import BenchmarkSeries, load_benchmarks
+from market_data import MarketDataSession
+from price_cache import PRICE_CACHE_NAME, PriceCache
+from storage import open_backend
+
+CHART_FORMATS = ("png", "svg", "json")
+# Vertices per line after downsampling
+MAX_CHART_POINTS = 1000
+# Lines with at most this many points also get a marker on every point
+MARKER_MAX_POINTS = 60
+CHART_STYLE = "seaborn-v0_8-whitegrid"
+SPX_BENCHMARK = "^SPX"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points between them
+    are split into ``threshold - 2`` buckets. From each bucket, the point
+    kept is the one forming the largest triangle with the point kept from
+    the previous bucket and the mean of the next bucket.
+
+    Parameters
+    ----------
+    x, y:
+        Coordinates of the series, ``x`` ascending.
+    threshold:
+        Number of points to keep. Series that are already this short are
+        returned whole.
+    """
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket i covers [edges[i], edges[i + 1]); the last point is its own bucket
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.intp) + 1
+    edges[-1] = n - 1
+    keep = np.empty(threshold, dtype=np.intp)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        following = slice(stop, edges[i + 2] if i + 2 < len(edges) else n)
+        mean_x = x[following].mean()
+        mean_y = y[following].mean()
+        area = np.abs(
+            (x[a] - mean_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(frame: pd.DataFrame, x: str, y: str, max_points: int) -> pd.DataFrame:
+    """Rows of ``frame`` kept by ``lttb`` on its ``x``/``y`` columns."""
+
+    if len(frame) <= max_points:
+        return frame
+    xs = frame[x]
+    if pd.api.types.is_datetime64_any_dtype(xs):
+        xs = xs.astype("int64")
+    return frame.iloc[lttb(xs.to_numpy(), frame[y].to_numpy(), max_points)]
+
+
+def load_equity(
+    data_dir: Path,
+    baseline_equity: float = 100.0,
+    baseline_date: pd.Timestamp | None = None,
+) -> pd.DataFrame:
+    """Daily ``Total Equity`` of a portfolio, after a baseline row.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the portfolio history.
+    baseline_equity:
+        Dollar value of the synthetic starting row.
+    baseline_date:
+        Date of the baseline row. ``None`` uses the earliest portfolio date,
+        or today if the history is empty.
+    """
+
+    storage = open_backend(data_dir)
+    if not storage.exists():
+        raise SystemExit(
+            f"No portfolio history in '{data_dir}'. Run Trading_Script.py to generate it."
+        )
+    # Only the columns needed for the equity curve are read
+    history = storage.read_portfolio(["Date", "Ticker", "Total Equity"])
+    totals = history[history["Ticker"] == "TOTAL"].drop_duplicates("Date", keep="last")
+    if baseline_date is None:
+        baseline_date = totals["Date"].min() if not totals.empty else pd.Timestamp.today()
+    baseline = pd.DataFrame({"Date": [baseline_date], "Total Equity": [baseline_equity]})
+    equity = pd.concat([baseline, totals[["Date", "Total Equity"]]], ignore_index=True)
+    equity["Date"] = pd.to_datetime(equity["Date"])
+    equity["Total Equity"] = equity["Total Equity"].astype(float)
+    return equity.sort_values("Date", kind="stable", ignore_index=True)
+
+
+def load_benchmark_series(
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    cache_dir: Path,
+    offline: bool | None = None,
+) -> BenchmarkSeries:
+    """The benchmark series in ``cache_dir``, extended to cover ``start`` to ``end``.
+
+    Bars are read through the ``PriceCache`` in ``cache_dir``, so only
+    those missing since the last run are downloaded.
+    """
+
+    cache = PriceCache(Path(cache_dir) / PRICE_CACHE_NAME, offline=offline)
+    session = MarketDataSession(start=start, end=end + pd.Timedelta(days=1), cache=cache)
+    return load_benchmarks(cache_dir, session, [SPX_BENCHMARK])
+
+
+def benchmark_frame(
+    series: BenchmarkSeries, start: pd.Timestamp, end: pd.Timestamp
+) -> pd.DataFrame:
+    """S&P 500 from ``start`` to ``end`` as the value of $100 invested at ``start``."""
+
+    if SPX_BENCHMARK not in series.tickers:
+        return pd.DataFrame(columns=["Date", "SPX Value ($100 Invested)"])
+    rebased = series.rebased(start, end, tickers=[SPX_BENCHMARK]).dropna()
+    return rebased.rename(columns={SPX_BENCHMARK: "SPX Value ($100 Invested)"}).reset_index()
+
+
+def load_benchmark(
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    cache_dir: Path,
+    offline: bool | None = None,
+) -> pd.DataFrame:
+    """S&P 500 from ``start`` to ``end`` as the value of $100 invested at ``start``."""
+
+    return benchmark_frame(load_benchmark_series(start, end, cache_dir, offline), start, end)
+
+
+@dataclass
+class ChartData:
+    """Everything one chart shows.
+
+    Parameters
+    ----------
+    name:
+        Label of the portfolio, also used for output file names.
+    equity:
+        ``Date`` and ``Total Equity`` columns, as from ``load_equity``.
+    benchmark:
+        ``Date`` and ``SPX Value ($100 Invested)`` columns over the same
+        dates, as from ``benchmark_frame``.
+    baseline_equity:
+        Starting equity, for the return label.
+    """
+
+    name: str
+    equity: pd.DataFrame
+    benchmark: pd.DataFrame
+    baseline_equity: float = 100.0
+
+    def series(self) -> dict:
+        """Full series of the chart, ready for ``json.dump``."""
+
+        def points(frame: pd.DataFrame, column: str) -> list[dict]:
+            return [
+                {"date": date.strftime("%Y-%m-%d"), "value": round(float(value), 4)}
+                for date, value in zip(frame["Date"], frame[column])
+            ]
+
+        return {
+            "name": self.name,
+            "baseline_equity": self.baseline_equity,
+            "portfolio": points(self.equity, "Total Equity"),
+            "benchmark": points(self.benchmark, "SPX Value ($100 Invested)"),
+        }
+
+
+class ChartRenderer:
+    """Draws charts on one reusable figure.
+
+    Parameters
+    ----------
+    max_points:
+        Largest number of vertices per plotted line.
+    figure:
+        Figure to draw on. By default a new figure on the Agg canvas,
+        which needs no display. Pass a pyplot figure to show the chart
+        interactively.
+    """
+
+    def __init__(self, max_points: int = MAX_CHART_POINTS, figure: Figure | None = None) -> None:
+        self.max_points = max_points
+        with matplotlib.style.context(CHART_STYLE):
+            if figure is None:
+                figure = Figure(figsize=(10, 6))
+                FigureCanvasAgg(figure)
+            self.figure = figure
+            self.axes = self.figure.add_subplot()
+
+    def draw(self, chart: ChartData) -> None:
+        """Replace whatever the figure showed with ``chart``."""
+
+        equity = downsample(chart.equity, "Date", "Total Equity", self.max_points)
+        benchmark = downsample(
+            chart.benchmark, "Date", "SPX Value ($100 Invested)", self.max_points
+        )
+        with matplotlib.style.context(CHART_STYLE):
+            ax = self.axes
+            ax.clear()
+            ax.plot(
+                equity["Date"],
+                equity["Total Equity"],
+                label="ChatGPT ($100 Invested)",
+                marker="o" if len(equity) <= MARKER_MAX_POINTS else None,
+                color="blue",
+                linewidth=2,
+            )
+            ax.plot(
+                benchmark["Date"],
+                benchmark["SPX Value ($100 Invested)"],
+                label="S&P 500 ($100 Invested)",
+                marker="o" if len(benchmark) <= MARKER_MAX_POINTS else None,
+                color="orange",
+                linestyle="--",
+                linewidth=2,
+            )
+
+            final_date = chart.equity["Date"].iloc[-1]
+            final_equity = float(chart.equity["Total Equity"].iloc[-1])
+            ax.text(
+                final_date,
+                final_equity + 0.3,
+                f"+{final_equity - chart.baseline_equity:.1f}%",
+                color="blue",
+                fontsize=9,
+            )
+            if not chart.benchmark.empty:
+                final_spx = float(chart.benchmark["SPX Value ($100 Invested)"].iloc[-1])
+                ax.text(final_date, final_spx + 0.9, f"+{final_spx - 100:.1f}%", color="orange", fontsize=9)
+            ax.set_title("ChatGPT's Micro Cap Portfolio vs. S&P 500")
+            ax.set_xlabel("Date")
+            ax.set_ylabel("Value of $100 Investment")
+            ax.tick_params(axis="x", labelrotation=15)
+            ax.legend()
+            ax.grid(True)
+            self.figure.tight_layout()
+
+    def save(self, chart: ChartData, out_base: Path, formats: tuple[str, ...] = ("png",)) -> list[Path]:
+        """Write the current drawing of ``chart`` in each of ``formats``.
+
+        ``out_base`` is the output path without a suffix. Returns the
+        files written.
+        """
+
+        written = []
+        out_base = Path(out_base)
+        out_base.parent.mkdir(parents=True, exist_ok=True)
+        for fmt in formats:
+            if fmt not in CHART_FORMATS:
+                raise ValueError(f"Unknown chart format {fmt!r}; expected one of {CHART_FORMATS}.")
+            path = out_base.with_name(f"{out_base.name}.{fmt}")
+            if fmt == "json":
+                with open(path, "w") as handle:
+                    json.dump(chart.series(), handle)
+            else:
+                self.figure.savefig(path, format=fmt, dpi=100)
+            written.append(path)
+        return written
+
+    def render(self, chart: ChartData, out_base: Path, formats: tuple[str, ...] = ("png",)) -> list[Path]:
+        """Draw ``chart`` and write it; see ``save``."""
+
+        if any(fmt != "json" for fmt in formats):
+            self.draw(chart)
+        return self.save(chart, out_base, formats)
+
+
+# Renderer of the current worker process, created once by ``_init_worker``
+_RENDERER: ChartRenderer | None = None
+
+
+def _init_worker(max_points: int) -> None:
+    global _RENDERER
+    _RENDERER = ChartRenderer(max_points)
+
+
+def _render_in_worker(chart: ChartData, out_base: Path, formats: tuple[str, ...]) -> list[Path]:
+    return _RENDERER.render(chart, out_base, formats)
+
+
+def _output_names(data_dirs: list[Path]) -> list[str]:
+    """File-name stems for the directories, made unique where names repeat."""
+
+    names = []
+    for data_dir in data_dirs:
+        name = Path(data_dir).resolve().name.replace(" ", "_") or "portfolio"
+        stem, i = name, 2
+        while name in names:
+            name = f"{stem}-{i}"
+            i += 1
+        names.append(name)
+    return names
+
+
+def render_batch(
+    data_dirs: list[Path],
+    out_dir: Path,
+    formats: tuple[str, ...] = ("png",),
+    workers: int = 4,
+    baseline_equity: float = 100.0,
+    max_points: int = MAX_CHART_POINTS,
+    offline: bool | None = None,
+) -> dict[Path, list[Path]]:
+    """Chart every directory in ``data_dirs`` into ``out_dir``.
+
+    The S&P 500 is loaded once over the union of the portfolios' dates,
+    through the caches of the first directory, and rebased to each
+    portfolio's first day. Charts are rendered in
+    ``workers`` processes; with one worker they are drawn in this process.
+
+    Returns
+    -------
+    dict
+        Files written per data directory.
+    """
+
+    data_dirs = [Path(d) for d in data_dirs]
+    charts = [
+        ChartData(name, load_equity(d, baseline_equity), pd.DataFrame(), baseline_equity)
+        for d, name in zip(data_dirs, _output_names(data_dirs))
+    ]
+    if not charts:
+        return {}
+    start = min(chart.equity["Date"].min() for chart in charts)
+    end = max(chart.equity["Date"].max() for chart in charts)
+    series = load_benchmark_series(start, end, data_dirs[0], offline)
+    for chart in charts:
+        chart.benchmark = benchmark_frame(
+            series, chart.equity["Date"].min(), chart.equity["Date"].max()
+        )
+
+    out_bases = [Path(out_dir) / chart.name for chart in charts]
+    if workers <= 1 or len(charts) == 1:
+        renderer = ChartRenderer(max_points)
+        written = [renderer.render(c, o, formats) for c, o in zip(charts, out_bases)]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(max_points,)
+        ) as pool:
+            written = list(
+                pool.map(_render_in_worker, charts, out_bases, [formats] * len(charts))
+            )
+    return dict(zip(data_dirs, written))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render portfolio charts without a display")
+    parser.add_argument("data_dirs", nargs="+", type=Path, help="portfolio data directories")
+    parser.add_argument("--out", type=Path, default=Path("charts"), help="output directory")
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=CHART_FORMATS,
+        default=["png"],
+        help="output formats",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument(
+        "--baseline-equity", type=float, default=100.0, help="starting equity value"
+    )
+    parser.add_argument(
+        "--max-points", type=int, default=MAX_CHART_POINTS, help="points per plotted line"
+    )
+    parser.add_argument("--offline", action="store_true", help="read prices only from the cache")
+    args = parser.parse_args()
+
+    results = render_batch(
+        args.data_dirs,
+        args.out,
+        tuple(args.format),
+        workers=args.workers,
+        baseline_equity=args.baseline_equity,
+        max_points=args.max_points,
+        offline=args.offline or None,
+    )
+    for data_dir, paths in results.items():
+        print(f"{data_dir}: {', '.join(str(p) for p in paths)}")
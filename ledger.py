@@ -0,0 +1,286 @@
+"""Lot-level position ledger.
+
+The portfolio DataFrame keeps one row per ticker. When a position is
+added to, the shares are averaged into that row, so the price of each
+purchase is lost. ``PositionLedger`` keeps every purchase as a ``Lot``
+instead, keyed by ticker:
+- Looking up a position is a dictionary access rather than a scan of the
+  DataFrame.
+- A sale relieves lots first in, first out (``"fifo"``), last in, first
+  out (``"lifo"``) or at the average cost of the position (``"average"``),
+  and reports the cost basis and realised PnL of exactly the shares sold.
+- Every lot carries its own stop loss.
+
+``from_frame`` and ``to_frame`` convert to and from the portfolio
+DataFrame (``ticker``, ``shares``, ``stop_loss``, ``buy_price``,
+``cost_basis``), so the rest of the script keeps working with the shape
+it already uses.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+
+import pandas as pd
+
+PORTFOLIO_FIELDS = ["ticker", "shares", "stop_loss", "buy_price", "cost_basis"]
+RELIEF_METHODS = ("fifo", "lifo", "average")
+
+# Share counts below this are treated as zero after a partial sale
+_EPSILON = 1e-9
+
+
+@dataclass(slots=True)
+class Lot:
+    """Shares of one ticker bought together at one price.
+
+    Parameters
+    ----------
+    ticker:
+        Symbol held.
+    shares:
+        Shares still open in this lot.
+    price:
+        Recorded buy price per share.
+    stop_loss:
+        Price at or below which this lot should be sold.
+    date:
+        Day the lot was bought, ``YYYY-MM-DD``, when known.
+    cost_price:
+        Cost per share for PnL when it differs from ``price``, e.g. when
+        the recorded cost basis includes rounding or fees.
+    """
+
+    ticker: str
+    shares: float
+    price: float
+    stop_loss: float
+    date: str | None = None
+    cost_price: float | None = None
+
+    @property
+    def unit_cost(self) -> float:
+        return self.price if self.cost_price is None else self.cost_price
+
+    @property
+    def cost_basis(self) -> float:
+        return self.shares * self.unit_cost
+
+
+@dataclass(slots=True)
+class Relief:
+    """Result of a sale: what was sold and what it had cost."""
+
+    ticker: str
+    shares: float
+    cost_basis: float
+    proceeds: float
+
+    @property
+    def pnl(self) -> float:
+        return self.proceeds - self.cost_basis
+
+
+class PositionLedger:
+    """Open lots per ticker with FIFO, LIFO or average-cost relief.
+
+    Parameters
+    ----------
+    method:
+        How sales are matched to lots, one of ``RELIEF_METHODS``.
+    """
+
+    __slots__ = ("method", "_lots")
+
+    def __init__(self, method: str = "fifo") -> None:
+        if method not in RELIEF_METHODS:
+            raise ValueError(f"Unknown relief method {method!r}; expected one of {RELIEF_METHODS}.")
+        self.method = method
+        self._lots: dict[str, deque[Lot]] = {}
+
+    def __contains__(self, ticker: object) -> bool:
+        return ticker in self._lots
+
+    def __len__(self) -> int:
+        return len(self._lots)
+
+    def tickers(self) -> list[str]:
+        """Held tickers in the order they were first bought."""
+
+        return list(self._lots)
+
+    def lots(self, ticker: str) -> list[Lot]:
+        """Open lots of ``ticker``, oldest first."""
+
+        return list(self._lots.get(ticker, ()))
+
+    def shares(self, ticker: str) -> float:
+        return sum(lot.shares for lot in self._lots.get(ticker, ()))
+
+    def cost_basis(self, ticker: str) -> float:
+        return sum(lot.cost_basis for lot in self._lots.get(ticker, ()))
+
+    def average_price(self, ticker: str) -> float:
+        """Cost per share of the open position in ``ticker``."""
+
+        shares = self.shares(ticker)
+        if shares <= 0:
+            raise KeyError(f"error, could not find {ticker} in portfolio")
+        return self.cost_basis(ticker) / shares
+
+    def stop_loss(self, ticker: str) -> float:
+        """The highest stop of any open lot, i.e. the first one to trigger."""
+
+        if ticker not in self._lots:
+            raise KeyError(f"error, could not find {ticker} in portfolio")
+        return max(lot.stop_loss for lot in self._lots[ticker])
+
+    def buy(
+        self,
+        ticker: str,
+        shares: float,
+        price: float,
+        stop_loss: float,
+        date: str | None = None,
+        cost_price: float | None = None,
+    ) -> Lot:
+        """Open a new lot and return it."""
+
+        if shares <= 0 or price <= 0:
+            raise ValueError("shares and price must be positive")
+        lot = Lot(
+            ticker, float(shares), float(price), float(stop_loss), date,
+            None if cost_price is None else float(cost_price),
+        )
+        self._lots.setdefault(ticker, deque()).append(lot)
+        return lot
+
+    def sell(self, ticker: str, shares: float, price: float) -> Relief:
+        """Relieve ``shares`` of ``ticker`` by the ledger's method.
+
+        Raises
+        ------
+        KeyError
+            If ``ticker`` is not held.
+        ValueError
+            If more shares are sold than are open.
+        """
+
+        lots = self._lots.get(ticker)
+        if not lots:
+            raise KeyError(f"error, could not find {ticker} in portfolio")
+        held = sum(lot.shares for lot in lots)
+        if shares > held + _EPSILON:
+            raise ValueError(f"You are trying to sell {shares} but only own {held}.")
+
+        if self.method == "average":
+            # Every lot gives up the same fraction, so each keeps its own stop
+            cost = shares * sum(lot.cost_basis for lot in lots) / held
+            fraction = shares / held
+            for lot in lots:
+                lot.shares -= lot.shares * fraction
+        else:
+            cost = 0.0
+            remaining = float(shares)
+            while remaining > _EPSILON:
+                lot = lots[0] if self.method == "fifo" else lots[-1]
+                taken = min(lot.shares, remaining)
+                cost += taken * lot.unit_cost
+                lot.shares -= taken
+                remaining -= taken
+                if lot.shares <= _EPSILON:
+                    if self.method == "fifo":
+                        lots.popleft()
+                    else:
+                        lots.pop()
+
+        for lot in [lot for lot in lots if lot.shares <= _EPSILON]:
+            lots.remove(lot)
+        if not lots:
+            del self._lots[ticker]
+        return Relief(ticker=ticker, shares=float(shares), cost_basis=cost, proceeds=shares * price)
+
+    def close(self, ticker: str) -> list[Lot]:
+        """Remove every lot of ``ticker``, for example after a stop-loss exit."""
+
+        return list(self._lots.pop(ticker, ()))
+
+    def set_stop(self, ticker: str, stop_loss: float, lot: int | None = None) -> None:
+        """Move the stop of one lot (by index, oldest first) or of all of them."""
+
+        if ticker not in self._lots:
+            raise KeyError(f"error, could not find {ticker} in portfolio")
+        lots = self._lots[ticker]
+        for target in lots if lot is None else [lots[lot]]:
+            target.stop_loss = float(stop_loss)
+
+    def triggered(self, ticker: str, price: float) -> list[Lot]:
+        """Open lots of ``ticker`` whose stop is at or above ``price``."""
+
+        return [lot for lot in self._lots.get(ticker, ()) if price <= lot.stop_loss]
+
+    @classmethod
+    def from_frame(cls, portfolio: pd.DataFrame, method: str = "fifo") -> "PositionLedger":
+        """Build a ledger from a portfolio DataFrame.
+
+        Each row becomes one lot. Several rows may share a ticker, as in a
+        ``to_frame(by_lot=True)`` export. The lot keeps ``buy_price`` as
+        its price, so it is exported unchanged. When ``cost_basis`` differs
+        from ``shares * buy_price``, sales are relieved at ``cost_basis``
+        divided by ``shares`` instead.
+        """
+
+        ledger = cls(method)
+        for row in portfolio.to_dict(orient="records"):
+            shares = float(row["shares"])
+            price = float(row["buy_price"])
+            cost_price = None
+            cost_basis = row.get("cost_basis")
+            if cost_basis is not None and not pd.isna(cost_basis) and shares > 0:
+                if abs(float(cost_basis) - shares * price) > 0.005:
+                    cost_price = float(cost_basis) / shares
+            date = row.get("date")
+            ledger.buy(
+                str(row["ticker"]), shares, price, float(row["stop_loss"]),
+                date if isinstance(date, str) else None, cost_price,
+            )
+        return ledger
+
+    def to_frame(self, by_lot: bool = False) -> pd.DataFrame:
+        """Export open positions in the portfolio DataFrame shape.
+
+        By default there is one row per ticker: ``buy_price`` is the
+        share-weighted average of the recorded lot prices and
+        ``stop_loss`` the highest lot stop. With ``by_lot`` every lot is
+        its own row.
+        """
+
+        rows = []
+        for ticker, lots in self._lots.items():
+            if by_lot:
+                rows += [
+                    {
+                        "ticker": ticker,
+                        "shares": lot.shares,
+                        "stop_loss": lot.stop_loss,
+                        "buy_price": lot.price,
+                        "cost_basis": lot.cost_basis,
+                    }
+                    for lot in lots
+                ]
+                continue
+            shares = sum(lot.shares for lot in lots)
+            cost_basis = sum(lot.cost_basis for lot in lots)
+            rows.append(
+                {
+                    "ticker": ticker,
+                    "shares": shares,
+                    "stop_loss": max(lot.stop_loss for lot in lots),
+                    "buy_price": (
+                        lots[0].price
+                        if len(lots) == 1
+                        else sum(lot.shares * lot.price for lot in lots) / shares
+                    ),
+                    "cost_basis": cost_basis,
+                }
+            )
+        return pd.DataFrame(rows, columns=PORTFOLIO_FIELDS)
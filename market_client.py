@@ -0,0 +1,376 @@
+"""Asynchronous market data client with bounded concurrency and retries.
+
+Downloads go through a ``MarketDataProvider``: yfinance in normal runs, or
+``FakeProvider`` for tests and offline experiments. ``AsyncMarketDataClient``
+splits a request into chunks, runs at most ``max_concurrency`` of them at
+once, gives each attempt ``timeout`` seconds and retries failures with
+exponential backoff. Requested tickers that come back without data are
+retried the same way. A chunk that still fails is reported per ticker in
+the ``FetchResult`` instead of aborting the whole request, so one slow or
+broken symbol no longer stops a run.
+
+Synchronous code calls ``fetch_sync`` (or ``fetch_history``), which runs
+the event loop for it.
+"""
+
+import asyncio
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Coroutine, Iterable, Protocol, TypeVar, cast
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from instrumentation import span
+
+# Maximum number of tickers requested in one provider call
+DOWNLOAD_CHUNK_SIZE = 10
+# Seconds yfinance allows each HTTP request
+YFINANCE_REQUEST_TIMEOUT = 10
+
+T = TypeVar("T")
+
+# Threads running blocking provider calls. They live outside any event
+# loop so a timed-out call does not hold up ``asyncio.run`` on shutdown.
+_PROVIDER_THREADS = ThreadPoolExecutor(max_workers=32, thread_name_prefix="market-data")
+
+
+def _unique(tickers: Iterable[str]) -> list[str]:
+    """Return tickers upper-cased with duplicates removed, keeping order."""
+
+    seen: dict[str, None] = {}
+    for ticker in tickers:
+        seen.setdefault(str(ticker).strip().upper(), None)
+    return list(seen)
+
+
+def _split_download(data: pd.DataFrame, tickers: list[str]) -> dict[str, pd.DataFrame]:
+    """Split a multi-ticker ``yf.download`` result into per-ticker frames.
+
+    Older yfinance releases return flat columns for a single ticker while
+    newer ones always use a ``(ticker, field)`` MultiIndex, so both layouts
+    are handled. Tickers without any rows are omitted.
+    """
+
+    frames: dict[str, pd.DataFrame] = {}
+    if data.empty:
+        return frames
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        if len(tickers) == 1:
+            frame = data.dropna(how="all")
+            if not frame.empty:
+                frames[tickers[0]] = frame
+        return frames
+
+    available = set(data.columns.get_level_values(0))
+    for ticker in tickers:
+        if ticker not in available:
+            continue
+        frame = cast(pd.DataFrame, data[ticker]).dropna(how="all")
+        if not frame.empty:
+            frames[ticker] = frame
+    return frames
+
+
+class ProviderError(Exception):
+    """Raised by a provider when a request fails and may be retried."""
+
+
+class MarketDataProvider(Protocol):
+    """Source of daily OHLCV bars.
+
+    ``download`` is a blocking call that returns one frame per ticker with
+    ``Open``, ``High``, ``Low``, ``Close`` and ``Volume`` columns. Tickers
+    without data are left out, and the client reports them as failed;
+    failures of the whole call that are worth retrying raise.
+    ``window`` holds yfinance-style ``start``, ``end`` and ``period``
+    arguments.
+    """
+
+    def download(self, tickers: list[str], **window: object) -> dict[str, pd.DataFrame]:
+        ...
+
+
+class YFinanceProvider:
+    """Provider backed by batched ``yf.download`` calls.
+
+    Each call fetches its tickers one after another on the calling thread
+    (``threads=False``) and keeps its results to itself, so the client can
+    run ``max_concurrency`` calls in parallel. Every HTTP request is
+    limited to ``request_timeout`` seconds, so a call the client has
+    abandoned after its own timeout does not run on for long.
+
+    Parameters
+    ----------
+    request_timeout:
+        Seconds allowed for each HTTP request.
+    """
+
+    def __init__(self, request_timeout: float = YFINANCE_REQUEST_TIMEOUT) -> None:
+        self.request_timeout = request_timeout
+
+    def download(self, tickers: list[str], **window: object) -> dict[str, pd.DataFrame]:
+        with span("yfinance.download", tickers=len(tickers)) as sp:
+            data = yf.download(
+                tickers,
+                group_by="ticker",
+                auto_adjust=True,
+                progress=False,
+                threads=False,
+                timeout=self.request_timeout,
+                **window,
+            )
+            sp.set(rows=0 if data is None else len(data))
+        if data is None:
+            return {}
+        return _split_download(cast(pd.DataFrame, data), tickers)
+
+
+class FakeProvider:
+    """Deterministic offline provider for tests and benchmarks.
+
+    Every ticker gets a smooth synthetic price path on business days, and
+    the same ticker always produces the same bars. Latency and failures
+    can be injected.
+
+    Parameters
+    ----------
+    prices:
+        Base price per ticker. Tickers not listed have no data, unless
+        ``prices`` is ``None``, in which case every ticker gets a base
+        price derived from its name.
+    last_date:
+        Date of the newest bar; defaults to today.
+    delay:
+        Seconds each ``download`` call sleeps, to simulate a slow network.
+    failing:
+        Tickers whose requests always raise ``ProviderError``.
+    """
+
+    def __init__(
+        self,
+        prices: dict[str, float] | None = None,
+        last_date: str | pd.Timestamp | None = None,
+        delay: float = 0.0,
+        failing: Iterable[str] = (),
+    ) -> None:
+        self.prices = prices
+        self.last_date = pd.Timestamp(last_date or pd.Timestamp.today()).normalize()
+        self.delay = delay
+        self.failing = set(_unique(failing))
+        self.calls: list[tuple[list[str], dict[str, object]]] = []
+
+    def _base_price(self, ticker: str) -> float | None:
+        if self.prices is None:
+            return 1.0 + zlib.crc32(ticker.encode()) % 20000 / 100
+        return self.prices.get(ticker)
+
+    def _dates(self, window: dict[str, object]) -> pd.DatetimeIndex:
+        dates = pd.bdate_range(end=self.last_date, periods=2000)
+        start = window.get("start")
+        if start is not None:
+            dates = dates[dates >= pd.Timestamp(cast(str, start))]
+        else:
+            period = str(window.get("period", "1mo"))
+            count = {"d": 1, "mo": 21, "y": 252}
+            for suffix, days in count.items():
+                if period.endswith(suffix) and period[: -len(suffix)].isdigit():
+                    dates = dates[-int(period[: -len(suffix)]) * days :]
+                    break
+        end = window.get("end")
+        if end is not None:
+            dates = dates[dates < pd.Timestamp(cast(str, end))]
+        return dates
+
+    def download(self, tickers: list[str], **window: object) -> dict[str, pd.DataFrame]:
+        self.calls.append((list(tickers), dict(window)))
+        if self.delay:
+            threading.Event().wait(self.delay)
+        broken = self.failing.intersection(tickers)
+        if broken:
+            raise ProviderError(f"simulated failure for {', '.join(sorted(broken))}")
+        dates = self._dates(window)
+        # Day number since the epoch keeps a bar's price stable across windows
+        step = (dates - pd.Timestamp(0)).days.to_numpy(dtype=float)
+        frames: dict[str, pd.DataFrame] = {}
+        for ticker in tickers:
+            base = self._base_price(ticker)
+            if base is None or dates.empty:
+                continue
+            phase = zlib.crc32(ticker.encode()) % 628 / 100
+            close = base * (1 + 0.05 * np.sin(step / 9 + phase) + 0.0001 * (step - 19_000))
+            frames[ticker] = pd.DataFrame(
+                {
+                    "Open": close * 0.995,
+                    "High": close * 1.01,
+                    "Low": close * 0.99,
+                    "Close": close,
+                    "Volume": 10_000 + (step % 7) * 1_000,
+                },
+                index=dates,
+            )
+        return frames
+
+
+@dataclass
+class FetchResult:
+    """Frames that were downloaded and the tickers that could not be.
+
+    ``failed`` maps each requested ticker without a frame to the last
+    error: the request errored or timed out on every attempt, or the
+    provider returned no data for it.
+    """
+
+    frames: dict[str, pd.DataFrame] = field(default_factory=dict)
+    failed: dict[str, str] = field(default_factory=dict)
+
+
+def _merge(parts: Iterable[FetchResult]) -> FetchResult:
+    result = FetchResult()
+    for part in parts:
+        result.frames.update(part.frames)
+        result.failed.update(part.failed)
+    return result
+
+
+def run_sync(coro: Coroutine[object, object, T]) -> T:
+    """Run ``coro`` to completion from synchronous code.
+
+    When the calling thread already runs an event loop, the coroutine is
+    run on a fresh loop in a helper thread instead.
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+class AsyncMarketDataClient:
+    """Fetch bars concurrently with limits, timeouts and retries.
+
+    Parameters
+    ----------
+    provider:
+        Where bars come from; ``YFinanceProvider`` by default.
+    max_concurrency:
+        Maximum number of provider calls in flight at once.
+    timeout:
+        Seconds allowed for each attempt. A timed-out call is abandoned but
+        its worker thread is left to finish in the background.
+    retries:
+        Extra attempts after the first failure of a chunk; only tickers
+        that came back without data are requested again. A chunk that
+        still fails without returning anything is split in half and each
+        half tried once more, so a single bad ticker does not take its
+        whole chunk down with it.
+    backoff:
+        Delay before the first retry; it doubles on each further retry.
+    chunk_size:
+        Maximum number of tickers per provider call.
+    """
+
+    def __init__(
+        self,
+        provider: MarketDataProvider | None = None,
+        max_concurrency: int = 4,
+        timeout: float = 30.0,
+        retries: int = 2,
+        backoff: float = 1.0,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    ) -> None:
+        self.provider = provider if provider is not None else YFinanceProvider()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+
+    async def _fetch_chunk(
+        self,
+        chunk: list[str],
+        window: dict[str, object],
+        semaphore: asyncio.Semaphore,
+        retries: int,
+    ) -> FetchResult:
+        loop = asyncio.get_running_loop()
+        frames: dict[str, pd.DataFrame] = {}
+        pending = chunk
+        error = ""
+        answered = False
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            call = partial(self.provider.download, pending, **window)
+            try:
+                async with semaphore:
+                    fetched = await asyncio.wait_for(
+                        loop.run_in_executor(_PROVIDER_THREADS, call), self.timeout
+                    )
+            except asyncio.TimeoutError:
+                error = f"timed out after {self.timeout:g}s"
+                answered = False
+                continue
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                answered = False
+                continue
+            answered = True
+            frames.update(fetched)
+            pending = [ticker for ticker in pending if ticker not in fetched]
+            if not pending:
+                return FetchResult(frames=frames)
+            error = "no data returned"
+        if answered or frames or len(pending) == 1:
+            return FetchResult(frames=frames, failed={ticker: error for ticker in pending})
+        # Narrow the failure down to the tickers that cause it
+        middle = len(chunk) // 2
+        halves = await asyncio.gather(
+            self._fetch_chunk(chunk[:middle], window, semaphore, 0),
+            self._fetch_chunk(chunk[middle:], window, semaphore, 0),
+        )
+        return _merge(halves)
+
+    async def fetch(self, tickers: Iterable[str], **window: object) -> FetchResult:
+        """Download ``tickers`` over ``window`` in concurrent chunks."""
+
+        symbols = _unique(tickers)
+        chunks = [
+            symbols[i : i + self.chunk_size] for i in range(0, len(symbols), self.chunk_size)
+        ]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        parts = await asyncio.gather(
+            *(self._fetch_chunk(chunk, window, semaphore, self.retries) for chunk in chunks)
+        )
+        return _merge(parts)
+
+    def fetch_sync(self, tickers: Iterable[str], **window: object) -> FetchResult:
+        """Blocking wrapper around ``fetch``."""
+
+        symbols = _unique(tickers)
+        with span("market_data.fetch", tickers=len(symbols)) as sp:
+            result = run_sync(self.fetch(symbols, **window))
+            if sp:
+                sp.set(
+                    fetched=len(result.frames),
+                    failed=len(result.failed),
+                    rows=sum(len(frame) for frame in result.frames.values()),
+                )
+        return result
+
+
+def fetch_history(
+    tickers: Iterable[str],
+    client: AsyncMarketDataClient | None = None,
+    **window: object,
+) -> FetchResult:
+    """Fetch ``tickers`` with ``client`` or a default yfinance client."""
+
+    return (client or AsyncMarketDataClient()).fetch_sync(tickers, **window)
@@ -0,0 +1,235 @@
+"""Batched market data downloads shared by the trading scripts.
+
+Fetching prices one ticker at a time means one network round trip per
+position. The helpers here request every ticker in a single batched
+call through ``AsyncMarketDataClient`` (split into concurrent chunks for
+very large books) and hand back per-ticker frames or a vectorised price
+table. Tickers whose download fails are reported, not raised. A
+``MarketDataSession`` keeps those frames for the rest of a run so the
+same tickers are never downloaded twice, and can read through a
+``PriceCache`` so only bars missing on disk are fetched at all.
+"""
+
+from typing import Iterable
+
+import pandas as pd
+
+from instrumentation import span
+from market_client import DOWNLOAD_CHUNK_SIZE, AsyncMarketDataClient, _unique
+from price_cache import PriceCache
+
+
+def report_failures(failed: dict[str, str]) -> None:
+    """Print one line per ticker whose download failed."""
+
+    for ticker, error in failed.items():
+        print(f"Could not download {ticker}: {error}")
+
+
+def download_history(
+    tickers: Iterable[str],
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    client: AsyncMarketDataClient | None = None,
+    **kwargs: object,
+) -> dict[str, pd.DataFrame]:
+    """Download OHLCV history for many tickers with batched requests.
+
+    Parameters
+    ----------
+    tickers:
+        Symbols to download. Duplicates are requested once.
+    chunk_size:
+        Maximum number of symbols per provider call when no ``client`` is
+        given.
+    client:
+        Client used for the download; a default yfinance client otherwise.
+    **kwargs:
+        Download window (``period``, ``start``, ``end`` ...).
+
+    Returns
+    -------
+    dict
+        Mapping of ticker to its OHLCV frame. Symbols that returned no data
+        or failed are left out so callers can treat them as missing; the
+        failures are printed.
+    """
+
+    client = client or AsyncMarketDataClient(chunk_size=chunk_size)
+    result = client.fetch_sync(tickers, **kwargs)
+    report_failures(result.failed)
+    return result.frames
+
+
+def latest_prices(
+    tickers: Iterable[str],
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    client: AsyncMarketDataClient | None = None,
+) -> pd.DataFrame:
+    """Return the most recent bar for each ticker from a one-off session."""
+
+    session = MarketDataSession(period="1d", chunk_size=chunk_size, client=client)
+    return session.latest_prices(tickers)
+
+
+class MarketDataSession:
+    """Per-run store of daily bars shared by every consumer of a run.
+
+    ``process_portfolio`` and ``daily_results`` both need prices for the same
+    holdings, and ``daily_results`` additionally needs benchmark indices. A
+    session downloads the union of requested tickers once, over a window wide
+    enough for all of them, and answers later lookups from memory. Tickers
+    first requested after the initial prefetch are fetched in one extra batch.
+
+    Parameters
+    ----------
+    start:
+        First date of the shared window. When ``None`` a trailing ``period``
+        is requested instead.
+    end:
+        Exclusive last date of the window; ``None`` means up to today.
+    period:
+        yfinance period string used when ``start`` is not given.
+    chunk_size:
+        Maximum number of symbols per provider call when no ``client`` is
+        given.
+    cache:
+        Optional on-disk cache. When given, only bars missing from it are
+        downloaded and every lookup is served from the cache.
+    client:
+        Client used for downloads; a default yfinance client otherwise.
+        Tickers it could not fetch are kept in ``failures``.
+    """
+
+    def __init__(
+        self,
+        start: str | pd.Timestamp | None = None,
+        period: str = "5d",
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        cache: PriceCache | None = None,
+        end: str | pd.Timestamp | None = None,
+        client: AsyncMarketDataClient | None = None,
+    ) -> None:
+        self.start = start
+        self.end = end
+        self.period = period
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.client = client or AsyncMarketDataClient(chunk_size=chunk_size)
+        self.failures: dict[str, str] = {}
+        self._frames: dict[str, pd.DataFrame] = {}
+        self._fetched: set[str] = set()
+
+    def prefetch(self, tickers: Iterable[str]) -> None:
+        """Download every ticker not yet held by the session in one batch.
+
+        Failed tickers are recorded in ``failures`` and not retried for the
+        rest of the session.
+        """
+
+        missing = [t for t in _unique(tickers) if t not in self._fetched]
+        if not missing:
+            return
+        if self.cache is not None:
+            self._frames.update(self._read_through_cache(missing))
+        else:
+            window: dict[str, object] = (
+                {"start": self.start} if self.start is not None else {"period": self.period}
+            )
+            if self.end is not None:
+                window["end"] = self.end
+            self._frames.update(self._download(missing, **window))
+        self._fetched.update(missing)
+
+    def _download(self, tickers: list[str], **window: object) -> dict[str, pd.DataFrame]:
+        result = self.client.fetch_sync(tickers, **window)
+        report_failures(result.failed)
+        self.failures.update(result.failed)
+        return result.frames
+
+    def _cache_start(self) -> pd.Timestamp:
+        """First date requested from the cache.
+
+        Period-based sessions are translated into a calendar lookback with
+        a week of slack so weekends and holidays still yield recent bars.
+        """
+
+        if self.start is not None:
+            return pd.Timestamp(self.start)
+        days = int(self.period.rstrip("d")) if self.period.endswith("d") else 30
+        return pd.Timestamp.today().normalize() - pd.Timedelta(days=days + 7)
+
+    def _read_through_cache(self, tickers: list[str]) -> dict[str, pd.DataFrame]:
+        """Download only ranges the cache lacks, then serve from the cache."""
+
+        assert self.cache is not None
+        start = self._cache_start()
+        plan = self.cache.plan(tickers, start, self.end)
+        with span("price_cache.refresh", tickers=sum(len(group) for group in plan.values())):
+            for (range_start, range_end), group in plan.items():
+                window: dict[str, object] = {"start": range_start}
+                if range_end is not None:
+                    window["end"] = range_end
+                fetched = self._download(group, **window)
+                for ticker in group:
+                    bars = fetched.get(ticker)
+                    if ticker in self.failures or bars is None or bars.empty:
+                        # Leave the range uncovered so the next run retries it
+                        continue
+                    self.cache.store(ticker, bars, range_start, range_end)
+        frames: dict[str, pd.DataFrame] = {}
+        with span("price_cache.load", tickers=len(tickers)) as sp:
+            for ticker in tickers:
+                bars = self.cache.load(ticker, start, self.end)
+                if not bars.empty:
+                    frames[ticker] = bars
+            if sp:
+                sp.set(rows=sum(len(bars) for bars in frames.values()))
+        return frames
+
+    def history(self, ticker: str) -> pd.DataFrame:
+        """Return the cached bars for ``ticker`` (empty when unavailable)."""
+
+        symbol = ticker.strip().upper()
+        self.prefetch([symbol])
+        frame = self._frames.get(symbol)
+        if frame is None:
+            return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+        return frame.dropna(subset=["Close"])
+
+    def close(self, ticker: str) -> float | None:
+        """Most recent close for ``ticker`` or ``None`` without data."""
+
+        bars = self.history(ticker)
+        return float(bars["Close"].iloc[-1]) if len(bars) >= 1 else None
+
+    def previous_close(self, ticker: str) -> float | None:
+        """Close of the bar before the most recent one, if available."""
+
+        bars = self.history(ticker)
+        return float(bars["Close"].iloc[-2]) if len(bars) >= 2 else None
+
+    def volume(self, ticker: str) -> float | None:
+        """Volume of the most recent bar for ``ticker``."""
+
+        bars = self.history(ticker)
+        return float(bars["Volume"].iloc[-1]) if len(bars) >= 1 else None
+
+    def latest_prices(self, tickers: Iterable[str]) -> pd.DataFrame:
+        """Return the most recent bar for each ticker as one table.
+
+        The result is indexed by ticker and has ``High``, ``Low``, ``Close``
+        and ``Volume`` columns. Tickers without data are present with ``NaN`` values so
+        the caller can vectorise over the whole book and flag missing
+        symbols.
+        """
+
+        symbols = _unique(tickers)
+        self.prefetch(symbols)
+        columns = ["High", "Low", "Close", "Volume"]
+        rows: dict[str, pd.Series] = {}
+        for ticker in symbols:
+            bars = self.history(ticker)
+            if not bars.empty:
+                rows[ticker] = bars.reindex(columns=columns).iloc[-1]
+        table = pd.DataFrame(rows).T if rows else pd.DataFrame(columns=columns)
+        return table.reindex(index=symbols, columns=columns).astype(float)
@@ -0,0 +1,509 @@
+"""Vectorised performance metrics for portfolio equity curves.
+
+Every function accepts either a single equity series (1-D) or many
+portfolios at once as a 2-D array shaped ``(portfolios, days)``. Curves of
+different lengths can be stacked by padding with ``NaN``; statistics only
+use the observed values of each row. Scalars come back for 1-D input and
+one value per portfolio for 2-D input.
+
+The Sharpe and Sortino ratios follow the definitions printed by
+``trading_script.daily_results``: the total return over the period minus
+the risk-free return for the same number of trading days, divided by the
+daily standard deviation scaled by the square root of the period length.
+
+``RunningStats`` keeps the same figures as a streaming state (Welford
+count, mean and M2 for all and for negative daily returns, plus the
+running peak) that is persisted next to the CSVs and updated with one
+TOTAL row per day instead of re-reading the whole history.
+"""
+
+import argparse
+import json
+import math
+import os
+import warnings
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from storage import StorageBackend, open_backend
+
+TRADING_DAYS = 252
+# Risk-free rate assumed by ``daily_results``
+RISK_FREE_ANNUAL = 0.045
+# Streaming statistics saved next to the portfolio CSV
+METRICS_STATE_NAME = "metrics_state.json"
+
+
+def _as_2d(values: object) -> tuple[np.ndarray, bool]:
+    """Return ``values`` as a float 2-D array and whether it was 1-D."""
+
+    array = np.asarray(values, dtype=float)
+    if array.ndim == 1:
+        return array[None, :], True
+    if array.ndim != 2:
+        raise ValueError("Equity must be a 1-D series or a 2-D (portfolios, days) array.")
+    return array, False
+
+
+def _finish(result: np.ndarray, was_1d: bool) -> np.ndarray | float:
+    return float(result[0]) if was_1d else result
+
+
+@contextmanager
+def _quiet() -> Iterator[None]:
+    """Silence the NumPy warnings raised for empty or all-NaN rows."""
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        yield
+
+
+def _first_valid(a: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(a)
+    idx = valid.argmax(axis=1)
+    out = a[np.arange(len(a)), idx]
+    return np.where(valid.any(axis=1), out, np.nan)
+
+
+def _last_valid(a: np.ndarray) -> np.ndarray:
+    return _first_valid(a[:, ::-1])
+
+
+def _nanstd(a: np.ndarray) -> np.ndarray:
+    """Sample standard deviation per row, ``NaN`` with fewer than 2 values."""
+
+    with _quiet():
+        return np.nanstd(a, axis=1, ddof=1)
+
+
+def observations(equity: object) -> np.ndarray | float:
+    """Number of observed equity values per portfolio."""
+
+    a, was_1d = _as_2d(equity)
+    return _finish((~np.isnan(a)).sum(axis=1).astype(float), was_1d)
+
+
+def daily_returns(equity: object) -> np.ndarray:
+    """Simple day-over-day returns; always returned as a 2-D array."""
+
+    a, _ = _as_2d(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return a[:, 1:] / a[:, :-1] - 1
+
+
+def total_return(equity: object) -> np.ndarray | float:
+    """Return from the first to the last observed equity value."""
+
+    a, was_1d = _as_2d(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = _last_valid(a) / _first_valid(a) - 1
+    return _finish(result, was_1d)
+
+
+def _excess_total_return(a: np.ndarray, rf_annual: float) -> tuple[np.ndarray, np.ndarray]:
+    n_days = (~np.isnan(a)).sum(axis=1)
+    rf_period = (1 + rf_annual) ** (n_days / TRADING_DAYS) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        excess = _last_valid(a) / _first_valid(a) - 1 - rf_period
+    return excess, n_days
+
+
+def sharpe_ratio(equity: object, rf_annual: float = RISK_FREE_ANNUAL) -> np.ndarray | float:
+    """Total-period Sharpe ratio as reported by ``daily_results``."""
+
+    a, was_1d = _as_2d(equity)
+    excess, n_days = _excess_total_return(a, rf_annual)
+    std = _nanstd(daily_returns(a))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = excess / (std * np.sqrt(n_days))
+    return _finish(result, was_1d)
+
+
+def sortino_ratio(equity: object, rf_annual: float = RISK_FREE_ANNUAL) -> np.ndarray | float:
+    """Total-period Sortino ratio using the spread of negative daily returns."""
+
+    a, was_1d = _as_2d(equity)
+    excess, n_days = _excess_total_return(a, rf_annual)
+    r = daily_returns(a)
+    with np.errstate(invalid="ignore"):
+        downside = np.where(r < 0, r, np.nan)
+    std = _nanstd(downside)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = excess / (std * np.sqrt(n_days))
+    return _finish(result, was_1d)
+
+
+def drawdown(equity: object) -> np.ndarray:
+    """Fractional drop from the running peak for every day (2-D, ``<= 0``)."""
+
+    a, _ = _as_2d(equity)
+    peak = np.fmax.accumulate(a, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return a / peak - 1
+
+
+def max_drawdown(equity: object) -> np.ndarray | float:
+    """Largest peak-to-trough loss as a negative fraction."""
+
+    a, was_1d = _as_2d(equity)
+    with _quiet():
+        result = np.nanmin(drawdown(a), axis=1)
+    return _finish(result, was_1d)
+
+
+def cagr(equity: object, periods_per_year: int = TRADING_DAYS) -> np.ndarray | float:
+    """Compound annual growth rate over the observed trading days."""
+
+    a, was_1d = _as_2d(equity)
+    years = ((~np.isnan(a)).sum(axis=1) - 1) / periods_per_year
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = _last_valid(a) / _first_valid(a)
+        result = np.where(years > 0, growth ** (1 / years) - 1, np.nan)
+    return _finish(result, was_1d)
+
+
+def calmar_ratio(equity: object, periods_per_year: int = TRADING_DAYS) -> np.ndarray | float:
+    """CAGR divided by the magnitude of the maximum drawdown."""
+
+    a, was_1d = _as_2d(equity)
+    growth = np.atleast_1d(cagr(a, periods_per_year))
+    mdd = np.atleast_1d(max_drawdown(a))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.where(mdd < 0, growth / -mdd, np.nan)
+    return _finish(result, was_1d)
+
+
+def rolling_volatility(
+    equity: object, window: int = 20, periods_per_year: int = TRADING_DAYS
+) -> np.ndarray:
+    """Annualised rolling standard deviation of daily returns.
+
+    Computed from cumulative sums so the cost is linear in the number of
+    days regardless of ``window``. The result is 2-D and aligned with the
+    returns; positions without a full window of observed returns are
+    ``NaN``.
+    """
+
+    if window < 2:
+        raise ValueError("window must be at least 2")
+    r = daily_returns(equity)
+    valid = ~np.isnan(r)
+    r0 = np.where(valid, r, 0.0)
+    pad = np.zeros((len(r), 1))
+    s1 = np.concatenate([pad, np.cumsum(r0, axis=1)], axis=1)
+    s2 = np.concatenate([pad, np.cumsum(r0 * r0, axis=1)], axis=1)
+    cnt = np.concatenate([pad, np.cumsum(valid, axis=1)], axis=1)
+
+    out = np.full(r.shape, np.nan)
+    if r.shape[1] < window:
+        return out
+    n = cnt[:, window:] - cnt[:, :-window]
+    sum1 = s1[:, window:] - s1[:, :-window]
+    sum2 = s2[:, window:] - s2[:, :-window]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = (sum2 - sum1 * sum1 / n) / (n - 1)
+    var = np.where(n == window, np.maximum(var, 0.0), np.nan)
+    out[:, window - 1 :] = np.sqrt(var * periods_per_year)
+    return out
+
+
+def beta_alpha(
+    equity: object,
+    benchmark: object,
+    rf_annual: float = RISK_FREE_ANNUAL,
+    periods_per_year: int = TRADING_DAYS,
+) -> tuple[np.ndarray | float, np.ndarray | float]:
+    """Beta and annualised Jensen's alpha against a benchmark.
+
+    Parameters
+    ----------
+    equity:
+        Portfolio equity, 1-D or ``(portfolios, days)``.
+    benchmark:
+        Benchmark prices on the same dates, either one series shared by
+        every portfolio or one row per portfolio.
+    """
+
+    a, was_1d = _as_2d(equity)
+    b, _ = _as_2d(benchmark)
+    rp = daily_returns(a)
+    rb = np.broadcast_to(daily_returns(b), rp.shape)
+    both = ~np.isnan(rp) & ~np.isnan(rb)
+    rp = np.where(both, rp, np.nan)
+    rb = np.where(both, rb, np.nan)
+    n = both.sum(axis=1)
+
+    with _quiet(), np.errstate(divide="ignore", invalid="ignore"):
+        mean_p = np.nanmean(rp, axis=1)
+        mean_b = np.nanmean(rb, axis=1)
+        dev_b = rb - mean_b[:, None]
+        cov = np.nansum((rp - mean_p[:, None]) * dev_b, axis=1) / (n - 1)
+        var = np.nansum(dev_b * dev_b, axis=1) / (n - 1)
+        beta = np.where(n > 1, cov / var, np.nan)
+
+    rf_daily = (1 + rf_annual) ** (1 / periods_per_year) - 1
+    alpha = ((mean_p - rf_daily) - beta * (mean_b - rf_daily)) * periods_per_year
+    return _finish(beta, was_1d), _finish(alpha, was_1d)
+
+
+def summarize(
+    curves: pd.DataFrame,
+    benchmark: pd.Series | None = None,
+    rf_annual: float = RISK_FREE_ANNUAL,
+) -> pd.DataFrame:
+    """Score many equity curves in one vectorised pass.
+
+    Parameters
+    ----------
+    curves:
+        Date-indexed frame with one column of ``Total Equity`` per
+        portfolio; missing days are ``NaN``.
+    benchmark:
+        Optional benchmark prices, aligned to ``curves`` by date, used for
+        beta and alpha.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per portfolio with the metrics as columns.
+    """
+
+    with span("metrics.summarize", curves=curves.shape[1], rows=curves.shape[0]):
+        a = curves.to_numpy(dtype=float).T
+        table = pd.DataFrame(
+            {
+                "Days": np.atleast_1d(observations(a)).astype(int),
+                "Final Equity": _last_valid(a),
+                "Total Return": np.atleast_1d(total_return(a)),
+                "CAGR": np.atleast_1d(cagr(a)),
+                "Sharpe": np.atleast_1d(sharpe_ratio(a, rf_annual)),
+                "Sortino": np.atleast_1d(sortino_ratio(a, rf_annual)),
+                "Max Drawdown": np.atleast_1d(max_drawdown(a)),
+                "Calmar": np.atleast_1d(calmar_ratio(a)),
+            },
+            index=curves.columns,
+        )
+        if benchmark is not None:
+            aligned = benchmark.reindex(curves.index).to_numpy(dtype=float)
+            beta, alpha = beta_alpha(a, aligned, rf_annual)
+            table["Beta"] = np.atleast_1d(beta)
+            table["Alpha"] = np.atleast_1d(alpha)
+        return table
+
+
+def load_equity_curves(data_dirs: Iterable[Path | str]) -> pd.DataFrame:
+    """Read the TOTAL equity rows of several data directories side by side.
+
+    Only the ``Date``, ``Ticker`` and ``Total Equity`` columns are read,
+    from whichever storage layout each directory uses. The result is
+    indexed by date with one column per directory.
+    """
+
+    curves: dict[str, pd.Series] = {}
+    for data_dir in data_dirs:
+        df = open_backend(data_dir).read_portfolio(["Date", "Ticker", "Total Equity"])
+        totals = df[df["Ticker"] == "TOTAL"].drop_duplicates("Date", keep="last")
+        curves[str(data_dir)] = pd.Series(
+            totals["Total Equity"].to_numpy(), index=totals["Date"]
+        )
+    return pd.DataFrame(curves).sort_index()
+
+
+@dataclass
+class RunningStats:
+    """Streaming equivalent of the full-history metrics for one portfolio.
+
+    Daily returns are folded in with Welford's algorithm, once over all
+    returns and once over negative returns only, so the Sharpe and Sortino
+    ratios match ``sharpe_ratio`` and ``sortino_ratio`` on the same TOTAL
+    series. ``previous`` holds the state before ``last_date`` so a day that
+    is processed again replaces its earlier contribution.
+    """
+
+    n_days: int = 0
+    first_equity: float = math.nan
+    last_equity: float = math.nan
+    last_date: str | None = None
+    ret_count: int = 0
+    ret_mean: float = 0.0
+    ret_m2: float = 0.0
+    down_count: int = 0
+    down_mean: float = 0.0
+    down_m2: float = 0.0
+    peak_equity: float = math.nan
+    max_drawdown: float = 0.0
+    previous: dict | None = field(default=None, repr=False)
+
+    def _snapshot(self) -> dict:
+        state = asdict(self)
+        state.pop("previous")
+        return state
+
+    def update(self, date: str, equity: float) -> "RunningStats":
+        """Fold in the TOTAL equity for ``date``.
+
+        Re-running the latest date replaces its contribution; dates older
+        than the latest one require a rebuild and raise ``ValueError``.
+        """
+
+        if self.last_date is not None and date < self.last_date:
+            raise ValueError(f"{date} is before the last recorded date {self.last_date}.")
+        if date == self.last_date:
+            base = self.previous or {}
+            for name, value in RunningStats(**base).__dict__.items():
+                setattr(self, name, value)
+        self.previous = self._snapshot()
+
+        equity = float(equity)
+        if self.n_days == 0:
+            self.first_equity = equity
+            self.peak_equity = equity
+        else:
+            ret = equity / self.last_equity - 1
+            self.ret_count, self.ret_mean, self.ret_m2 = _welford(
+                self.ret_count, self.ret_mean, self.ret_m2, ret
+            )
+            if ret < 0:
+                self.down_count, self.down_mean, self.down_m2 = _welford(
+                    self.down_count, self.down_mean, self.down_m2, ret
+                )
+            self.peak_equity = max(self.peak_equity, equity)
+            self.max_drawdown = min(self.max_drawdown, equity / self.peak_equity - 1)
+        self.n_days += 1
+        self.last_equity = equity
+        self.last_date = date
+        return self
+
+    @property
+    def total_return(self) -> float:
+        return self.last_equity / self.first_equity - 1
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.ret_m2 / (self.ret_count - 1)) if self.ret_count > 1 else math.nan
+
+    @property
+    def downside_std(self) -> float:
+        return math.sqrt(self.down_m2 / (self.down_count - 1)) if self.down_count > 1 else math.nan
+
+    def _ratio(self, spread: float, rf_annual: float) -> float:
+        rf_period = (1 + rf_annual) ** (self.n_days / TRADING_DAYS) - 1
+        denominator = spread * math.sqrt(self.n_days)
+        if math.isnan(denominator) or denominator == 0:
+            return math.nan
+        return (self.total_return - rf_period) / denominator
+
+    def sharpe_ratio(self, rf_annual: float = RISK_FREE_ANNUAL) -> float:
+        return self._ratio(self.std, rf_annual)
+
+    def sortino_ratio(self, rf_annual: float = RISK_FREE_ANNUAL) -> float:
+        return self._ratio(self.downside_std, rf_annual)
+
+    @classmethod
+    def from_totals(cls, dates: Iterable[str], equity: Iterable[float]) -> "RunningStats":
+        """Build the state by folding in a full TOTAL history."""
+
+        stats = cls()
+        for date, value in zip(dates, equity):
+            stats.update(str(date), float(value))
+        return stats
+
+    @classmethod
+    def load(cls, path: Path | str) -> "RunningStats | None":
+        """Read a saved state, or ``None`` when missing or unreadable."""
+
+        try:
+            with open(path) as handle:
+                state = _nulls_to_nan(json.load(handle))
+            if state.get("previous") is not None:
+                state["previous"] = _nulls_to_nan(state["previous"])
+            return cls(**state)
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+
+    def save(self, path: Path | str) -> None:
+        """Write the state atomically as strict JSON, NaN as ``null``."""
+
+        state = _nan_to_nulls(asdict(self))
+        if state["previous"] is not None:
+            state["previous"] = _nan_to_nulls(state["previous"])
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as handle:
+            json.dump(state, handle, allow_nan=False)
+        os.replace(tmp, path)
+
+
+# RunningStats fields that are None by design rather than a saved NaN
+_NULLABLE_STATS = ("last_date", "previous")
+
+
+def _nan_to_nulls(state: dict) -> dict:
+    return {
+        name: None if isinstance(value, float) and not math.isfinite(value) else value
+        for name, value in state.items()
+    }
+
+
+def _nulls_to_nan(state: dict) -> dict:
+    return {
+        name: math.nan if value is None and name not in _NULLABLE_STATS else value
+        for name, value in state.items()
+    }
+
+
+def _welford(count: int, mean: float, m2: float, value: float) -> tuple[int, float, float]:
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+
+def rebuild_running_stats(storage: StorageBackend | Path | str) -> RunningStats:
+    """Recompute the streaming state from every TOTAL row of a portfolio.
+
+    ``storage`` is a storage backend or a data directory. Used when no
+    saved state exists, when it does not line up with the history, and to
+    verify a saved state.
+    """
+
+    if isinstance(storage, (str, Path)):
+        storage = open_backend(storage)
+    with span("metrics.rebuild") as sp:
+        df = storage.read_portfolio(["Date", "Ticker", "Total Equity"])
+        totals = df[df["Ticker"] == "TOTAL"]
+        sp.set(rows=len(df), days=len(totals))
+        return RunningStats.from_totals(
+            totals["Date"].dt.strftime("%Y-%m-%d"), totals["Total Equity"].astype(float)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score portfolio data directories")
+    parser.add_argument("data_dirs", nargs="+", help="Directories with portfolio CSVs")
+    parser.add_argument(
+        "--rf",
+        type=float,
+        default=RISK_FREE_ANNUAL,
+        help="Annual risk-free rate used for Sharpe and Sortino",
+    )
+    parser.add_argument(
+        "--rebuild-state",
+        action="store_true",
+        help=f"Recompute {METRICS_STATE_NAME} in each directory from its CSV",
+    )
+    args = parser.parse_args()
+    if args.rebuild_state:
+        for data_dir in args.data_dirs:
+            state = rebuild_running_stats(data_dir)
+            state.save(Path(data_dir) / METRICS_STATE_NAME)
+            print(f"{data_dir}: rebuilt state over {state.n_days} days")
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        print(summarize(load_equity_curves(args.data_dirs), rf_annual=args.rf))
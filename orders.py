@@ -0,0 +1,214 @@
+"""Order files for running the trading script without prompts.
+
+An order file lists the manual buys and sells for one run, so the script
+can be scheduled instead of answering ``input()`` prompts. Orders are
+given as a JSON file, a CSV file or a Python list, and every order is
+checked against the starting portfolio and cash before anything is
+written.
+
+JSON files hold a list of objects (or ``{"orders": [...]}``) and CSV files
+have one order per row. Both use the same fields::
+
+    action,ticker,shares,price,stop_loss,reason,date
+    buy,ABEO,4,5.77,4.9,,
+    sell,IINN,6,1.41,,POSITION REDUCTION,
+
+The optional ``date`` column is only read by backtests.
+"""
+
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Mapping
+
+import pandas as pd
+
+from market_data import MarketDataSession
+
+ORDER_FIELDS = ["action", "ticker", "shares", "price", "stop_loss", "reason", "date"]
+
+# Accept the interactive shortcuts as well as the full words
+_ACTIONS = {"b": "buy", "buy": "buy", "s": "sell", "sell": "sell"}
+
+
+@dataclass
+class Order:
+    """One manual trade to apply before the daily update.
+
+    Parameters
+    ----------
+    action:
+        ``"buy"`` or ``"sell"``.
+    ticker:
+        Symbol to trade, upper-cased on load.
+    shares:
+        Number of shares bought or sold.
+    price:
+        Fill price per share.
+    stop_loss:
+        Stop loss for the position after a buy. Ignored for sells.
+    reason:
+        Text recorded in the trade log for a sell.
+    date:
+        Trading day the order is placed, ``YYYY-MM-DD``. Only used by
+        backtests; live runs apply every order to today.
+    """
+
+    action: str
+    ticker: str
+    shares: float
+    price: float
+    stop_loss: float | None = None
+    reason: str = ""
+    date: str | None = None
+
+    @classmethod
+    def from_mapping(cls, row: Mapping[str, object]) -> "Order":
+        """Build an order from a JSON object or CSV row."""
+
+        def number(field: str) -> float | None:
+            value = row.get(field)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                return None
+            try:
+                return float(value)  # type: ignore[arg-type]
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} must be a number, got {value!r}") from None
+
+        action = _ACTIONS.get(str(row.get("action", "")).strip().lower())
+        if action is None:
+            raise ValueError(f"action must be 'buy' or 'sell', got {row.get('action')!r}")
+        ticker = str(row.get("ticker") or "").strip().upper()
+        if not ticker:
+            raise ValueError("ticker is missing")
+        shares = number("shares")
+        price = number("price")
+        if shares is None or price is None:
+            raise ValueError("shares and price are required")
+        date = str(row.get("date") or "").strip()
+        if date:
+            try:
+                date = pd.Timestamp(date).strftime("%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"date must be YYYY-MM-DD, got {date!r}") from None
+        return cls(
+            action=action,
+            ticker=ticker,
+            shares=shares,
+            price=price,
+            stop_loss=number("stop_loss"),
+            reason=str(row.get("reason") or "").strip(),
+            date=date or None,
+        )
+
+
+# Anything ``load_orders`` accepts: a file path or a list of orders
+OrderSource = Path | str | Iterable[Order | Mapping[str, object]]
+
+
+def load_orders(source: OrderSource) -> list[Order]:
+    """Read orders from a JSON/CSV file or a list of mappings.
+
+    Parameters
+    ----------
+    source:
+        Path to a ``.json`` or ``.csv`` file, or an iterable of ``Order``
+        objects or dictionaries with the ``ORDER_FIELDS`` keys.
+
+    Raises
+    ------
+    ValueError
+        If the file type is unknown or any order cannot be parsed. The
+        message names every bad entry, not just the first.
+    """
+
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        suffix = path.suffix.lower()
+        if suffix == ".json":
+            with open(path) as handle:
+                data = json.load(handle)
+            rows = data.get("orders", []) if isinstance(data, dict) else data
+        elif suffix == ".csv":
+            with open(path, newline="") as handle:
+                rows = list(csv.DictReader(handle))
+        else:
+            raise ValueError(f"Order file must be .json or .csv, got {path.name}")
+    else:
+        rows = list(source)
+
+    orders: list[Order] = []
+    problems: list[str] = []
+    for number, row in enumerate(rows, start=1):
+        if isinstance(row, Order):
+            orders.append(row)
+            continue
+        try:
+            orders.append(Order.from_mapping(row))
+        except (AttributeError, ValueError) as exc:
+            problems.append(f"order {number}: {exc}")
+    if problems:
+        raise ValueError("Invalid orders:\n" + "\n".join(problems))
+    return orders
+
+
+def validate_orders(
+    orders: list[Order],
+    portfolio: pd.DataFrame,
+    cash: float,
+    session: MarketDataSession | None = None,
+) -> list[Order]:
+    """Check that ``orders`` can be applied in sequence.
+
+    Orders are replayed against the starting holdings and cash, so a sell
+    may rely on shares bought earlier in the same file and a buy must be
+    covered by the cash on hand at that point. When ``session`` is given,
+    every bought ticker must also have price data.
+
+    Raises
+    ------
+    ValueError
+        Listing every order that would fail, before any trade is logged.
+    """
+
+    holdings: dict[str, float] = {}
+    for ticker, shares in zip(portfolio["ticker"], portfolio["shares"]):
+        holdings[str(ticker)] = holdings.get(str(ticker), 0.0) + float(shares)
+    if session is not None:
+        session.prefetch(order.ticker for order in orders if order.action == "buy")
+
+    problems: list[str] = []
+    for number, order in enumerate(orders, start=1):
+        label = f"order {number} ({order.action} {order.ticker})"
+        if order.shares <= 0 or order.price <= 0:
+            problems.append(f"{label}: shares and price must be positive")
+            continue
+        if order.action == "buy":
+            if order.stop_loss is None or order.stop_loss <= 0:
+                problems.append(f"{label}: a positive stop_loss is required")
+                continue
+            if session is not None and session.close(order.ticker) is None:
+                problems.append(f"{label}: could not find ticker {order.ticker}")
+                continue
+            spend = order.price * order.shares
+            if spend > cash:
+                problems.append(f"{label}: costs {spend} but only {cash} cash is available")
+                continue
+            cash -= spend
+            holdings[order.ticker] = holdings.get(order.ticker, 0.0) + order.shares
+        else:
+            held = holdings.get(order.ticker)
+            if held is None:
+                problems.append(f"{label}: {order.ticker} is not in the portfolio")
+                continue
+            if order.shares > held:
+                problems.append(f"{label}: selling {order.shares} but only {held} held")
+                continue
+            cash += order.price * order.shares
+            holdings[order.ticker] = held - order.shares
+            if holdings[order.ticker] == 0:
+                del holdings[order.ticker]
+    if problems:
+        raise ValueError("Orders rejected:\n" + "\n".join(problems))
+    return orders
@@ -0,0 +1,253 @@
+"""Persistent on-disk cache of daily OHLCV bars.
+
+Bars are stored in a small SQLite database keyed by ticker and date. For
+each ticker the cache also remembers which date range has already been
+requested, so only the dates missing since the last finalised bar are
+downloaded again. A returned bar is treated as final and kept forever once
+its session has closed in New York; a bar captured intraday is refreshed
+on the next online run. Coverage only ever reaches the last bar actually
+returned, so tickers that came back empty or short are requested again.
+
+With ``offline`` enabled nothing is planned for download and every lookup
+is served from the database, which lets runs and tests work without a
+network connection.
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, time
+from pathlib import Path
+from typing import Iterable, Iterator
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+# Default file name used inside a data directory
+PRICE_CACHE_NAME = "price_cache.sqlite"
+# Set to "1" to force every cache into offline mode
+OFFLINE_ENV_VAR = "MICROCAP_OFFLINE"
+
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume REAL,
+    PRIMARY KEY (ticker, date)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    ticker TEXT PRIMARY KEY,
+    first_date TEXT NOT NULL,
+    final_through TEXT NOT NULL
+);
+"""
+
+
+def _day(value: str | pd.Timestamp) -> pd.Timestamp:
+    """Normalise a date-like value to midnight."""
+
+    return pd.Timestamp(value).normalize()
+
+
+def _iso(value: pd.Timestamp) -> str:
+    return value.strftime("%Y-%m-%d")
+
+
+def last_session(now: datetime | None = None, after: time = MARKET_CLOSE) -> pd.Timestamp:
+    """Date of the most recent US session that has passed ``after``.
+
+    With the default that is the last session that has already closed;
+    with ``MARKET_OPEN`` it is the last one that has started. Weekdays
+    count as sessions; a holiday simply has no bar, so it never moves
+    coverage past the last bar actually returned.
+    """
+
+    local = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    day = pd.Timestamp(local.date())
+    if local.time() < after:
+        day -= pd.Timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    return day
+
+
+class PriceCache:
+    """SQLite-backed store of daily bars with incremental refresh planning.
+
+    Parameters
+    ----------
+    path:
+        Location of the SQLite database. Parent directories are created.
+    offline:
+        Serve everything from the cache and never plan downloads. When
+        ``None`` the ``MICROCAP_OFFLINE`` environment variable decides.
+    """
+
+    def __init__(self, path: Path | str, offline: bool | None = None) -> None:
+        self.path = Path(path)
+        if offline is None:
+            offline = os.getenv(OFFLINE_ENV_VAR) == "1"
+        self.offline = offline
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection that commits on success and always closes."""
+
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _coverage(self, tickers: list[str]) -> dict[str, tuple[pd.Timestamp, pd.Timestamp]]:
+        if not tickers:
+            return {}
+        marks = ",".join("?" * len(tickers))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT ticker, first_date, final_through FROM coverage WHERE ticker IN ({marks})",
+                tickers,
+            ).fetchall()
+        return {t: (_day(first), _day(final)) for t, first, final in rows}
+
+    def plan(
+        self,
+        tickers: Iterable[str],
+        start: str | pd.Timestamp,
+        end: str | pd.Timestamp | None = None,
+    ) -> dict[tuple[str, str | None], list[str]]:
+        """Work out which date ranges still need downloading.
+
+        Parameters
+        ----------
+        tickers:
+            Symbols the caller wants bars for.
+        start, end:
+            Requested window; ``end`` is exclusive and ``None`` means up to
+            today.
+
+        Returns
+        -------
+        dict
+            Mapping of ``(start, end)`` ranges to the tickers missing that
+            range, so each group can be fetched with one batched request.
+            Empty in offline mode.
+        """
+
+        if self.offline:
+            return {}
+        symbols = list(dict.fromkeys(tickers))
+        first = _day(start)
+        stop = _day(end) if end is not None else None
+        coverage = self._coverage(symbols)
+        # Open-ended tails starting after the last opened session have no bars yet
+        opened = last_session(after=MARKET_OPEN)
+        plan: dict[tuple[str, str | None], list[str]] = {}
+
+        def add(range_start: pd.Timestamp, range_end: pd.Timestamp | None, ticker: str) -> None:
+            if range_end is not None and range_start >= range_end:
+                return
+            key = (_iso(range_start), _iso(range_end) if range_end is not None else None)
+            plan.setdefault(key, []).append(ticker)
+
+        for ticker in symbols:
+            if ticker not in coverage:
+                add(first, stop, ticker)
+                continue
+            covered_from, final_through = coverage[ticker]
+            if first < covered_from:
+                add(first, covered_from, ticker)
+            tail_start = max(first, final_through + pd.Timedelta(days=1))
+            if stop is None and tail_start > opened:
+                continue
+            add(tail_start, stop, ticker)
+        return plan
+
+    def store(
+        self,
+        ticker: str,
+        bars: pd.DataFrame,
+        start: str | pd.Timestamp,
+        end: str | pd.Timestamp | None = None,
+    ) -> None:
+        """Save downloaded ``bars`` and record ``[start, end)`` as fetched.
+
+        Coverage is marked final through the last returned bar, and no
+        further than the last closed US session, so an intraday bar is
+        refreshed on the next online run. Without any bars nothing is
+        recorded and the range is requested again.
+        """
+
+        if bars.empty:
+            return
+        frame = bars.reindex(columns=BAR_COLUMNS).dropna(subset=["Close"])
+        if frame.empty:
+            return
+        records = [
+            (ticker, _iso(pd.Timestamp(stamp)), *(float(row[c]) for c in BAR_COLUMNS))
+            for stamp, row in frame.iterrows()
+        ]
+        final = min(_day(frame.index.max()), last_session())
+        if end is not None:
+            final = min(final, _day(end) - pd.Timedelta(days=1))
+        first = _day(start)
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?)", records
+            )
+            current = conn.execute(
+                "SELECT first_date, final_through FROM coverage WHERE ticker = ?", (ticker,)
+            ).fetchone()
+            if current is not None:
+                first = min(first, _day(current[0]))
+                final = max(final, _day(current[1]))
+            conn.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)",
+                (ticker, _iso(first), _iso(final)),
+            )
+
+    def load(
+        self,
+        ticker: str,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame:
+        """Return cached bars for ``ticker`` within ``[start, end)``."""
+
+        query = "SELECT date, open, high, low, close, volume FROM bars WHERE ticker = ?"
+        params: list[str] = [ticker]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(_iso(_day(start)))
+        if end is not None:
+            query += " AND date < ?"
+            params.append(_iso(_day(end)))
+        query += " ORDER BY date"
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        frame = pd.DataFrame(rows, columns=["Date"] + BAR_COLUMNS)
+        frame["Date"] = pd.to_datetime(frame["Date"])
+        return frame.set_index("Date")
+
+    def last_date(self, ticker: str) -> pd.Timestamp | None:
+        """Date of the newest cached bar for ``ticker``."""
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MAX(date) FROM bars WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        return _day(row[0]) if row and row[0] else None
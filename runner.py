@@ -0,0 +1,280 @@
+"""Run several portfolio directories at once.
+
+Each directory is processed with its own ``PortfolioContext`` so nothing
+is shared through ``trading_script``'s module globals. Before any
+portfolio runs, the tickers of every job are combined and downloaded once
+into a shared ``MarketDataSession``. The portfolios then run in a thread
+or process pool and each directory's outcome is reported.
+
+Jobs are described in a JSON file::
+
+    [
+        {
+            "data_dir": "Scripts and CSV Files",
+            "cash": 31.58,
+            "portfolio": [{"ticker": "ABEO", "shares": 4, "stop_loss": 4.9,
+                           "buy_price": 5.77, "cost_basis": 23.08}],
+            "orders": "orders.csv",
+            "stops": {"trailing": 0.15, "take_profit": 0.5}
+        }
+    ]
+
+``stops`` takes the fields of ``stops.StopRules``.
+
+Runs are headless: a job without ``orders`` makes no trades and nothing
+prompts for input.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from market_client import AsyncMarketDataClient
+from market_data import MarketDataSession
+from metrics import METRICS_STATE_NAME, RunningStats
+from orders import Order, OrderSource, load_orders
+from price_cache import PRICE_CACHE_NAME, PriceCache
+from stops import StopRules
+from trading_script import (
+    SPX_START_DATE,
+    PortfolioContext,
+    as_portfolio_frame,
+    required_tickers,
+    run_portfolio,
+)
+
+
+@dataclass
+class PortfolioJob:
+    """One portfolio directory to process.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the portfolio's history and trade log.
+    portfolio:
+        Current positions, in any form ``main`` accepts.
+    cash:
+        Cash balance before today's trades.
+    orders:
+        Trades to apply, as an order file or list. ``None`` means no trades.
+    backend:
+        Storage layout, ``"csv"`` or ``"parquet"``. ``None`` detects it.
+    rules:
+        Trailing-stop and take-profit rules. ``None`` checks only the
+        positions' stop losses.
+    """
+
+    data_dir: Path
+    portfolio: list[dict[str, object]] | dict | pd.DataFrame
+    cash: float
+    orders: OrderSource | None = None
+    backend: str | None = None
+    rules: StopRules | None = None
+
+
+@dataclass
+class RunResult:
+    """Outcome of one job, reported once every portfolio has finished."""
+
+    data_dir: Path
+    status: str
+    cash: float | None = None
+    equity: float | None = None
+    positions: int | None = None
+    seconds: float = 0.0
+    error: str = ""
+
+
+@dataclass
+class _Prepared:
+    job: PortfolioJob
+    portfolio: pd.DataFrame
+    orders: list[Order] = field(default_factory=list)
+
+
+def load_jobs(path: Path | str) -> list[PortfolioJob]:
+    """Read job definitions from a JSON file.
+
+    Relative ``data_dir`` and ``orders`` paths are resolved against the
+    directory containing the job file.
+    """
+
+    path = Path(path)
+    with open(path) as handle:
+        entries = json.load(handle)
+    base = path.resolve().parent
+    jobs = []
+    for entry in entries:
+        orders = entry.get("orders")
+        if isinstance(orders, str):
+            orders = base / orders
+        jobs.append(
+            PortfolioJob(
+                data_dir=base / entry["data_dir"],
+                portfolio=entry.get("portfolio", []),
+                cash=float(entry["cash"]),
+                orders=orders,
+                backend=entry.get("backend"),
+                rules=StopRules(**entry["stops"]) if entry.get("stops") else None,
+            )
+        )
+    return jobs
+
+
+def _run_job(
+    prepared: _Prepared, session: MarketDataSession, when: datetime
+) -> RunResult:
+    """Process one job against the shared session; never raises."""
+
+    job = prepared.job
+    started = time.perf_counter()
+    try:
+        ctx = PortfolioContext.create(job.data_dir, job.backend, when)
+        portfolio, cash = run_portfolio(
+            prepared.portfolio, job.cash, session, prepared.orders, ctx, job.rules
+        )
+        stats = RunningStats.load(ctx.data_dir / METRICS_STATE_NAME)
+        return RunResult(
+            data_dir=job.data_dir,
+            status="ok",
+            cash=round(cash, 2),
+            equity=stats.last_equity if stats is not None else None,
+            positions=len(portfolio),
+            seconds=time.perf_counter() - started,
+        )
+    except Exception as exc:  # reported per directory instead of aborting the batch
+        return RunResult(
+            data_dir=job.data_dir,
+            status="failed",
+            seconds=time.perf_counter() - started,
+            error=f"{type(exc).__name__}: {exc}",
+        )
+
+
+def run_portfolios(
+    jobs: list[PortfolioJob],
+    workers: int = 4,
+    processes: bool = False,
+    cache_path: Path | str | None = None,
+    offline: bool | None = None,
+    client: AsyncMarketDataClient | None = None,
+) -> list[RunResult]:
+    """Process every job in parallel after one shared price download.
+
+    Parameters
+    ----------
+    jobs:
+        Portfolio directories to process. Each directory may appear once.
+    workers:
+        Size of the pool.
+    processes:
+        Use a process pool instead of threads. The prefetched session is
+        pickled to each worker, so no worker downloads again.
+    cache_path:
+        Optional ``PriceCache`` database shared by all jobs.
+    offline:
+        Serve prices only from ``cache_path``.
+    client:
+        Market data client for the shared download; yfinance by default.
+
+    Returns
+    -------
+    list[RunResult]
+        One result per job, in job order. Jobs that fail validation or
+        raise while running are reported as ``"failed"``; the others still
+        complete.
+    """
+
+    seen: set[Path] = set()
+    for job in jobs:
+        resolved = Path(job.data_dir).resolve()
+        if resolved in seen:
+            raise ValueError(f"{job.data_dir} is listed more than once")
+        seen.add(resolved)
+
+    results: dict[int, RunResult] = {}
+    prepared: dict[int, _Prepared] = {}
+    for i, job in enumerate(jobs):
+        try:
+            portfolio = as_portfolio_frame(job.portfolio)
+            orders = load_orders(job.orders) if job.orders is not None else []
+        except (KeyError, ValueError, OSError) as exc:
+            results[i] = RunResult(
+                data_dir=job.data_dir, status="failed", error=f"{type(exc).__name__}: {exc}"
+            )
+            continue
+        prepared[i] = _Prepared(job, portfolio, orders)
+
+    # Every ticker is downloaded once, however many portfolios hold it
+    cache = PriceCache(cache_path, offline=offline) if cache_path is not None else None
+    session = MarketDataSession(start=SPX_START_DATE, cache=cache, client=client)
+    tickers: list[str] = []
+    for item in prepared.values():
+        tickers += required_tickers(item.portfolio, item.orders)
+    session.prefetch(tickers)
+
+    when = datetime.now()
+    pool: Executor = (
+        ProcessPoolExecutor(max_workers=workers)
+        if processes
+        else ThreadPoolExecutor(max_workers=workers)
+    )
+    with pool:
+        futures = {
+            i: pool.submit(_run_job, item, session, when) for i, item in prepared.items()
+        }
+        for i, future in futures.items():
+            results[i] = future.result()
+    return [results[i] for i in range(len(jobs))]
+
+
+def print_report(results: list[RunResult]) -> None:
+    """Print one status line per portfolio directory."""
+
+    print("\nPortfolio run summary")
+    for result in results:
+        if result.status == "ok":
+            equity = f"{result.equity:.2f}" if result.equity is not None else "n/a"
+            print(
+                f"  {result.data_dir}: ok, {result.positions} positions, "
+                f"cash {result.cash:.2f}, equity {equity} ({result.seconds:.1f}s)"
+            )
+        else:
+            print(f"  {result.data_dir}: FAILED - {result.error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process several portfolio directories")
+    parser.add_argument("jobs", type=Path, help="JSON file describing the portfolios")
+    parser.add_argument("--workers", type=int, default=4, help="pool size")
+    parser.add_argument(
+        "--processes", action="store_true", help="use processes instead of threads"
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=Path(PRICE_CACHE_NAME),
+        help="price cache shared by every portfolio",
+    )
+    parser.add_argument(
+        "--offline", action="store_true", help="read prices only from the cache"
+    )
+    args = parser.parse_args()
+
+    results = run_portfolios(
+        load_jobs(args.jobs),
+        workers=args.workers,
+        processes=args.processes,
+        cache_path=args.cache,
+        offline=args.offline or None,
+    )
+    print_report(results)
+    if any(result.status != "ok" for result in results):
+        raise SystemExit(1)
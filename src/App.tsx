@@ -1,62 +1,60 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import { Navigation } from './components/Navigation';
 import { Dashboard } from './components/Dashboard';
 import { HoldingsTable } from './components/HoldingsTable';
 import { TradeHistory } from './components/TradeHistory';
 import { Research } from './components/Research';
 import { About } from './components/About';
-import { loadPortfolioData, loadTradeData } from './utils/csvLoader';
-import { processPerformanceData, getCurrentHoldings, calculatePortfolioMetrics } from './utils/dataParser';
-import { PortfolioEntry, TradeEntry, PerformanceData, CurrentHolding, PortfolioMetrics } from './types';
+import { applyEquityDelta, applyHoldingsDelta, loadPortfolio, subscribePortfolio } from './api/portfolio';
+import { processPerformanceData, calculatePortfolioMetrics } from './utils/dataParser';
+import { EquityPoint, TradeEntry, CurrentHolding, PortfolioSummary } from './types';
 
 function App() {
   const [activeTab, setActiveTab] = useState('dashboard');
-  const [, setPortfolioData] = useState<PortfolioEntry[]>([]);
+  const [equity, setEquity] = useState<EquityPoint[]>([]);
   const [tradeData, setTradeData] = useState<TradeEntry[]>([]);
-  const [performanceData, setPerformanceData] = useState<PerformanceData[]>([]);
   const [currentHoldings, setCurrentHoldings] = useState<CurrentHolding[]>([]);
-  const [metrics, setMetrics] = useState<PortfolioMetrics>({
-    totalEquity: 100,
-    totalReturn: 0,
-    totalReturnPercent: 0,
-    spxReturn: 0,
-    spxReturnPercent: 0,
-    alpha: 0,
-    cash: 100,
-    investedValue: 0,
-    dayChange: 0,
-    dayChangePercent: 0,
-  });
+  const [summary, setSummary] = useState<PortfolioSummary | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
+  const performanceData = useMemo(() => processPerformanceData(equity), [equity]);
+  const metrics = useMemo(
+    () => calculatePortfolioMetrics(summary, performanceData),
+    [summary, performanceData]
+  );
+
   useEffect(() => {
-    const loadData = async () => {
+    // Version of the data loaded over REST, and the one the stream's next
+    // delta starts from; null until known
+    let dataVersion: string | null = null;
+    let streamVersion: string | null = null;
+
+    const loadData = async (quiet = false) => {
+      const beforeReady = streamVersion === null;
       try {
-        setLoading(true);
+        if (!quiet) {
+          setLoading(true);
+        }
         setError(null);
         
-        const [portfolio, trades] = await Promise.all([
-          loadPortfolioData(),
-          loadTradeData()
-        ]);
+        const snapshot = await loadPortfolio();
         
-        if (portfolio.length === 0) {
+        if (snapshot.equity.length === 0) {
           throw new Error('No portfolio data available');
         }
         
-        setPortfolioData(portfolio);
-        setTradeData(trades);
-        
-        const performance = processPerformanceData(portfolio);
-        setPerformanceData(performance);
-        
-        const holdings = getCurrentHoldings(portfolio);
-        setCurrentHoldings(holdings);
-        
-        const portfolioMetrics = calculatePortfolioMetrics(portfolio, performance);
-        setMetrics(portfolioMetrics);
-        
+        setEquity(snapshot.equity);
+        setCurrentHoldings(snapshot.holdings);
+        setSummary(snapshot.summary);
+        setTradeData(snapshot.trades);
+        dataVersion = snapshot.version;
+
+        // Data read before the stream was ready can be older than where
+        // its deltas start, and no delta would bring it up to date
+        if (beforeReady && streamVersion !== null && dataVersion !== streamVersion) {
+          loadData(true);
+        }
       } catch (err) {
         console.error('Error loading data:', err);
         setError(err instanceof Error ? err.message : 'Failed to load data');
@@ -66,6 +64,38 @@ function App() {
     };
 
     loadData();
+    // Apply the server's deltas in place when they continue from the loaded
+    // data. Anything else (a reset, a stream that starts elsewhere) means
+    // everything is fetched again, so no change is shown twice.
+    return subscribePortfolio(
+      version => {
+        streamVersion = version;
+        if (dataVersion !== null && dataVersion !== version) {
+          loadData(true);
+        }
+      },
+      delta => {
+        streamVersion = delta.version;
+        if (delta.version === dataVersion) {
+          // Already part of what was loaded over REST
+          return;
+        }
+        if (delta.reset || delta.base !== dataVersion) {
+          loadData(true);
+          return;
+        }
+        dataVersion = delta.version;
+        setEquity(points => applyEquityDelta(points, delta));
+        setCurrentHoldings(holdings => applyHoldingsDelta(holdings, delta));
+        if (delta.trades?.length) {
+          const added = delta.trades;
+          setTradeData(trades => [...added, ...trades]);
+        }
+        if (delta.metrics) {
+          setSummary(delta.metrics);
+        }
+      }
+    );
   }, []);
 
   if (loading) {
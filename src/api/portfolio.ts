@@ -0,0 +1,119 @@
+import {
+  CurrentHolding,
+  EquityPoint,
+  PortfolioDelta,
+  PortfolioSnapshot,
+  PortfolioSummary,
+  TradeEntry,
+  TradePage,
+} from '../types';
+
+const API_BASE_URL = '/api/portfolio';
+// Largest page the server returns
+const MAX_TRADES_PER_PAGE = 500;
+// Data version of a response, the same one the stream's events carry
+const VERSION_HEADER = 'X-Portfolio-Version';
+
+// The server sends ETag/Last-Modified with no-cache, so the browser
+// revalidates each request and gets a 304 while the CSV files are unchanged.
+// Response versions are added to `versions` when given.
+const getJson = async <T>(path: string, versions?: Set<string>): Promise<T> => {
+  const response = await fetch(`${API_BASE_URL}${path}`);
+
+  if (!response.ok) {
+    throw new Error(`Portfolio API error: ${response.status}`);
+  }
+
+  versions?.add(response.headers.get(VERSION_HEADER) ?? '');
+  return await response.json();
+};
+
+export const getEquityCurve = (since?: string): Promise<EquityPoint[]> =>
+  getJson(since ? `/equity?since=${encodeURIComponent(since)}` : '/equity');
+
+// Appends the days after the last point already loaded
+export const refreshEquityCurve = async (points: EquityPoint[]): Promise<EquityPoint[]> => {
+  const last = points[points.length - 1];
+  if (!last) {
+    return getEquityCurve();
+  }
+  return [...points, ...(await getEquityCurve(last.date))];
+};
+
+export const getHoldings = (): Promise<CurrentHolding[]> => getJson('/holdings');
+
+export const getPortfolioSummary = (): Promise<PortfolioSummary> => getJson('/metrics');
+
+export const getTrades = (
+  page = 1,
+  perPage = 50,
+  since?: string,
+  versions?: Set<string>
+): Promise<TradePage> => {
+  const params = new URLSearchParams({ page: String(page), per_page: String(perPage) });
+  if (since) {
+    params.set('since', since);
+  }
+  return getJson(`/trades?${params}`, versions);
+};
+
+// Every trade, newest first, read page by page at the largest page size
+export const getAllTrades = async (versions?: Set<string>): Promise<TradeEntry[]> => {
+  const first = await getTrades(1, MAX_TRADES_PER_PAGE, undefined, versions);
+  const rest = await Promise.all(
+    Array.from({ length: Math.max(first.pages - 1, 0) }, (_, i) =>
+      getTrades(i + 2, MAX_TRADES_PER_PAGE, undefined, versions)
+    )
+  );
+  return [first, ...rest].flatMap(page => page.items);
+};
+
+// Everything the dashboard shows, tagged with the data version it is from
+export const loadPortfolio = async (): Promise<PortfolioSnapshot> => {
+  const versions = new Set<string>();
+  const [equity, holdings, summary, trades] = await Promise.all([
+    getJson<EquityPoint[]>('/equity', versions),
+    getJson<CurrentHolding[]>('/holdings', versions),
+    getJson<PortfolioSummary>('/metrics', versions),
+    getAllTrades(versions),
+  ]);
+  const [version] = versions;
+  return { equity, holdings, summary, trades, version: versions.size === 1 && version ? version : null };
+};
+
+// Live changes from the server's shared file watcher. `onReady` gets the
+// version the following deltas start from, again after every reconnect.
+// Returns a function that closes the stream. EventSource reconnects on its
+// own after errors.
+export const subscribePortfolio = (
+  onReady: (version: string) => void,
+  onDelta: (delta: PortfolioDelta) => void
+): (() => void) => {
+  const source = new EventSource(`${API_BASE_URL}/stream`);
+  source.addEventListener('ready', event => {
+    onReady(JSON.parse((event as MessageEvent).data).version);
+  });
+  source.addEventListener('delta', event => {
+    onDelta(JSON.parse((event as MessageEvent).data));
+  });
+  return () => source.close();
+};
+
+// Applies the equity and holdings parts of a delta to already loaded data
+export const applyEquityDelta = (points: EquityPoint[], delta: PortfolioDelta): EquityPoint[] => {
+  if (!delta.equity?.length) {
+    return points;
+  }
+  const byDate = new Map(points.map(point => [point.date, point]));
+  delta.equity.forEach(point => byDate.set(point.date, point));
+  return [...byDate.values()].sort((a, b) => a.date.localeCompare(b.date));
+};
+
+export const applyHoldingsDelta = (holdings: CurrentHolding[], delta: PortfolioDelta): CurrentHolding[] => {
+  const removed = new Set(delta.removed ?? []);
+  const byTicker = new Map(
+    holdings.filter(holding => !removed.has(holding.ticker)).map(holding => [holding.ticker, holding])
+  );
+  (delta.holdings ?? []).forEach(holding => byTicker.set(holding.ticker, holding));
+  return [...byTicker.values()];
+};
@@ -1,28 +1,130 @@
-import { ResearchRequest, ResearchResult } from '../types';
+import {
+  ResearchBatchRequest,
+  ResearchBatchSummary,
+  ResearchJob,
+  ResearchRequest,
+  ResearchResult,
+} from '../types';
 
 const API_BASE_URL = '/api';
 
-export const generateResearch = async (request: ResearchRequest): Promise<ResearchResult> => {
-  try {
-    const response = await fetch(`${API_BASE_URL}/research`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify(request),
-    });
+// Seconds each status request may be held open by the server
+const JOB_WAIT_SECONDS = 20;
 
-    if (!response.ok) {
-      throw new Error(`Research API error: ${response.status}`);
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+export const submitResearchJob = async (request: ResearchRequest): Promise<ResearchJob> => {
+  const response = await fetch(`${API_BASE_URL}/research/jobs`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(request),
+  });
+
+  if (!response.ok) {
+    throw new Error(`Research API error: ${response.status}`);
+  }
+
+  return await response.json();
+};
+
+export const getResearchJob = async (id: string, waitSeconds = 0): Promise<ResearchJob> => {
+  const response = await fetch(`${API_BASE_URL}/research/jobs/${id}?wait=${waitSeconds}`);
+
+  if (!response.ok) {
+    throw new Error(`Research job API error: ${response.status}`);
+  }
+
+  return await response.json();
+};
+
+// Follows a job until it finishes. Each poll is a long poll, so a result is
+// delivered as soon as it is ready without hammering the server.
+export const pollResearchJob = async (
+  job: ResearchJob,
+  onUpdate?: (job: ResearchJob) => void,
+): Promise<ResearchResult> => {
+  let current = job;
+  onUpdate?.(current);
+  while (current.status === 'queued' || current.status === 'running') {
+    try {
+      current = await getResearchJob(current.id, JOB_WAIT_SECONDS);
+    } catch (error) {
+      // Transient failures (restarts, timeouts) are retried after a pause
+      console.error('Research job API error:', error);
+      await sleep(2000);
+      continue;
     }
+    onUpdate?.(current);
+  }
+  if (current.status === 'failed' || !current.result) {
+    throw new Error(current.error || 'Research job failed');
+  }
+  return current.result;
+};
 
-    return await response.json();
+export const generateResearch = async (
+  request: ResearchRequest,
+  onUpdate?: (job: ResearchJob) => void,
+): Promise<ResearchResult> => {
+  try {
+    const job = await submitResearchJob(request);
+    return await pollResearchJob(job, onUpdate);
   } catch (error) {
     console.error('Research API error:', error);
     throw new Error('Failed to generate research. Please check your connection and try again.');
   }
 };
 
+// Streams a batch screen. Matching results are passed to onResult as each
+// ticker completes; the promise resolves with the server's summary.
+export const screenResearch = async (
+  request: ResearchBatchRequest,
+  onResult: (result: ResearchResult) => void,
+  onError?: (ticker: string, error: string) => void,
+): Promise<ResearchBatchSummary> => {
+  const response = await fetch(`${API_BASE_URL}/research/batch`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(request),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Research batch API error: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  let summary: ResearchBatchSummary | null = null;
+  for (;;) {
+    const { value, done } = await reader.read();
+    buffered += decoder.decode(value, { stream: !done });
+    const lines = buffered.split('\n');
+    buffered = done ? '' : lines.pop() ?? '';
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const item = JSON.parse(line);
+      if (item.summary) {
+        summary = item.summary;
+      } else if (item.error) {
+        onError?.(item.ticker, item.error);
+      } else {
+        onResult(item);
+      }
+    }
+    if (done) break;
+  }
+
+  if (!summary) {
+    throw new Error('Research batch ended before it finished');
+  }
+  return summary;
+};
+
 export const getResearchHistory = async (): Promise<ResearchResult[]> => {
   try {
     const response = await fetch(`${API_BASE_URL}/research/history`);
@@ -1,17 +1,3 @@
-export interface PortfolioEntry {
-  Date: string;
-  Ticker: string;
-  Shares: number | string;
-  'Cost Basis': number | string;
-  'Stop Loss': number | string;
-  'Current Price': number | string;
-  'Total Value': number | string;
-  PnL: number | string;
-  Action: string;
-  'Cash Balance': number | string;
-  'Total Equity': number | string;
-}
-
 export interface TradeEntry {
   Date: string;
   Ticker: string;
@@ -74,4 +60,80 @@ export interface ResearchResult {
   catalysts: string[];
   targetPrice?: number;
   stopLoss?: number;
-}
\ No newline at end of file
+}
+export interface ResearchJob {
+  id: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  request: ResearchRequest;
+  created: number;
+  started: number | null;
+  finished: number | null;
+  position?: number;
+  result?: ResearchResult;
+  error?: string;
+}
+
+export interface ResearchBatchRequest {
+  tickers: string[];
+  analysisType?: ResearchRequest['analysisType'];
+  timeframe?: ResearchRequest['timeframe'];
+  recommendation?: string | string[];
+  minConfidence?: number;
+}
+
+export interface ResearchBatchSummary {
+  requested: number;
+  matched: number;
+  failed: number;
+}
+
+export interface EquityPoint {
+  date: string;
+  equity: number;
+  cash: number | null;
+  invested: number | null;
+  pnl: number | null;
+  dailyReturn: number;
+}
+
+export interface PortfolioSummary {
+  date: string;
+  totalEquity: number;
+  cash: number | null;
+  investedValue: number | null;
+  startingEquity: number;
+  dayChange: number;
+  dayChangePercent: number | null;
+  [metric: string]: string | number | null;
+}
+
+export interface TradePage {
+  items: TradeEntry[];
+  page: number;
+  perPage: number;
+  total: number;
+  pages: number;
+}
+
+// Everything the dashboard loads over REST, with the data version all of
+// it came from (null if the files changed between the requests)
+export interface PortfolioSnapshot {
+  equity: EquityPoint[];
+  holdings: CurrentHolding[];
+  summary: PortfolioSummary;
+  trades: TradeEntry[];
+  version: string | null;
+}
+
+export interface PortfolioDelta {
+  // Data version the delta applies to (absent on a catch-up reset) and
+  // the one it produces
+  base?: string;
+  version: string;
+  reset?: boolean;
+  equity?: EquityPoint[];
+  holdings?: CurrentHolding[];
+  removed?: string[];
+  trades?: TradeEntry[];
+  metrics?: PortfolioSummary;
+}
@@ -1,15 +1,4 @@
-import Papa from 'papaparse';
-import { PortfolioEntry, PerformanceData, CurrentHolding, PortfolioMetrics } from '../types';
-
-export const parseCSV = <T>(csvText: string): T[] => {
-  const result = Papa.parse(csvText, {
-    header: true,
-    skipEmptyLines: true,
-    transformHeader: (header) => header.trim(),
-  });
-  
-  return result.data as T[];
-};
+import { EquityPoint, PerformanceData, PortfolioMetrics, PortfolioSummary } from '../types';
 
 export const calculateSPXValue = (date: string): number => {
   // S&P 500 baseline from June 27, 2025: 6173.07
@@ -49,9 +38,7 @@ export const calculateSPXValue = (date: string): number => {
   return price * scalingFactor;
 };
 
-export const processPerformanceData = (portfolioData: PortfolioEntry[]): PerformanceData[] => {
-  const totalEntries = portfolioData.filter(entry => entry.Ticker === 'TOTAL');
-  
+export const processPerformanceData = (equity: EquityPoint[]): PerformanceData[] => {
   // Add baseline entry
   const baselineEntry: PerformanceData = {
     date: '2025-06-27',
@@ -60,68 +47,21 @@ export const processPerformanceData = (portfolioData: PortfolioEntry[]): Perform
     dailyReturn: 0,
   };
   
-  const performanceData = totalEntries.map((entry, index) => {
-    const portfolioValue = Number(entry['Total Equity']) || 0;
-    const spxValue = calculateSPXValue(entry.Date);
-    
-    let dailyReturn = 0;
-    if (index > 0) {
-      const prevValue = Number(totalEntries[index - 1]['Total Equity']) || 100;
-      dailyReturn = ((portfolioValue - prevValue) / prevValue) * 100;
-    }
-    
-    return {
-      date: entry.Date,
-      portfolioValue,
-      spxValue,
-      dailyReturn,
-    };
-  });
+  const performanceData = equity.map(point => ({
+    date: point.date,
+    portfolioValue: point.equity,
+    spxValue: calculateSPXValue(point.date),
+    dailyReturn: point.dailyReturn,
+  }));
   
   return [baselineEntry, ...performanceData];
 };
 
-export const getCurrentHoldings = (portfolioData: PortfolioEntry[]): CurrentHolding[] => {
-  const latestDate = portfolioData
-    .filter(entry => entry.Ticker !== 'TOTAL')
-    .reduce((latest, entry) => {
-      return new Date(entry.Date) > new Date(latest) ? entry.Date : latest;
-    }, '2025-01-01');
-  
-  const latestEntries = portfolioData.filter(
-    entry => entry.Date === latestDate && entry.Ticker !== 'TOTAL'
-  );
-  
-  return latestEntries.map(entry => {
-    const shares = Number(entry.Shares) || 0;
-    const costBasis = Number(entry['Cost Basis']) || 0;
-    const currentPrice = Number(entry['Current Price']) || 0;
-    const totalValue = Number(entry['Total Value']) || 0;
-    const pnl = Number(entry.PnL) || 0;
-    const stopLoss = Number(entry['Stop Loss']) || 0;
-    
-    return {
-      ticker: entry.Ticker,
-      shares,
-      costBasis: costBasis / shares,
-      currentPrice,
-      totalValue,
-      pnl,
-      pnlPercent: costBasis > 0 ? (pnl / costBasis) * 100 : 0,
-      stopLoss,
-    };
-  });
-};
-
 export const calculatePortfolioMetrics = (
-  portfolioData: PortfolioEntry[],
+  summary: PortfolioSummary | null,
   performanceData: PerformanceData[]
 ): PortfolioMetrics => {
-  const latestTotal = portfolioData
-    .filter(entry => entry.Ticker === 'TOTAL')
-    .slice(-1)[0];
-  
-  if (!latestTotal) {
+  if (!summary || summary.totalEquity == null) {
     return {
       totalEquity: 100,
       totalReturn: 0,
@@ -136,9 +76,9 @@ export const calculatePortfolioMetrics = (
     };
   }
   
-  const totalEquity = Number(latestTotal['Total Equity']) || 100;
-  const cash = Number(latestTotal['Cash Balance']) || 0;
-  const investedValue = totalEquity - cash;
+  const totalEquity = summary.totalEquity;
+  const cash = summary.cash ?? 0;
+  const investedValue = summary.investedValue ?? totalEquity - cash;
   
   const totalReturn = totalEquity - 100;
   const totalReturnPercent = ((totalEquity - 100) / 100) * 100;
@@ -149,17 +89,6 @@ export const calculatePortfolioMetrics = (
   
   const alpha = totalReturnPercent - spxReturnPercent;
   
-  // Calculate day change
-  let dayChange = 0;
-  let dayChangePercent = 0;
-  
-  if (performanceData.length >= 2) {
-    const today = performanceData[performanceData.length - 1];
-    const yesterday = performanceData[performanceData.length - 2];
-    dayChange = today.portfolioValue - yesterday.portfolioValue;
-    dayChangePercent = ((today.portfolioValue - yesterday.portfolioValue) / yesterday.portfolioValue) * 100;
-  }
-  
   return {
     totalEquity,
     totalReturn,
@@ -169,7 +98,7 @@ export const calculatePortfolioMetrics = (
     alpha,
     cash,
     investedValue,
-    dayChange,
-    dayChangePercent,
+    dayChange: summary.dayChange,
+    dayChangePercent: summary.dayChangePercent ?? 0,
   };
-};
\ No newline at end of file
+};
@@ -0,0 +1,368 @@
+"""Rebuild current holdings and cash from the trade log.
+
+The trade log records every buy and sell, so the portfolio at any point
+is the starting state with the logged trades applied in order. A
+starting-state record (``portfolio_start.json``) holds the cash and any
+positions held before the first logged trade. ``rebuild_state`` folds the
+trade log into it through a ``PositionLedger``:
+- ``MANUAL BUY`` rows open lots and spend cash.
+- ``MANUAL SELL`` and stop-loss rows relieve lots and add the proceeds.
+
+The trade log has no stop-loss column, so stops come from the latest
+portfolio snapshot for every ticker it lists.
+
+While folding, the state is checkpointed every ``CHECKPOINT_EVERY``
+trades to ``portfolio_checkpoints.json``. The next rebuild starts from
+the newest checkpoint that still matches the log and replays only the
+trades logged after it. If the log was rewritten behind a checkpoint,
+that checkpoint is skipped.
+
+Record a starting state with ``python state.py DATA_DIR --cash 100``, or
+take it from the first day of an existing history with ``--from-history``.
+"""
+
+import argparse
+import json
+import math
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import cast
+
+import pandas as pd
+
+from ledger import RELIEF_METHODS, Lot, PositionLedger
+from storage import StorageBackend, open_backend
+
+STATE_START_NAME = "portfolio_start.json"
+STATE_CHECKPOINTS_NAME = "portfolio_checkpoints.json"
+# Trades folded between checkpoints, and how many checkpoints are kept
+CHECKPOINT_EVERY = 25
+CHECKPOINT_KEEP = 5
+
+_TRADE_COLUMNS = ["Date", "Ticker", "Shares Bought", "Buy Price", "Reason", "Shares Sold", "Sell Price"]
+
+
+@dataclass
+class PortfolioState:
+    """Cash and open lots after the first ``trades`` rows of the trade log.
+
+    Parameters
+    ----------
+    cash:
+        Cash balance.
+    lots:
+        Open lots as ``Lot`` fields (``ticker``, ``shares``, ``price``,
+        ``stop_loss``, ``date``, ``cost_price``).
+    trades:
+        Number of trade log rows already folded in.
+    date:
+        Date of the last folded row, ``None`` before any trade.
+    on_date:
+        How many of the folded rows are dated ``date``. Together with
+        ``date`` this finds the first unfolded row without counting the
+        whole log.
+    method:
+        Relief method the lots were folded with.
+    """
+
+    cash: float
+    lots: list[dict[str, object]] = field(default_factory=list)
+    trades: int = 0
+    date: str | None = None
+    on_date: int = 0
+    method: str = "fifo"
+
+    def ledger(self, method: str = "fifo") -> PositionLedger:
+        ledger = PositionLedger(method)
+        for lot in self.lots:
+            fields = dict(lot)
+            if fields.get("stop_loss") is None:
+                # Unknown stops are saved as null
+                fields["stop_loss"] = math.nan
+            ledger.buy(**fields)  # type: ignore[arg-type]
+        return ledger
+
+    def portfolio(self) -> pd.DataFrame:
+        """Open positions in the portfolio DataFrame shape, one row per ticker."""
+
+        return self.ledger().to_frame()
+
+    @classmethod
+    def load(cls, path: Path | str) -> "PortfolioState | None":
+        """Read a saved state, or ``None`` when missing or unreadable."""
+
+        try:
+            with open(path) as handle:
+                return cls(**json.load(handle))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, path: Path | str) -> None:
+        """Write the state atomically as JSON."""
+
+        _write_json(path, asdict(self))
+
+
+def _json_safe(value: object) -> object:
+    """``value`` with NaN and infinite floats replaced by ``None``."""
+
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+def _write_json(path: Path | str, data: object) -> None:
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as handle:
+        # Strict JSON: NaN would not parse outside Python
+        json.dump(_json_safe(data), handle, indent=1, allow_nan=False)
+    os.replace(tmp, path)
+
+
+def _lots(ledger: PositionLedger) -> list[dict[str, object]]:
+    return [
+        {name: getattr(lot, name) for name in Lot.__slots__}
+        for ticker in ledger.tickers()
+        for lot in ledger.lots(ticker)
+    ]
+
+
+def record_start(
+    data_dir: Path | str,
+    cash: float,
+    portfolio: pd.DataFrame | list[dict[str, object]] | None = None,
+    trades: int = 0,
+    date: str | None = None,
+    backend: str | None = None,
+) -> PortfolioState:
+    """Write the starting-state record for ``data_dir``.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the trade log.
+    cash:
+        Cash before the first trade that will be folded in.
+    portfolio:
+        Positions already held, in the portfolio DataFrame shape.
+    trades:
+        Leading trade log rows that ``cash`` and ``portfolio`` already
+        include. They are skipped by every rebuild.
+    date:
+        Date of the last of those rows.
+    backend:
+        Storage layout, ``"csv"`` or ``"parquet"``. ``None`` detects it.
+
+    Saved checkpoints are discarded, since they were built from the old
+    starting state.
+    """
+
+    if trades and date is None:
+        raise ValueError("date is required when the start already includes trades")
+    frame = pd.DataFrame(portfolio) if portfolio is not None else pd.DataFrame()
+    ledger = PositionLedger.from_frame(frame) if not frame.empty else PositionLedger()
+    on_date = _count_on_date(open_backend(data_dir, backend), date, trades) if trades else 0
+    state = PortfolioState(float(cash), _lots(ledger), trades, date, on_date)
+    state.save(Path(data_dir) / STATE_START_NAME)
+    Path(data_dir, STATE_CHECKPOINTS_NAME).unlink(missing_ok=True)
+    return state
+
+
+def _count_on_date(storage: StorageBackend, date: str | None, trades: int) -> int:
+    """How many of the first ``trades`` log rows are dated ``date``."""
+
+    dates = storage.read_trade_log(["Date"])["Date"].dt.strftime("%Y-%m-%d")
+    return int((dates.iloc[:trades] == date).sum())
+
+
+def start_from_history(data_dir: Path | str, backend: str | None = None) -> PortfolioState:
+    """Record the first day of the portfolio history as the starting state.
+
+    The holdings and cash balance of the first snapshot become the start,
+    and trades dated on or before that day are treated as already applied.
+    """
+
+    storage = open_backend(data_dir, backend)
+    dates = storage.portfolio_dates()
+    if not dates:
+        raise ValueError(f"{data_dir} has no portfolio history to start from.")
+    first = storage.read_portfolio(start=dates[0], end=dates[0])
+    held = first[first["Ticker"] != "TOTAL"]
+    cash = float(first.loc[first["Ticker"] == "TOTAL", "Cash Balance"].iloc[0])
+    portfolio = pd.DataFrame(
+        {
+            "ticker": held["Ticker"].astype(str),
+            "shares": held["Shares"],
+            "stop_loss": held["Stop Loss"],
+            "buy_price": held["Cost Basis"],
+            "date": dates[0],
+        }
+    )
+    trades = storage.read_trade_log(["Date"])
+    logged = trades["Date"].dt.strftime("%Y-%m-%d")
+    included = int((logged <= dates[0]).sum())
+    last = str(logged[logged <= dates[0]].iloc[-1]) if included else None
+    return record_start(data_dir, cash, portfolio, included, last, backend)
+
+
+def fold_trades(
+    state: PortfolioState,
+    trades: pd.DataFrame,
+    method: str = "fifo",
+    checkpoint_every: int | None = CHECKPOINT_EVERY,
+) -> tuple[PortfolioState, list[PortfolioState]]:
+    """Apply trade log rows to ``state``.
+
+    Returns the new state and the checkpoints taken whenever the running
+    trade count reaches a multiple of ``checkpoint_every``.
+
+    Raises
+    ------
+    ValueError
+        If a row sells shares that are not held, naming the row.
+    """
+
+    ledger = state.ledger(method)
+    cash = state.cash
+    count, last_date, on_date = state.trades, state.date, state.on_date
+    checkpoints: list[PortfolioState] = []
+    for row in trades.itertuples(index=False):
+        date = pd.Timestamp(row[0]).strftime("%Y-%m-%d")
+        ticker, reason = str(row.Ticker), str(row.Reason)
+        try:
+            if reason.startswith("MANUAL BUY"):
+                shares, price = float(row[2]), float(row[3])
+                ledger.buy(ticker, shares, price, math.nan, date)
+                cash -= shares * price
+            elif not math.isnan(row[5]):
+                shares, price = float(row[5]), float(row[6])
+                ledger.sell(ticker, shares, price)
+                cash += shares * price
+        except (KeyError, ValueError) as exc:
+            raise ValueError(f"Trade log row {count + 1} ({date} {ticker} {reason}): {exc}") from exc
+        count += 1
+        on_date = on_date + 1 if date == last_date else 1
+        last_date = date
+        if checkpoint_every and count % checkpoint_every == 0:
+            checkpoints.append(PortfolioState(cash, _lots(ledger), count, last_date, on_date, method))
+    return PortfolioState(cash, _lots(ledger), count, last_date, on_date, method), checkpoints
+
+
+def _unfolded(storage: StorageBackend, state: PortfolioState) -> pd.DataFrame | None:
+    """Trade log rows after ``state``, or ``None`` if the log no longer matches it."""
+
+    if state.date is None:
+        return storage.read_trade_log(_TRADE_COLUMNS)
+    rows = storage.read_trade_log(_TRADE_COLUMNS, start=state.date)
+    dates = rows["Date"].dt.strftime("%Y-%m-%d")
+    if int((dates == state.date).sum()) < state.on_date:
+        return None
+    return rows.iloc[state.on_date :].reset_index(drop=True)
+
+
+def rebuild_state(
+    data_dir: Path | str,
+    backend: str | None = None,
+    method: str = "fifo",
+    checkpoint_every: int | None = CHECKPOINT_EVERY,
+) -> tuple[pd.DataFrame, float]:
+    """Current positions and cash of ``data_dir``, rebuilt from its trade log.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the trade log and the starting-state record.
+    backend:
+        Storage layout, ``"csv"`` or ``"parquet"``. ``None`` detects it.
+    method:
+        How sells are matched to lots, one of ``RELIEF_METHODS``.
+    checkpoint_every:
+        Trades between saved checkpoints; ``None`` saves none.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, float]
+        Positions in the portfolio DataFrame shape and the cash balance.
+    """
+
+    data_dir = Path(data_dir)
+    storage = open_backend(data_dir, backend)
+    start = PortfolioState.load(data_dir / STATE_START_NAME)
+    if start is None:
+        raise ValueError(
+            f"No starting state in {data_dir}; run state.py with --cash or --from-history first."
+        )
+    saved: list[PortfolioState] = []
+    try:
+        with open(data_dir / STATE_CHECKPOINTS_NAME) as handle:
+            saved = [PortfolioState(**entry) for entry in json.load(handle)]
+    except (OSError, ValueError, TypeError):
+        pass
+    saved = [s for s in saved if s.method == method]
+
+    # Newest checkpoint the log still agrees with, else the starting state
+    state, trades = start, None
+    for candidate in sorted(saved, key=lambda s: s.trades, reverse=True):
+        trades = _unfolded(storage, candidate)
+        if trades is not None:
+            state = candidate
+            break
+    if state is start:
+        trades = _unfolded(storage, start)
+        if trades is None:
+            raise ValueError(f"The trade log in {data_dir} no longer matches its starting state.")
+    state, checkpoints = fold_trades(state, cast(pd.DataFrame, trades), method, checkpoint_every)
+    if checkpoints:
+        kept = [s for s in saved if s.trades < checkpoints[0].trades] + checkpoints
+        _write_json(data_dir / STATE_CHECKPOINTS_NAME, [asdict(s) for s in kept[-CHECKPOINT_KEEP:]])
+
+    ledger = state.ledger(method)
+    # Stops are not logged with trades; the latest snapshot has the current ones
+    dates = storage.portfolio_dates()
+    if dates:
+        latest = storage.read_portfolio(
+            ["Ticker", "Stop Loss", "Cash Balance"], start=dates[-1], end=dates[-1]
+        )
+        for ticker, stop in zip(latest["Ticker"].astype(str), latest["Stop Loss"]):
+            if ticker in ledger and not pd.isna(stop):
+                ledger.set_stop(ticker, float(stop))
+        # Trades after the snapshot would explain a difference, so only compare up to it
+        logged = latest.loc[latest["Ticker"] == "TOTAL", "Cash Balance"]
+        if not logged.empty and (state.date is None or state.date <= dates[-1]):
+            if abs(float(logged.iloc[-1]) - state.cash) >= 0.005:
+                print(
+                    f"Rebuilt cash {state.cash:.2f} differs from the {float(logged.iloc[-1]):.2f} "
+                    f"recorded on {dates[-1]}; check the trade log."
+                )
+    for ticker in ledger.tickers():
+        if math.isnan(ledger.stop_loss(ticker)):
+            print(f"No stop loss known for {ticker}; set one before the next run.")
+    return ledger.to_frame(), round(state.cash, 2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild holdings and cash from the trade log")
+    parser.add_argument("data_dir", type=Path, help="directory with the trade log")
+    parser.add_argument("--cash", type=float, help="record a fresh starting state with this cash")
+    parser.add_argument(
+        "--from-history",
+        action="store_true",
+        help="record the first day of the portfolio history as the starting state",
+    )
+    parser.add_argument("--lots", choices=RELIEF_METHODS, default="fifo", help="lot relief method")
+    parser.add_argument("--backend", choices=["csv", "parquet"], help="storage layout")
+    args = parser.parse_args()
+
+    if args.cash is not None:
+        record_start(args.data_dir, args.cash, backend=args.backend)
+    elif args.from_history:
+        start_from_history(args.data_dir, args.backend)
+    portfolio, cash = rebuild_state(args.data_dir, args.backend, args.lots)
+    print(portfolio.to_string(index=False) if not portfolio.empty else "No open positions.")
+    print(f"cash balance: {cash:.2f}")
@@ -0,0 +1,333 @@
+"""Vectorised exit rules: stop loss, trailing stops and take profit.
+
+``process_portfolio`` used to compare each position's close with the
+static stop set when it was bought. ``evaluate_stops`` checks every exit
+rule for the whole book at once, as NumPy operations over the latest bars:
+
+- **Stop loss**: the close is at or below the position's ``stop_loss``.
+- **Trailing stop**: the close is at or below the high-water mark minus
+  ``trailing`` (a fraction of the mark) or minus ``atr_multiple`` times
+  the average true range of the last ``atr_period`` bars.
+- **Take profit**: the close is at or above the buy price plus
+  ``take_profit`` (a fraction of the buy price).
+
+A position's high-water mark starts at its buy price and rises with
+every bar's high. ``HighWaterMarks`` keeps the marks next to the CSVs in
+``stop_state.json``, so trailing stops carry over between runs. A mark is
+dropped once the position is sold, and it restarts when a ticker comes
+back with a different buy price.
+
+The result holds one rule name per position (empty for positions that
+stay open). ``process_portfolio`` sells the triggered rows in one batch.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from market_data import MarketDataSession
+
+STOP_STATE_NAME = "stop_state.json"
+ATR_PERIOD = 14
+
+STOP_LOSS = "STOP_LOSS"
+TRAILING_STOP = "TRAILING_STOP"
+TAKE_PROFIT = "TAKE_PROFIT"
+# "Action" column of the portfolio history, per rule
+SELL_ACTIONS = {
+    STOP_LOSS: "SELL - Stop Loss Triggered",
+    TRAILING_STOP: "SELL - Trailing Stop Triggered",
+    TAKE_PROFIT: "SELL - Take Profit Triggered",
+}
+# "Reason" column of the trade log, per rule
+SELL_REASONS = {
+    STOP_LOSS: "AUTOMATED SELL - STOPLOSS TRIGGERED",
+    TRAILING_STOP: "AUTOMATED SELL - TRAILING STOP TRIGGERED",
+    TAKE_PROFIT: "AUTOMATED SELL - TAKE PROFIT TRIGGERED",
+}
+
+
+@dataclass
+class StopRules:
+    """Exit rules applied to every position on top of its own stop loss.
+
+    Parameters
+    ----------
+    trailing:
+        Trail the high-water mark by this fraction, e.g. ``0.15`` sells
+        after a 15% fall from the highest price since buying.
+    atr_multiple:
+        Trail the high-water mark by this many average true ranges.
+    atr_period:
+        Bars averaged for the true range.
+    take_profit:
+        Sell once the price is this fraction above the buy price, e.g.
+        ``0.5`` for a 50% gain.
+    """
+
+    trailing: float | None = None
+    atr_multiple: float | None = None
+    atr_period: int = ATR_PERIOD
+    take_profit: float | None = None
+
+    def __post_init__(self) -> None:
+        if self.trailing is not None and not 0 < self.trailing < 1:
+            raise ValueError("trailing must be a fraction between 0 and 1.")
+        if self.atr_multiple is not None and self.atr_multiple <= 0:
+            raise ValueError("atr_multiple must be positive.")
+        if self.atr_period < 1:
+            raise ValueError("atr_period must be at least 1.")
+        if self.take_profit is not None and self.take_profit <= 0:
+            raise ValueError("take_profit must be positive.")
+
+    @property
+    def trails(self) -> bool:
+        """Whether a trailing rule is set, so high-water marks are needed."""
+
+        return self.trailing is not None or self.atr_multiple is not None
+
+
+@dataclass
+class StopEvaluation:
+    """Outcome of ``evaluate_stops``, one entry per position.
+
+    Parameters
+    ----------
+    action:
+        Rule that triggered (``STOP_LOSS``, ``TRAILING_STOP`` or
+        ``TAKE_PROFIT``), or ``""`` for positions that stay open.
+    stop:
+        Effective stop: the highest of the stop loss and trailing levels.
+    high_water:
+        High-water marks including the latest bar.
+    target:
+        Take-profit price, ``NaN`` without that rule.
+    """
+
+    action: np.ndarray
+    stop: np.ndarray
+    high_water: np.ndarray
+    target: np.ndarray
+
+    @property
+    def triggered(self) -> np.ndarray:
+        return self.action != ""
+
+
+def average_true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+    """Mean true range over the last ``period`` bars of each row.
+
+    The inputs are shaped ``(positions, bars)`` with the newest bar last;
+    missing bars are ``NaN``. Rows with no complete bar pair give ``NaN``.
+    """
+
+    previous = close[:, :-1]
+    ranges = np.stack(
+        [
+            high[:, 1:] - low[:, 1:],
+            np.abs(high[:, 1:] - previous),
+            np.abs(low[:, 1:] - previous),
+        ]
+    )
+    true_range = np.max(ranges, axis=0)[:, -period:]
+    counts = (~np.isnan(true_range)).sum(axis=1)
+    totals = np.nansum(true_range, axis=1)
+    return np.divide(totals, counts, out=np.full(len(totals), np.nan), where=counts > 0)
+
+
+def evaluate_stops(
+    close: np.ndarray,
+    high: np.ndarray,
+    stop_loss: np.ndarray,
+    buy_price: np.ndarray,
+    high_water: np.ndarray,
+    rules: StopRules,
+    atr: np.ndarray | None = None,
+) -> StopEvaluation:
+    """Check every exit rule for every position at once.
+
+    Parameters
+    ----------
+    close, high:
+        Latest close and high per position; ``NaN`` without data, in which
+        case nothing triggers.
+    stop_loss, buy_price:
+        Each position's own stop and buy price.
+    high_water:
+        Stored high-water marks, ``NaN`` for new positions.
+    rules:
+        Rules on top of the stop losses.
+    atr:
+        Average true range per position, needed for ``atr_multiple``.
+
+    When several rules trigger, the stop loss wins over the trailing stop
+    and both win over take profit.
+    """
+
+    close, high, stop_loss, buy_price, high_water = (
+        np.asarray(a, dtype=float) for a in (close, high, stop_loss, buy_price, high_water)
+    )
+    missing = np.full(len(close), np.nan)
+    # fmax ignores NaN, so new positions start from their buy price
+    high_water = np.fmax(np.fmax(high_water, buy_price), np.fmax(high, close))
+
+    trail = missing
+    if rules.trailing is not None:
+        trail = high_water * (1 - rules.trailing)
+    if rules.atr_multiple is not None:
+        if atr is None:
+            raise ValueError("atr is required when atr_multiple is set.")
+        trail = np.fmax(trail, high_water - rules.atr_multiple * np.asarray(atr, dtype=float))
+    target = buy_price * (1 + rules.take_profit) if rules.take_profit is not None else missing
+
+    has_data = ~np.isnan(close)
+    hit_stop = has_data & (close <= stop_loss)
+    hit_trail = has_data & (close <= trail)
+    hit_target = has_data & (close >= target)
+    action = np.select(
+        [hit_stop, hit_trail, hit_target], [STOP_LOSS, TRAILING_STOP, TAKE_PROFIT], default=""
+    ).astype(object)
+    return StopEvaluation(action, np.fmax(stop_loss, trail), high_water, target)
+
+
+def recent_bars(
+    session: MarketDataSession, tickers: Iterable[str], count: int
+) -> dict[str, np.ndarray]:
+    """The last ``count`` bars of each ticker as ``(positions, count)`` arrays.
+
+    Returns ``High``, ``Low`` and ``Close`` matrices aligned on the newest
+    bar. Shorter histories are padded with ``NaN`` on the left.
+    """
+
+    tickers = list(tickers)
+    matrices = {name: np.full((len(tickers), count), np.nan) for name in ("High", "Low", "Close")}
+    for i, ticker in enumerate(tickers):
+        bars = session.history(ticker).tail(count)
+        if bars.empty:
+            continue
+        for name, matrix in matrices.items():
+            if name in bars:
+                matrix[i, count - len(bars) :] = bars[name].to_numpy(dtype=float)
+    return matrices
+
+
+@dataclass
+class HighWaterMark:
+    """Highest price seen since a position was bought."""
+
+    high: float
+    buy_price: float
+    date: str
+
+
+class HighWaterMarks:
+    """Trailing-stop high-water marks per ticker, saved between runs.
+
+    Parameters
+    ----------
+    marks:
+        Marks by ticker.
+    """
+
+    def __init__(self, marks: dict[str, HighWaterMark] | None = None) -> None:
+        self.marks = marks or {}
+
+    def lookup(self, tickers: Iterable[str], buy_prices: Iterable[float]) -> np.ndarray:
+        """Stored marks, ``NaN`` where there is none or the buy price changed."""
+
+        values = []
+        for ticker, buy_price in zip(tickers, buy_prices):
+            mark = self.marks.get(str(ticker).upper())
+            fresh = mark is None or not np.isclose(mark.buy_price, float(buy_price))
+            values.append(np.nan if fresh else mark.high)
+        return np.array(values, dtype=float)
+
+    def update(
+        self,
+        tickers: Iterable[str],
+        buy_prices: Iterable[float],
+        high_water: np.ndarray,
+        keep: np.ndarray,
+        date: str,
+        has_data: np.ndarray | None = None,
+    ) -> None:
+        """Replace the marks with those of the positions in ``keep``.
+
+        Tickers no longer held, or sold in this run, lose their marks.
+        Positions without a bar today (``has_data`` false) keep their
+        stored mark unchanged, date included.
+        """
+
+        if has_data is None:
+            has_data = np.ones(len(high_water), dtype=bool)
+        marks = {}
+        for ticker, buy_price, high, kept, bar in zip(tickers, buy_prices, high_water, keep, has_data):
+            ticker = str(ticker).upper()
+            if not kept:
+                continue
+            stored = self.marks.get(ticker)
+            if not bar and stored is not None and np.isclose(stored.buy_price, float(buy_price)):
+                marks[ticker] = stored
+                continue
+            marks[ticker] = HighWaterMark(round(float(high), 4), float(buy_price), date)
+        self.marks = marks
+
+    @classmethod
+    def load(cls, path: Path | str) -> "HighWaterMarks":
+        """Marks saved at ``path``; empty when missing or unreadable."""
+
+        try:
+            with open(path) as handle:
+                stored = json.load(handle)
+            return cls({ticker: HighWaterMark(**mark) for ticker, mark in stored.items()})
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path: Path | str) -> None:
+        """Write the marks atomically as JSON."""
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as handle:
+            json.dump({ticker: asdict(mark) for ticker, mark in self.marks.items()}, handle, indent=2)
+        os.replace(tmp, path)
+
+
+def evaluate_book(
+    book: pd.DataFrame,
+    close: pd.Series,
+    prices: pd.DataFrame,
+    session: MarketDataSession,
+    rules: StopRules,
+    marks: HighWaterMarks | None = None,
+) -> StopEvaluation:
+    """``evaluate_stops`` for a portfolio frame.
+
+    ``book`` has ``ticker``, ``stop_loss`` and ``buy_price`` columns,
+    ``close`` the price each position is valued at and ``prices`` the
+    ``latest_prices`` table its highs come from. Bar history is only read
+    when ``atr_multiple`` is set.
+    """
+
+    with span("stops.evaluate", positions=len(book)):
+        symbols = book["ticker"].astype(str).str.upper()
+        close = np.asarray(close, dtype=float)
+        high = symbols.map(prices["High"]).to_numpy(dtype=float) if "High" in prices else close
+        atr = None
+        if rules.atr_multiple is not None:
+            bars = recent_bars(session, symbols, rules.atr_period + 1)
+            atr = average_true_range(bars["High"], bars["Low"], bars["Close"], rules.atr_period)
+        stored = (
+            marks.lookup(symbols, book["buy_price"])
+            if marks is not None
+            else np.full(len(book), np.nan)
+        )
+        return evaluate_stops(
+            close, high, book["stop_loss"], book["buy_price"], stored, rules, atr
+        )
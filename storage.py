@@ -0,0 +1,770 @@
+"""On-disk persistence for the portfolio history and trade log.
+
+The trade log only ever grows, so new trades are appended to the end of
+``chatgpt_trade_log.csv`` instead of reading and rewriting the whole file.
+Rows are buffered by a ``TradeLogWriter`` and written in one flush per
+batch, which keeps a busy trading session to a single file write.
+
+``chatgpt_portfolio_update.csv`` gains one block of rows per day. The
+``PortfolioSnapshotStore`` keeps a byte-offset index of the first row of
+every date so a daily update only truncates and rewrites today's tail
+segment (or appends a new one); earlier history is never read or written.
+
+Both files can also be kept in a typed columnar layout. A storage backend
+(``CsvBackend`` or ``ParquetBackend``, chosen by ``open_backend``) exposes
+the same reads and writes for either layout, with column projection and
+date filtering, and ``convert`` moves a data directory between them. The
+CSV layout stays the default because the web dashboard reads it directly.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+from pathlib import Path
+from types import TracebackType
+from typing import Protocol
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pa_dataset = pq = None
+
+from instrumentation import span
+
+PORTFOLIO_CSV_NAME = "chatgpt_portfolio_update.csv"
+TRADE_LOG_CSV_NAME = "chatgpt_trade_log.csv"
+PORTFOLIO_PARQUET_NAME = "chatgpt_portfolio_update.parquet"
+TRADE_LOG_PARQUET_NAME = "chatgpt_trade_log.parquet"
+
+# Column layout shared by buy and sell rows in ``chatgpt_trade_log.csv``
+TRADE_LOG_COLUMNS = [
+    "Date",
+    "Ticker",
+    "Shares Bought",
+    "Buy Price",
+    "Cost Basis",
+    "PnL",
+    "Reason",
+    "Shares Sold",
+    "Sell Price",
+]
+
+# Column layout of ``chatgpt_portfolio_update.csv``
+PORTFOLIO_COLUMNS = [
+    "Date",
+    "Ticker",
+    "Shares",
+    "Cost Basis",
+    "Stop Loss",
+    "Current Price",
+    "Total Value",
+    "PnL",
+    "Action",
+    "Cash Balance",
+    "Total Equity",
+]
+
+# Fixed dtypes of the typed (columnar) representation
+_TEXT = "string"
+_NUMBER = "float64"
+PORTFOLIO_DTYPES = {
+    "Date": "datetime64[ns]",
+    "Ticker": _TEXT,
+    "Shares": _NUMBER,
+    "Cost Basis": _NUMBER,
+    "Stop Loss": _NUMBER,
+    "Current Price": _NUMBER,
+    "Total Value": _NUMBER,
+    "PnL": _NUMBER,
+    "Action": _TEXT,
+    "Cash Balance": _NUMBER,
+    "Total Equity": _NUMBER,
+}
+TRADE_LOG_DTYPES = {
+    "Date": "datetime64[ns]",
+    "Ticker": _TEXT,
+    "Shares Bought": _NUMBER,
+    "Buy Price": _NUMBER,
+    "Cost Basis": _NUMBER,
+    "PnL": _NUMBER,
+    "Reason": _TEXT,
+    "Shares Sold": _NUMBER,
+    "Sell Price": _NUMBER,
+}
+
+
+def _format_cell(value: object) -> str:
+    """Render a value the way ``DataFrame.to_csv`` writes the existing logs.
+
+    Numbers are written as floats (``55.0``) because the mixed buy/sell
+    columns always contain blanks and are therefore float columns once
+    pandas reads them back. Missing values become empty cells.
+    """
+
+    if isinstance(value, str):
+        return value
+    if value is None or value is pd.NA:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return str(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        if np.isnan(float(value)):
+            return ""
+        return repr(float(value))
+    return str(value)
+
+
+def _read_header(path: Path) -> list[str] | None:
+    """Return the CSV header of ``path`` or ``None`` when it has none."""
+
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    with open(path, newline="") as handle:
+        return next(csv.reader(handle), None)
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as handle:
+        handle.seek(-1, os.SEEK_END)
+        return handle.read(1) in (b"\n", b"\r")
+
+
+class TradeRows(Protocol):
+    """Anything trade rows can be queued on, such as a ``TradeLogWriter``
+    or a plain list collecting them in memory."""
+
+    def append(self, row: dict[str, object], /) -> None: ...
+
+
+class TradeLogWriter:
+    """Buffer trade rows and append them to the trade log in one write.
+
+    Rows keep the column order of the existing file header. A new file is
+    created with ``TRADE_LOG_COLUMNS``. If a row carries a column the
+    current header lacks (for example a log started by a stop-loss sale
+    that has no buy columns), the file is rewritten once with the widened
+    header and later batches are plain appends again.
+
+    The writer is a context manager; pending rows are flushed on exit.
+
+    Parameters
+    ----------
+    path:
+        Location of ``chatgpt_trade_log.csv``.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self._pending: list[dict[str, object]] = []
+
+    def __enter__(self) -> "TradeLogWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        # Trades already applied in memory are kept even if the session fails
+        self.flush()
+
+    @property
+    def pending(self) -> int:
+        """Number of rows waiting to be written."""
+
+        return len(self._pending)
+
+    def append(self, row: dict[str, object]) -> None:
+        """Queue ``row`` for the next flush."""
+
+        self._pending.append(row)
+
+    def flush(self) -> int:
+        """Write all pending rows, fsync the file and return the row count."""
+
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        with span("csv.append_trade_log", rows=len(rows)) as sp:
+            header = _read_header(self.path)
+            if header is None:
+                header = list(TRADE_LOG_COLUMNS)
+                for row in rows:
+                    header += [key for key in row if key not in header]
+                self._write(header, rows, mode="w")
+            elif any(key not in header for row in rows for key in row):
+                sp.set(mode="rewrite")
+                self._widen(header, rows)
+            else:
+                self._write(header, rows, mode="a")
+        return len(rows)
+
+    def _write(self, header: list[str], rows: list[dict[str, object]], mode: str) -> None:
+        needs_newline = mode == "a" and not _ends_with_newline(self.path)
+        with open(self.path, mode, newline="") as handle:
+            if needs_newline:
+                handle.write("\n")
+            writer = csv.writer(handle, lineterminator="\n")
+            if mode == "w":
+                writer.writerow(header)
+            for row in rows:
+                writer.writerow([_format_cell(row.get(col)) for col in header])
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _widen(self, header: list[str], rows: list[dict[str, object]]) -> None:
+        """Rewrite the log once with a header covering every column."""
+
+        existing = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        columns = list(header)
+        for col in TRADE_LOG_COLUMNS:
+            if col not in columns:
+                columns.append(col)
+        for row in rows:
+            columns += [key for key in row if key not in columns]
+        existing = existing.reindex(columns=columns, fill_value="")
+        old_rows = existing.to_dict(orient="records")
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", newline="") as handle:
+            writer = csv.writer(handle, lineterminator="\n")
+            writer.writerow(columns)
+            for old in old_rows:
+                writer.writerow([old[col] for col in columns])
+            for row in rows:
+                writer.writerow([_format_cell(row.get(col)) for col in columns])
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, self.path)
+
+
+class PortfolioSnapshotStore:
+    """Write daily portfolio snapshots without rewriting earlier history.
+
+    Rows for one date are stored contiguously and dates only move forward,
+    so today's block is always the tail of the file. A sidecar JSON index
+    (``<csv name>.idx``) maps each date to the byte offset of its first row.
+    Re-running a day truncates the file at that offset and writes the new
+    block; a new day is a plain append. The index records the file size
+    it describes and is rebuilt with one scan whenever the CSV was changed
+    by something else.
+
+    Parameters
+    ----------
+    path:
+        Location of ``chatgpt_portfolio_update.csv``.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+
+    def _scan(self) -> dict[str, int]:
+        """Build the date index by reading the CSV once."""
+
+        offsets: dict[str, int] = {}
+        with span("csv.scan_index") as sp, open(self.path, "rb") as handle:
+            handle.readline()
+            offset = handle.tell()
+            for line in iter(handle.readline, b""):
+                date = line.split(b",", 1)[0].decode().strip()
+                if date:
+                    offsets.setdefault(date, offset)
+                offset += len(line)
+            sp.set(bytes=offset, days=len(offsets))
+        return offsets
+
+    def _valid(self, offsets: dict[str, int]) -> bool:
+        """Cheaply confirm the index still matches the file on disk."""
+
+        if not offsets:
+            return True
+        date, offset = max(offsets.items(), key=lambda item: item[1])
+        with open(self.path, "rb") as handle:
+            handle.seek(offset)
+            return handle.read(len(date) + 1) == f"{date},".encode()
+
+    def load_index(self) -> dict[str, int]:
+        """Return the date to byte-offset index, rebuilding it if stale."""
+
+        if not self.path.exists():
+            return {}
+        size = self.path.stat().st_size
+        try:
+            with open(self.index_path) as handle:
+                stored = json.load(handle)
+            offsets = {str(k): int(v) for k, v in stored["offsets"].items()}
+            if stored["size"] == size and self._valid(offsets):
+                return offsets
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        offsets = self._scan()
+        self._save_index(offsets)
+        return offsets
+
+    def _save_index(self, offsets: dict[str, int]) -> None:
+        size = self.path.stat().st_size if self.path.exists() else 0
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp, "w") as handle:
+            json.dump({"size": size, "offsets": offsets}, handle)
+        os.replace(tmp, self.index_path)
+
+    def dates(self) -> list[str]:
+        """Dates present in the file, in file order."""
+
+        offsets = self.load_index()
+        return sorted(offsets, key=offsets.__getitem__)
+
+    def read_day(self, date: str | None = None) -> pd.DataFrame:
+        """Read only the rows of ``date`` (default: the latest date)."""
+
+        if date is None:
+            dates = self.dates()
+            if not dates:
+                return self.read_range()
+            date = dates[-1]
+        return self.read_range(date, date)
+
+    def read_range(
+        self,
+        start: str | None = None,
+        end: str | None = None,
+        columns: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """Read the rows dated within ``[start, end]`` (ISO strings).
+
+        The byte-offset index locates the first and last block, so only
+        that slice of the file is parsed. Values are returned as stored;
+        blank cells come back as ``NaN``.
+        """
+
+        header = _read_header(self.path)
+        if header is None:
+            return pd.DataFrame(columns=columns or PORTFOLIO_COLUMNS)
+        offsets = self.load_index()
+        ordered = sorted(offsets.items(), key=lambda item: item[1])
+        chosen = [
+            i
+            for i, (date, _) in enumerate(ordered)
+            if (start is None or date >= start) and (end is None or date <= end)
+        ]
+        if not chosen:
+            return pd.DataFrame(columns=columns or header)
+        begin = ordered[chosen[0]][1]
+        after = chosen[-1] + 1
+        with span("csv.read_portfolio", days=len(chosen)) as sp:
+            with open(self.path, "rb") as handle:
+                handle.seek(begin)
+                if after < len(ordered):
+                    block = handle.read(ordered[after][1] - begin)
+                else:
+                    block = handle.read()
+            frame = pd.read_csv(io.BytesIO(block), names=header, header=None, usecols=columns)
+            sp.set(rows=len(frame), bytes=len(block))
+        return frame
+
+    def write_day(self, date: str, rows: pd.DataFrame) -> bool:
+        """Store ``rows`` as the snapshot for ``date``.
+
+        Returns ``True`` when an existing snapshot for ``date`` was
+        replaced and ``False`` when the rows were appended as a new day.
+        """
+
+        with span("csv.write_portfolio_day", rows=len(rows)) as sp:
+            header = _read_header(self.path)
+            if header is None:
+                sp.set(mode="create")
+                rows.to_csv(self.path, index=False)
+                self._save_index(self._scan())
+                return False
+            if set(rows.columns) - set(header):
+                sp.set(mode="rewrite")
+                return self._rewrite(date, rows)
+
+            offsets = self.load_index()
+            replaced = date in offsets
+            if replaced:
+                later = [d for d, off in offsets.items() if off > offsets[date]]
+                if later:
+                    # Back-dated rewrite; rare enough to pay for a full rewrite
+                    sp.set(mode="rewrite")
+                    return self._rewrite(date, rows)
+                start = offsets[date]
+            else:
+                start = self.path.stat().st_size
+
+            sp.set(mode="replace" if replaced else "append")
+            with open(self.path, "r+b") as handle:
+                handle.seek(start)
+                handle.truncate()
+                if start > 0 and not replaced:
+                    handle.seek(start - 1)
+                    if handle.read(1) not in (b"\n", b"\r"):
+                        handle.write(b"\n")
+                        start += 1
+                block = rows.reindex(columns=header).to_csv(index=False, header=False).encode()
+                handle.write(block)
+                sp.set(bytes=len(block))
+                handle.flush()
+                os.fsync(handle.fileno())
+
+            offsets[date] = start
+            self._save_index(offsets)
+            return replaced
+
+    def _rewrite(self, date: str, rows: pd.DataFrame) -> bool:
+        """Fallback full rewrite used when the tail-only path cannot apply."""
+
+        existing = pd.read_csv(self.path)
+        replaced = bool((existing["Date"] == date).any())
+        existing = existing[existing["Date"] != date]
+        df = pd.concat([existing, rows], ignore_index=True)
+        df.to_csv(self.path, index=False)
+        self._save_index(self._scan())
+        return replaced
+
+
+def to_typed(df: pd.DataFrame, dtypes: dict[str, str]) -> pd.DataFrame:
+    """Coerce ``df`` to the fixed dtypes, turning blank strings into nulls.
+
+    Columns named in ``dtypes`` but absent from ``df`` are left out, so the
+    function also works on projected frames.
+    """
+
+    out = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        dtype = dtypes.get(col)
+        values = df[col]
+        if dtype == _NUMBER:
+            out[col] = pd.to_numeric(values.replace("", np.nan), errors="coerce").astype(dtype)
+        elif dtype == _TEXT:
+            out[col] = values.astype(_TEXT).replace("", pd.NA)
+        elif dtype is not None and dtype.startswith("datetime64"):
+            out[col] = pd.to_datetime(values).astype(dtype)
+        else:
+            out[col] = values
+    return out
+
+
+def to_csv_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Render a typed frame with ISO date strings for the CSV layout."""
+
+    out = df.copy()
+    if "Date" in out and pd.api.types.is_datetime64_any_dtype(out["Date"]):
+        out["Date"] = out["Date"].dt.strftime("%Y-%m-%d")
+    return out
+
+
+def _iso(value: str | pd.Timestamp | None) -> str | None:
+    return None if value is None else pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def _filter_dates(
+    df: pd.DataFrame, start: str | None, end: str | None
+) -> pd.DataFrame:
+    if df.empty or (start is None and end is None):
+        return df
+    dates = pd.to_datetime(df["Date"])
+    keep = pd.Series(True, index=df.index)
+    if start is not None:
+        keep &= dates >= pd.Timestamp(start)
+    if end is not None:
+        keep &= dates <= pd.Timestamp(end)
+    return df[keep]
+
+
+def _with_date(columns: list[str] | None) -> list[str] | None:
+    if columns is None or "Date" in columns:
+        return columns
+    return ["Date"] + list(columns)
+
+
+class StorageBackend(Protocol):
+    """Reads and writes of the portfolio history and trade log.
+
+    Reads return frames with the fixed dtypes of ``PORTFOLIO_DTYPES`` and
+    ``TRADE_LOG_DTYPES``. ``columns`` projects the result and
+    ``start``/``end`` keep only rows dated within the inclusive range.
+    """
+
+    data_dir: Path
+
+    def exists(self) -> bool: ...
+
+    def portfolio_dates(self) -> list[str]: ...
+
+    def read_portfolio(
+        self,
+        columns: list[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame: ...
+
+    def write_portfolio_day(self, date: str, rows: pd.DataFrame) -> bool: ...
+
+    def read_trade_log(
+        self,
+        columns: list[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame: ...
+
+    def trade_log_writer(self) -> "TradeLogWriter | ParquetTradeLogWriter": ...
+
+
+class CsvBackend:
+    """CSV layout used by the scripts and the web dashboard.
+
+    Portfolio reads use the snapshot byte-offset index so a date range is
+    read without parsing the rest of the file. The trade log has no index
+    and is filtered after parsing the projected columns.
+    """
+
+    def __init__(self, data_dir: Path | str) -> None:
+        self.data_dir = Path(data_dir)
+        self.portfolio_path = self.data_dir / PORTFOLIO_CSV_NAME
+        self.trade_log_path = self.data_dir / TRADE_LOG_CSV_NAME
+        self.snapshots = PortfolioSnapshotStore(self.portfolio_path)
+
+    def exists(self) -> bool:
+        return self.portfolio_path.exists()
+
+    def portfolio_dates(self) -> list[str]:
+        return self.snapshots.dates()
+
+    def read_portfolio(
+        self,
+        columns: list[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame:
+        raw = self.snapshots.read_range(_iso(start), _iso(end), columns)
+        return to_typed(raw, PORTFOLIO_DTYPES)
+
+    def write_portfolio_day(self, date: str, rows: pd.DataFrame) -> bool:
+        return self.snapshots.write_day(date, rows)
+
+    def read_trade_log(
+        self,
+        columns: list[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame:
+        if not self.trade_log_path.exists():
+            return pd.DataFrame(columns=columns or TRADE_LOG_COLUMNS)
+        header = _read_header(self.trade_log_path) or []
+        wanted = _with_date(columns) if start or end else columns
+        usecols = None if wanted is None else [c for c in wanted if c in header]
+        with span("csv.read_trade_log") as sp:
+            raw = pd.read_csv(self.trade_log_path, usecols=usecols)
+            if sp:
+                sp.set(rows=len(raw), bytes=self.trade_log_path.stat().st_size)
+        raw = _filter_dates(raw, _iso(start), _iso(end))
+        if columns is not None:
+            raw = raw.reindex(columns=columns)
+        return to_typed(raw.reset_index(drop=True), TRADE_LOG_DTYPES)
+
+    def trade_log_writer(self) -> TradeLogWriter:
+        return TradeLogWriter(self.trade_log_path)
+
+
+def _require_pyarrow() -> None:
+    if pq is None:
+        raise ImportError(
+            "The parquet storage backend needs pyarrow. Install it with 'pip install pyarrow'."
+        )
+
+
+def _write_parquet(df: pd.DataFrame, dtypes: dict[str, str], path: Path) -> None:
+    """Write one typed partition atomically and fsync it."""
+
+    with span("parquet.write", dataset=path.parent.name, rows=len(df)) as sp:
+        typed = to_typed(df.reindex(columns=list(dtypes)), dtypes)
+        table = pa.Table.from_pandas(typed, preserve_index=False)
+        tmp = path.with_name(path.name + ".tmp")
+        pq.write_table(table, tmp)
+        with open(tmp, "rb+") as handle:
+            os.fsync(handle.fileno())
+        if sp:
+            sp.set(bytes=tmp.stat().st_size)
+        os.replace(tmp, path)
+
+
+def _read_partitions(
+    directory: Path,
+    dtypes: dict[str, str],
+    columns: list[str] | None,
+    start: str | None,
+    end: str | None,
+) -> pd.DataFrame:
+    """Read date partitions of a dataset, pruning files outside the range."""
+
+    files = sorted(
+        f
+        for f in directory.glob("*.parquet")
+        if (start is None or f.stem[:10] >= start) and (end is None or f.stem[:10] <= end)
+    )
+    if not files:
+        empty = pd.DataFrame({c: pd.Series(dtype=t) for c, t in dtypes.items()})
+        return empty[columns] if columns is not None else empty
+    with span("parquet.read", dataset=directory.name, files=len(files)) as sp:
+        table = pa_dataset.dataset([str(f) for f in files], format="parquet").to_table(
+            columns=columns
+        )
+        sp.set(rows=table.num_rows, bytes=table.nbytes)
+    return table.to_pandas().astype({c: t for c, t in dtypes.items() if c in table.column_names})
+
+
+class ParquetBackend:
+    """Typed columnar layout with one Parquet file per date.
+
+    ``chatgpt_portfolio_update.parquet`` and ``chatgpt_trade_log.parquet``
+    are directories holding ``YYYY-MM-DD.parquet`` partitions with fixed
+    dtypes. Writing a day replaces a single small file, date filters skip
+    whole partitions, and column projection reads only the requested
+    columns from each file.
+    """
+
+    def __init__(self, data_dir: Path | str) -> None:
+        _require_pyarrow()
+        self.data_dir = Path(data_dir)
+        self.portfolio_dir = self.data_dir / PORTFOLIO_PARQUET_NAME
+        self.trade_log_dir = self.data_dir / TRADE_LOG_PARQUET_NAME
+
+    def exists(self) -> bool:
+        return self.portfolio_dir.is_dir() and any(self.portfolio_dir.glob("*.parquet"))
+
+    def portfolio_dates(self) -> list[str]:
+        return sorted(f.stem for f in self.portfolio_dir.glob("*.parquet"))
+
+    def read_portfolio(
+        self,
+        columns: list[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame:
+        return _read_partitions(
+            self.portfolio_dir, PORTFOLIO_DTYPES, columns, _iso(start), _iso(end)
+        )
+
+    def write_portfolio_day(self, date: str, rows: pd.DataFrame) -> bool:
+        self.portfolio_dir.mkdir(parents=True, exist_ok=True)
+        path = self.portfolio_dir / f"{date}.parquet"
+        replaced = path.exists()
+        _write_parquet(rows, PORTFOLIO_DTYPES, path)
+        return replaced
+
+    def read_trade_log(
+        self,
+        columns: list[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame:
+        return _read_partitions(
+            self.trade_log_dir, TRADE_LOG_DTYPES, columns, _iso(start), _iso(end)
+        )
+
+    def trade_log_writer(self) -> "ParquetTradeLogWriter":
+        return ParquetTradeLogWriter(self.trade_log_dir)
+
+
+class ParquetTradeLogWriter(TradeLogWriter):
+    """Trade log writer for the Parquet layout.
+
+    A flush rewrites only the partitions of the dates it touches, which for
+    a daily session is the single file for today.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        _require_pyarrow()
+        super().__init__(path)
+
+    def flush(self) -> int:
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        batch = pd.DataFrame(rows)
+        for date, group in batch.groupby(batch["Date"].astype(str), sort=True):
+            path = self.path / f"{_iso(date)}.parquet"
+            if path.exists():
+                existing = to_csv_frame(pd.read_parquet(path))
+                group = pd.concat([existing, group], ignore_index=True)
+            _write_parquet(group, TRADE_LOG_DTYPES, path)
+        return len(rows)
+
+
+BACKENDS = {"csv": CsvBackend, "parquet": ParquetBackend}
+
+
+def open_backend(
+    data_dir: Path | str, kind: str | None = None
+) -> "CsvBackend | ParquetBackend":
+    """Return the storage backend for ``data_dir``.
+
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the portfolio history and trade log.
+    kind:
+        ``"csv"`` or ``"parquet"``. When ``None`` the Parquet layout is used
+        if the directory already contains it, otherwise CSV.
+    """
+
+    if kind is None:
+        kind = "parquet" if (Path(data_dir) / PORTFOLIO_PARQUET_NAME).is_dir() else "csv"
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{kind}'. Use one of {sorted(BACKENDS)}.")
+    return BACKENDS[kind](data_dir)
+
+
+def convert(data_dir: Path | str, to: str) -> "CsvBackend | ParquetBackend":
+    """Copy a data directory's history from one layout into the other.
+
+    The source layout is left in place. Returns the target backend.
+    """
+
+    source = open_backend(data_dir, "csv" if to == "parquet" else "parquet")
+    target = open_backend(data_dir, to)
+
+    portfolio = source.read_portfolio()
+    if not portfolio.empty:
+        rows = to_csv_frame(portfolio)
+        for date, group in rows.groupby("Date", sort=True):
+            target.write_portfolio_day(str(date), group.reset_index(drop=True))
+
+    trades = source.read_trade_log()
+    if not trades.empty:
+        rows = to_csv_frame(trades)
+        if to == "csv":
+            # Rebuild the CSV log from scratch so reruns do not duplicate rows
+            target.trade_log_path.unlink(missing_ok=True)
+        else:
+            for stale in target.trade_log_dir.glob("*.parquet"):
+                stale.unlink()
+        with target.trade_log_writer() as writer:
+            for record in rows.to_dict(orient="records"):
+                writer.append({k: ("" if pd.isna(v) else v) for k, v in record.items()})
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert portfolio storage layouts")
+    parser.add_argument("data_dir", help="Directory with the portfolio history")
+    parser.add_argument(
+        "--to",
+        choices=sorted(BACKENDS),
+        default="parquet",
+        help="Target layout",
+    )
+    args = parser.parse_args()
+    convert(args.data_dir, args.to)
+    print(f"Converted {args.data_dir} to {args.to}.")
@@ -0,0 +1,411 @@
+"""Sweep stop-loss levels and position sizing over a portfolio's own trades.
+
+The positions a portfolio actually took are re-simulated under a grid of
+stop-loss percentages and sizing rules:
+- The holdings on the first day of the history are one set of lots.
+- Every manual buy in the trade log adds another lot.
+
+Each lot's stop is placed ``pct`` below its buy price, and the
+``price <= stop`` rule from ``process_portfolio`` is applied to the
+daily closes. Logged manual sells still happen, as the same fraction of
+each lot (matched first in, first out), unless the lot was stopped out
+first. Logged stop-loss sales are ignored because the simulated stops
+replace them.
+
+Sizing rules:
+- ``logged``: the share counts from the trade log.
+- ``equal``: the same dollar amount in every lot, namely the average
+  logged cost.
+- ``risk``: enough shares that hitting the stop loses ``risk_per_trade``
+  of the starting equity.
+
+Cash is not constrained, so sizing rules may spend more than the account
+held. The comparison is meant to be between stop levels, not a replay of
+cash flows (``backtest.py`` does that).
+
+The grid is spread over a ``ProcessPoolExecutor``. The price matrix and
+the manual-sell schedules are placed in shared memory once and mapped by
+every worker, rather than pickled with each task. Each worker scores its
+curves with the vectorised functions in ``metrics``.
+"""
+
+import argparse
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from market_data import MarketDataSession
+from metrics import RISK_FREE_ANNUAL, max_drawdown, sharpe_ratio, sortino_ratio
+from price_cache import PRICE_CACHE_NAME, PriceCache
+from storage import StorageBackend, open_backend
+
+SIZING_RULES = ("logged", "equal", "risk")
+DEFAULT_STOPS = (0.05, 0.10, 0.15, 0.20, 0.25, 0.30)
+RISK_PER_TRADE = 0.02
+# Calendar days of bars fetched before the first trade, so every ticker
+# has a close to carry forward into the first simulated day
+PRICE_LOOKBACK_DAYS = 10
+
+
+@dataclass
+class Lots:
+    """Positions to re-simulate and the daily closes they are valued at.
+
+    ``closes`` holds one column per ticker, rounded like the live script
+    and carried forward. Per-lot vectors index into it with ``column``.
+    ``sold_fraction`` and ``sold_value`` are cumulative by day: the share
+    of each lot sold manually so far and the proceeds per logged share.
+    """
+
+    dates: pd.DatetimeIndex
+    tickers: list[str]
+    closes: np.ndarray
+    column: np.ndarray
+    entry: np.ndarray
+    buy_price: np.ndarray
+    shares: np.ndarray
+    sold_fraction: np.ndarray
+    sold_value: np.ndarray
+    starting_equity: float
+
+
+def price_start(storage: StorageBackend, lookback: int = PRICE_LOOKBACK_DAYS) -> pd.Timestamp:
+    """First date the sweep needs prices for.
+
+    That is ``lookback`` calendar days before the earlier of the first
+    portfolio row and the first trade.
+    """
+
+    dates = [
+        frame["Date"].min()
+        for frame in (storage.read_portfolio(["Date"]), storage.read_trade_log(["Date"]))
+        if not frame.empty
+    ]
+    if not dates:
+        raise ValueError("The portfolio history is empty, so there is nothing to sweep.")
+    return pd.Timestamp(min(dates)).normalize() - pd.Timedelta(days=lookback)
+
+
+def load_lots(storage: StorageBackend, session: MarketDataSession) -> Lots:
+    """Build the lots of a portfolio history and align them with its prices."""
+
+    history = storage.read_portfolio(["Date", "Ticker", "Shares", "Cost Basis", "Cash Balance"])
+    if history.empty:
+        raise ValueError("The portfolio history is empty, so there is nothing to sweep.")
+    first_day = history["Date"].min()
+    opening = history[history["Date"] == first_day]
+    held = opening[opening["Ticker"] != "TOTAL"]
+    cash = float(opening.loc[opening["Ticker"] == "TOTAL", "Cash Balance"].iloc[0])
+
+    events = []
+    for row in held.itertuples(index=False):
+        events.append((first_day, "buy", str(row.Ticker), float(row.Shares), float(row[3])))
+    trades = storage.read_trade_log(
+        ["Date", "Ticker", "Shares Bought", "Buy Price", "Shares Sold", "Sell Price", "Reason"]
+    )
+    for row in trades.itertuples(index=False):
+        reason = str(row.Reason)
+        if reason.startswith("MANUAL BUY"):
+            events.append((row.Date, "buy", str(row.Ticker), float(row[2]), float(row[3])))
+        elif reason.startswith("MANUAL SELL"):
+            events.append((row.Date, "sell", str(row.Ticker), float(row[4]), float(row[5])))
+
+    tickers = list(dict.fromkeys(e[2] for e in events))
+    session.prefetch(tickers)
+    calendar = pd.DatetimeIndex([])
+    for ticker in tickers:
+        calendar = calendar.union(pd.DatetimeIndex(session.history(ticker).index))
+    dates = calendar[calendar >= first_day]
+    if dates.empty:
+        raise ValueError("No price data was found for the portfolio's tickers.")
+    closes = np.full((len(dates), len(tickers)), np.nan)
+    for j, ticker in enumerate(tickers):
+        bars = session.history(ticker)
+        if not bars.empty:
+            full = bars["Close"].reindex(calendar).ffill()
+            closes[:, j] = np.round(full.to_numpy()[calendar >= first_day], 2)
+
+    # Buys open lots; manual sells consume them first in, first out
+    lots: list[dict] = []
+    schedule: list[tuple[int, int, float, float]] = []
+    for date, kind, ticker, shares, price in sorted(events, key=lambda e: (e[0], e[1] != "buy")):
+        day = int(dates.searchsorted(date))
+        if kind == "buy":
+            lots.append({"ticker": ticker, "day": day, "price": price, "shares": shares, "open": shares})
+            continue
+        remaining = shares
+        for i, lot in enumerate(lots):
+            if remaining <= 0:
+                break
+            if lot["ticker"] != ticker or lot["open"] <= 0:
+                continue
+            taken = min(lot["open"], remaining)
+            lot["open"] -= taken
+            remaining -= taken
+            schedule.append((day, i, taken / lot["shares"], price * taken / lot["shares"]))
+
+    sold_fraction = np.zeros((len(dates), len(lots)))
+    sold_value = np.zeros((len(dates), len(lots)))
+    for day, i, fraction, value in schedule:
+        if day < len(dates):
+            sold_fraction[day, i] += fraction
+            sold_value[day, i] += value
+    # Opening holdings were bought out of the starting capital
+    starting_equity = cash + float((held["Shares"] * held["Cost Basis"]).sum())
+    return Lots(
+        dates=dates,
+        tickers=tickers,
+        closes=closes,
+        column=np.array([tickers.index(l["ticker"]) for l in lots], dtype=int),
+        entry=np.array([l["day"] for l in lots], dtype=int),
+        buy_price=np.array([l["price"] for l in lots], dtype=float),
+        shares=np.array([l["shares"] for l in lots], dtype=float),
+        sold_fraction=np.cumsum(sold_fraction, axis=0),
+        sold_value=np.cumsum(sold_value, axis=0),
+        starting_equity=starting_equity,
+    )
+
+
+def _position_size(lots: Lots, stop_pct: float, sizing: str, risk_per_trade: float) -> np.ndarray:
+    """Whole shares per lot under ``sizing``."""
+
+    if sizing == "logged":
+        shares = lots.shares
+    elif sizing == "equal":
+        notional = float(np.mean(lots.shares * lots.buy_price))
+        shares = notional / lots.buy_price
+    elif sizing == "risk":
+        shares = lots.starting_equity * risk_per_trade / (lots.buy_price * stop_pct)
+    else:
+        raise ValueError(f"Unknown sizing rule {sizing!r}; expected one of {SIZING_RULES}.")
+    return np.floor(shares)
+
+
+def equity_curve(
+    lots: Lots, stop_pct: float, sizing: str = "logged", risk_per_trade: float = RISK_PER_TRADE
+) -> tuple[np.ndarray, int]:
+    """Daily equity for one grid point and the number of stops hit.
+
+    Every lot is evaluated at once on a day x lot matrix. A lot is sold in
+    full on the first day its close is at or below the stop, after that
+    day's manual sells, as ``process_portfolio`` orders them.
+    """
+
+    days = len(lots.dates)
+    step = np.arange(days)[:, None]
+    price = lots.closes[:, lots.column]
+    shares = _position_size(lots, stop_pct, sizing, risk_per_trade)
+    stop = lots.buy_price * (1 - stop_pct)
+    active = step >= lots.entry
+    remaining = np.clip(1 - lots.sold_fraction, 0.0, 1.0)
+
+    with np.errstate(invalid="ignore"):
+        trigger = active & (price <= stop) & (remaining > 1e-9)
+    hit = trigger.any(axis=0)
+    exit_day = np.where(hit, trigger.argmax(axis=0), days)
+    last = np.minimum(exit_day, days - 1)
+    lot = np.arange(len(lots.entry))
+    stop_value = np.where(hit, remaining[last, lot] * price[last, lot], 0.0)
+
+    held = active & (step < exit_day)
+    holding = np.where(held, remaining * np.nan_to_num(price), 0.0)
+    proceeds = np.where(step < exit_day, lots.sold_value, lots.sold_value[last, lot] + stop_value)
+    cost = np.where(active, lots.buy_price, 0.0)
+    equity = lots.starting_equity + ((proceeds * active + holding - cost) * shares).sum(axis=1)
+    return equity, int(hit.sum())
+
+
+class _SharedArrays:
+    """Copy arrays into shared memory so pool workers map instead of unpickle them."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        self._blocks: list[shared_memory.SharedMemory] = []
+        self.specs: dict[str, tuple[str, tuple[int, ...], str]] = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+
+
+# Per-process state set up once by ``_init_worker``
+_WORKER: dict[str, object] = {}
+
+
+def _init_worker(
+    specs: dict[str, tuple[str, tuple[int, ...], str]], lots: Lots, risk_per_trade: float
+) -> None:
+    blocks = {name: shared_memory.SharedMemory(name=spec[0]) for name, spec in specs.items()}
+    views = {
+        name: np.ndarray(spec[1], np.dtype(spec[2]), buffer=blocks[name].buf)
+        for name, spec in specs.items()
+    }
+    _WORKER.update(
+        blocks=blocks,
+        lots=Lots(**{**lots.__dict__, **views}),
+        risk_per_trade=risk_per_trade,
+    )
+
+
+def _score(
+    lots: Lots, grid: list[tuple[float, str]], risk_per_trade: float, rf_annual: float
+) -> list[dict[str, object]]:
+    """Metrics for each grid point, scored together as one 2-D array."""
+
+    curves, stops = zip(*(equity_curve(lots, pct, rule, risk_per_trade) for pct, rule in grid))
+    a = np.vstack(curves)
+    sharpe = np.atleast_1d(sharpe_ratio(a, rf_annual))
+    sortino = np.atleast_1d(sortino_ratio(a, rf_annual))
+    drawdowns = np.atleast_1d(max_drawdown(a))
+    return [
+        {
+            "Stop Loss %": round(pct * 100, 4),
+            "Sizing": rule,
+            "Final Equity": round(float(a[i, -1]), 2),
+            "Total Return": float(a[i, -1] / lots.starting_equity - 1),
+            "Sharpe": float(sharpe[i]),
+            "Sortino": float(sortino[i]),
+            "Max Drawdown": float(drawdowns[i]),
+            "Stops Hit": stops[i],
+        }
+        for i, (pct, rule) in enumerate(grid)
+    ]
+
+
+def _score_in_worker(grid: list[tuple[float, str]], rf_annual: float) -> list[dict[str, object]]:
+    lots = _WORKER["lots"]
+    assert isinstance(lots, Lots)
+    return _score(lots, grid, float(_WORKER["risk_per_trade"]), rf_annual)  # type: ignore[arg-type]
+
+
+def sweep(
+    lots: Lots,
+    stop_pcts: list[float] | tuple[float, ...] = DEFAULT_STOPS,
+    sizing: list[str] | tuple[str, ...] = SIZING_RULES,
+    workers: int = 4,
+    risk_per_trade: float = RISK_PER_TRADE,
+    rf_annual: float = RISK_FREE_ANNUAL,
+) -> pd.DataFrame:
+    """Score every stop-loss/sizing combination.
+
+    Parameters
+    ----------
+    lots:
+        Positions from ``load_lots``.
+    stop_pcts:
+        Stop distances below the buy price, as fractions.
+    sizing:
+        Sizing rules from ``SIZING_RULES``.
+    workers:
+        Number of worker processes; ``1`` scores in this process.
+    risk_per_trade:
+        Fraction of starting equity lost at the stop under ``"risk"`` sizing.
+    rf_annual:
+        Risk-free rate used for Sharpe and Sortino, as in ``daily_results``.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per combination, sorted by Sharpe ratio.
+    """
+
+    for rule in sizing:
+        if rule not in SIZING_RULES:
+            raise ValueError(f"Unknown sizing rule {rule!r}; expected one of {SIZING_RULES}.")
+    grid = list(itertools.product(stop_pcts, sizing))
+    if workers <= 1 or len(grid) == 1:
+        rows = _score(lots, grid, risk_per_trade, rf_annual)
+    else:
+        size = max(1, math.ceil(len(grid) / (workers * 4)))
+        tasks = [grid[i : i + size] for i in range(0, len(grid), size)]
+        shared = _SharedArrays(
+            {
+                "closes": lots.closes,
+                "sold_fraction": lots.sold_fraction,
+                "sold_value": lots.sold_value,
+            }
+        )
+        # Workers receive the small per-lot vectors once; big arrays stay shared
+        light = Lots(
+            **{
+                **lots.__dict__,
+                "closes": np.empty(0),
+                "sold_fraction": np.empty(0),
+                "sold_value": np.empty(0),
+            }
+        )
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(shared.specs, light, risk_per_trade),
+            ) as pool:
+                rows = [
+                    row
+                    for part in pool.map(_score_in_worker, tasks, itertools.repeat(rf_annual))
+                    for row in part
+                ]
+        finally:
+            shared.close()
+    table = pd.DataFrame(rows)
+    return table.sort_values("Sharpe", ascending=False, ignore_index=True)
+
+
+def _floats(text: str) -> list[float]:
+    return [float(part) for part in text.split(",") if part.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep stop-loss levels over a portfolio's trades")
+    parser.add_argument("data_dir", type=Path, help="directory with the portfolio history and trade log")
+    parser.add_argument(
+        "--stops",
+        type=_floats,
+        default=list(DEFAULT_STOPS),
+        help="comma-separated stop distances, e.g. 0.05,0.1,0.2",
+    )
+    parser.add_argument(
+        "--sizing",
+        default=",".join(SIZING_RULES),
+        help=f"comma-separated sizing rules from {', '.join(SIZING_RULES)}",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument(
+        "--risk", type=float, default=RISK_PER_TRADE, help="equity fraction risked per lot"
+    )
+    parser.add_argument("--rf", type=float, default=RISK_FREE_ANNUAL, help="annual risk-free rate")
+    parser.add_argument("--offline", action="store_true", help="read prices only from the cache")
+    parser.add_argument("--out", type=Path, help="also write the table to this CSV file")
+    args = parser.parse_args()
+
+    storage = open_backend(args.data_dir)
+    lots = load_lots(
+        storage,
+        MarketDataSession(
+            start=price_start(storage),
+            cache=PriceCache(args.data_dir / PRICE_CACHE_NAME, offline=args.offline or None),
+        ),
+    )
+    table = sweep(
+        lots,
+        args.stops,
+        [rule.strip() for rule in args.sizing.split(",") if rule.strip()],
+        workers=args.workers,
+        risk_per_trade=args.risk,
+        rf_annual=args.rf,
+    )
+    with pd.option_context("display.width", 120, "display.max_rows", None):
+        print(table.to_string(index=False))
+    if args.out is not None:
+        table.to_csv(args.out, index=False)
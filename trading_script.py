@@ -5,36 +5,72 @@ results. It is intentionally lightweight and avoids changing existing
 logic or behaviour.
 """
 
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
-import numpy as np
 import pandas as pd
-import yfinance as yf
 from typing import cast
 import os
 
+from benchmarks import load_benchmarks
+from instrumentation import span
+from ledger import PositionLedger
+from market_client import AsyncMarketDataClient
+from market_data import MarketDataSession, download_history
+from metrics import (
+    METRICS_STATE_NAME,
+    RISK_FREE_ANNUAL,
+    RunningStats,
+    rebuild_running_stats,
+)
+from orders import Order, OrderSource, load_orders, validate_orders
+from price_cache import PRICE_CACHE_NAME, PriceCache
+from state import rebuild_state
+from stops import (
+    SELL_ACTIONS,
+    SELL_REASONS,
+    STOP_LOSS,
+    STOP_STATE_NAME,
+    HighWaterMarks,
+    StopRules,
+    evaluate_book,
+)
+from storage import StorageBackend, TradeLogWriter, TradeRows, open_backend
+
 # Shared file locations
 DATA_DIR = Path(".")
 PORTFOLIO_CSV = DATA_DIR / "chatgpt_portfolio_update.csv"
 TRADE_LOG_CSV = DATA_DIR / "chatgpt_trade_log.csv"
+# Backend used for every read and write of the two files above
+STORAGE: StorageBackend = open_backend(DATA_DIR)
+
+# Indices reported alongside holdings in ``daily_results``
+BENCHMARK_TICKERS = ["^RUT", "IWO", "XBI"]
+# S&P 500 comparison starts from the experiment's first day
+SPX_TICKER = "^SPX"
+SPX_START_DATE = "2025-06-27"
 
 
-def set_data_dir(data_dir: Path) -> None:
-    """Update global paths for portfolio and trade logs.
+def set_data_dir(data_dir: Path, backend: str | None = None) -> None:
+    """Update global paths and storage backend for portfolio and trade logs.
 
     Parameters
     ----------
     data_dir:
         Directory where ``chatgpt_portfolio_update.csv`` and
         ``chatgpt_trade_log.csv`` are stored.
+    backend:
+        ``"csv"`` or ``"parquet"``. ``None`` keeps whichever layout the
+        directory already uses, defaulting to CSV.
     """
 
-    global DATA_DIR, PORTFOLIO_CSV, TRADE_LOG_CSV
+    global DATA_DIR, PORTFOLIO_CSV, TRADE_LOG_CSV, STORAGE
     DATA_DIR = Path(data_dir)
     os.makedirs(DATA_DIR, exist_ok=True)
     PORTFOLIO_CSV = DATA_DIR / "chatgpt_portfolio_update.csv"
     TRADE_LOG_CSV = DATA_DIR / "chatgpt_trade_log.csv"
+    STORAGE = open_backend(DATA_DIR, backend)
 
 # Today's date reused across logs
 today = datetime.today().strftime("%Y-%m-%d")
@@ -42,27 +78,218 @@ now = datetime.now()
 day = now.weekday()
 
 
+@dataclass
+class PortfolioContext:
+    """Where and when one portfolio run reads and writes its history.
 
-def process_portfolio(portfolio: pd.DataFrame, starting_cash: float) -> tuple[pd.DataFrame, float]:
-    """Update daily price information, log stop-loss sells, and prompt for trades.
+    Every function that touches the data directory or stamps a date takes
+    a context, so several portfolios can be processed side by side. When
+    none is given the module-level globals set by ``set_data_dir`` are
+    used, which keeps single-portfolio scripts working unchanged.
 
-    The function iterates through each position, retrieves the latest close
-    price and appends a summary row. Before processing, the user may record
-    one or more manual buys or sells which are then applied to the portfolio.
-    Results are appended to ``PORTFOLIO_CSV``.
+    Parameters
+    ----------
+    data_dir:
+        Directory holding the portfolio history, trade log and caches.
+    storage:
+        Backend used for every read and write of the history.
+    today:
+        Date stamped on logged rows, ``YYYY-MM-DD``.
+    day:
+        Weekday of ``today`` (Monday is 0) used for the weekend check.
     """
-    results: list[dict[str, object]] = []
-    total_value = 0.0
-    total_pnl = 0.0
-    cash = starting_cash
 
-    if day == 6 or day == 5:
-        check = input("""Today is currently a weekend, so markets were never open. 
+    data_dir: Path
+    storage: StorageBackend
+    today: str
+    day: int
+
+    @classmethod
+    def create(
+        cls,
+        data_dir: Path | str,
+        backend: str | None = None,
+        when: datetime | None = None,
+    ) -> "PortfolioContext":
+        """Build a context for ``data_dir``, creating the directory.
+
+        ``when`` defaults to now; the parallel runner passes one shared
+        timestamp so every portfolio is stamped with the same date.
+        """
+
+        data_dir = Path(data_dir)
+        os.makedirs(data_dir, exist_ok=True)
+        when = when or datetime.now()
+        return cls(
+            data_dir=data_dir,
+            storage=open_backend(data_dir, backend),
+            today=when.strftime("%Y-%m-%d"),
+            day=when.weekday(),
+        )
+
+    @property
+    def portfolio_csv(self) -> Path:
+        return self.data_dir / "chatgpt_portfolio_update.csv"
+
+    @property
+    def trade_log_csv(self) -> Path:
+        return self.data_dir / "chatgpt_trade_log.csv"
+
+
+def _context(ctx: PortfolioContext | None) -> PortfolioContext:
+    """Return ``ctx`` or one built from the module-level globals."""
+
+    if ctx is not None:
+        return ctx
+    return PortfolioContext(data_dir=DATA_DIR, storage=STORAGE, today=today, day=day)
+
+
+def process_portfolio(
+    portfolio: pd.DataFrame,
+    starting_cash: float,
+    session: MarketDataSession | None = None,
+    orders: OrderSource | None = None,
+    ctx: PortfolioContext | None = None,
+    rules: StopRules | None = None,
+) -> tuple[pd.DataFrame, float]:
+    """Update daily price information, log stop-loss sells, and apply trades.
+
+    Latest closes for every position are fetched in one batched request and
+    the book is valued in a single vectorised pass before a summary row is
+    appended. Before processing, manual buys or sells are applied to the
+    portfolio: taken from ``orders`` when given (a JSON/CSV order file or a
+    list, validated up front and applied without any prompts), otherwise
+    entered interactively.
+    Exits are checked for every position at once by ``stops.evaluate_book``:
+    each position's stop loss plus the trailing-stop and take-profit
+    ``rules``, if given. Triggered positions are sold in one batch, and the
+    trailing high-water marks are saved next to the CSVs.
+    Results are appended to the portfolio history in ``ctx`` and every trade
+    of the session is appended to its trade log in one flush. Prices come
+    from ``session`` when one is shared with ``daily_results``.
+    """
+    ctx = _context(ctx)
+    cash = starting_cash
+    rules = rules or StopRules()
+    if session is None:
+        # An ATR trailing stop needs a few weeks of bars
+        session = MarketDataSession(period="1mo" if rules.atr_multiple is not None else "1d")
+    if orders is not None:
+        orders = validate_orders(load_orders(orders), portfolio, cash, session)
+
+    if ctx.day == 6 or ctx.day == 5:
+        if orders is None:
+            check = input("""Today is currently a weekend, so markets were never open. 
     This will cause the program to calculate data from the last day (usually Friday), and save it as today.
     Are you sure you want to do this? To exit, enter 1.""")
-    if check == "1":
-        raise SystemError("Exitting program.")
+            if check == "1":
+                raise SystemError("Exitting program.")
+        else:
+            print("Today is a weekend, using prices from the last trading day.")
+
+    # Every trade in this session is appended to the log in a single flush
+    with ctx.storage.trade_log_writer() as trade_log:
+        if orders is None:
+            cash, portfolio = prompt_trades(cash, portfolio, trade_log, ctx)
+        else:
+            cash, portfolio = apply_orders(orders, cash, portfolio, trade_log, ctx)
+
+        # Fetch every holding in one batched request, then value the book at once
+        book = portfolio.reset_index(drop=True)
+        prices = session.latest_prices(book["ticker"])
+        price = book["ticker"].str.upper().map(prices["Close"]).round(2)
+        shares = book["shares"].astype(int)
+        cost = book["buy_price"]
+        stop = book["stop_loss"]
+        value = (price * shares).round(2)
+        pnl = ((price - cost) * shares).round(2)
+
+        has_data = price.notna()
+        marks = HighWaterMarks.load(ctx.data_dir / STOP_STATE_NAME) if rules.trails else None
+        exits = evaluate_book(book, price, prices, session, rules, marks)
+        rule = pd.Series(exits.action, index=book.index)
+        stopped = pd.Series(exits.triggered, index=book.index)
+        held = has_data & ~stopped
+
+        for ticker in book.loc[~has_data, "ticker"]:
+            print(f"No data for {ticker}")
+        sells = pd.DataFrame(
+            {
+                "ticker": book["ticker"],
+                "shares": shares,
+                "price": price,
+                "cost": cost,
+                "pnl": pnl,
+                "reason": rule.map(SELL_REASONS),
+            }
+        )[stopped]
+        portfolio = log_sells(sells, portfolio, trade_log, ctx)
+
+    if marks is not None:
+        marks.update(
+            book["ticker"], cost, exits.high_water, ~stopped.to_numpy(), ctx.today, has_data.to_numpy()
+        )
+        marks.save(ctx.data_dir / STOP_STATE_NAME)
+        for i in book.index[held]:
+            print(
+                f"{book.at[i, 'ticker']} stop: ${exits.stop[i]:.2f} "
+                f"(high since buying ${exits.high_water[i]:.2f})"
+            )
+
+    cash += float(value[stopped].sum())
+    total_value = float(value[held].sum())
+    total_pnl = float(pnl[held].sum())
+
+    action = pd.Series("HOLD", index=book.index, dtype=object)
+    action[stopped] = rule[stopped].map(SELL_ACTIONS)
+    action[~has_data] = "NO DATA"
+    results = pd.DataFrame(
+        {
+            "Date": ctx.today,
+            "Ticker": book["ticker"],
+            "Shares": shares,
+            "Cost Basis": cost,
+            "Stop Loss": stop,
+            "Current Price": price.astype(object).where(has_data, ""),
+            "Total Value": value.astype(object).where(has_data, ""),
+            "PnL": pnl.astype(object).where(has_data, ""),
+            "Action": action,
+            "Cash Balance": "",
+            "Total Equity": "",
+        }
+    )
+
+    # Append TOTAL summary row
+    total_row = {
+        "Date": ctx.today,
+        "Ticker": "TOTAL",
+        "Shares": "",
+        "Cost Basis": "",
+        "Stop Loss": "",
+        "Current Price": "",
+        "Total Value": round(total_value, 2),
+        "PnL": round(total_pnl, 2),
+        "Action": "",
+        "Cash Balance": round(cash, 2),
+        "Total Equity": round(total_value + cash, 2),
+    }
 
+    df = pd.concat([results, pd.DataFrame([total_row])], ignore_index=True)
+    # Only today's tail segment of the history is rewritten
+    if ctx.storage.write_portfolio_day(ctx.today, df):
+        print("rows for today already logged, replacing them with this run...")
+    return portfolio, cash
+
+
+def prompt_trades(
+    cash: float,
+    portfolio: pd.DataFrame,
+    trade_log: TradeLogWriter | None = None,
+    ctx: PortfolioContext | None = None,
+) -> tuple[float, pd.DataFrame]:
+    """Ask for manual buys and sells until the user presses Enter."""
+    # Lots stay open across the session, so sales relieve the right ones
+    ledger = PositionLedger.from_frame(portfolio)
     while True:
         action = input(
             f""" You have {cash} in cash.
@@ -80,7 +307,8 @@ Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press
                 print("Invalid input. Manual buy cancelled.")
             else:
                 cash, portfolio = log_manual_buy(
-                    buy_price, shares, ticker, stop_loss, cash, portfolio
+                    buy_price, shares, ticker, stop_loss, cash, portfolio, trade_log, ctx,
+                    ledger,
                 )
             continue
         if action == "s":
@@ -94,88 +322,47 @@ Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press
                 print("Invalid input. Manual sell cancelled.")
             else:
                 cash, portfolio = log_manual_sell(
-                    sell_price, shares, ticker, cash, portfolio
+                    sell_price, shares, ticker, cash, portfolio, trade_log, ctx, ledger
                 )
             continue
-        break
+        return cash, portfolio
 
-    for _, stock in portfolio.iterrows():
-        ticker = stock["ticker"]
-        shares = int(stock["shares"])
-        cost = stock["buy_price"]
-        stop = stock["stop_loss"]
-        data = yf.Ticker(ticker).history(period="1d")
 
-        if data.empty:
-            print(f"No data for {ticker}")
-            row = {
-                "Date": today,
-                "Ticker": ticker,
-                "Shares": shares,
-                "Cost Basis": cost,
-                "Stop Loss": stop,
-                "Current Price": "",
-                "Total Value": "",
-                "PnL": "",
-                "Action": "NO DATA",
-                "Cash Balance": "",
-                "Total Equity": "",
-            }
+def apply_orders(
+    orders: list[Order],
+    cash: float,
+    portfolio: pd.DataFrame,
+    trade_log: TradeLogWriter | None = None,
+    ctx: PortfolioContext | None = None,
+) -> tuple[float, pd.DataFrame]:
+    """Apply validated ``orders`` in sequence without prompting."""
+    ledger = PositionLedger.from_frame(portfolio)
+    for order in orders:
+        if order.action == "buy":
+            cash, portfolio = execute_buy(
+                order.price, order.shares, order.ticker, cast(float, order.stop_loss),
+                cash, portfolio, trade_log, ctx, ledger,
+            )
         else:
-            price = round(data["Close"].iloc[-1], 2)
-            value = round(price * shares, 2)
-            pnl = round((price - cost) * shares, 2)
-
-            if price <= stop:
-                action = "SELL - Stop Loss Triggered"
-                cash += value
-                portfolio = log_sell(ticker, shares, price, cost, pnl, portfolio)
-            else:
-                action = "HOLD"
-                total_value += value
-                total_pnl += pnl
-
-            row = {
-                "Date": today,
-                "Ticker": ticker,
-                "Shares": shares,
-                "Cost Basis": cost,
-                "Stop Loss": stop,
-                "Current Price": price,
-                "Total Value": value,
-                "PnL": pnl,
-                "Action": action,
-                "Cash Balance": "",
-                "Total Equity": "",
-            }
+            cash, portfolio = execute_sell(
+                order.price, order.shares, order.ticker, cash, portfolio,
+                order.reason, trade_log, ctx, ledger,
+            )
+    return cash, portfolio
 
-        results.append(row)
-
-    # Append TOTAL summary row
-    total_row = {
-        "Date": today,
-        "Ticker": "TOTAL",
-        "Shares": "",
-        "Cost Basis": "",
-        "Stop Loss": "",
-        "Current Price": "",
-        "Total Value": round(total_value, 2),
-        "PnL": round(total_pnl, 2),
-        "Action": "",
-        "Cash Balance": round(cash, 2),
-        "Total Equity": round(total_value + cash, 2),
-    }
-    results.append(total_row)
 
-    df = pd.DataFrame(results)
-    if PORTFOLIO_CSV.exists():
-        existing = pd.read_csv(PORTFOLIO_CSV)
-        existing = existing[existing["Date"] != today]
-        print("rows for today already logged, not saving results to CSV...")
-        df = pd.concat([existing, df], ignore_index=True)
+def _record_trade(
+    log: dict[str, object],
+    trade_log: TradeRows | None,
+    ctx: PortfolioContext,
+) -> None:
+    """Queue ``log`` on the session writer or append it immediately."""
 
-    df.to_csv(PORTFOLIO_CSV, index=False)
-    return portfolio, cash
+    if trade_log is not None:
+        trade_log.append(log)
+        return
+    with ctx.storage.trade_log_writer() as writer:
+        writer.append(log)
 
 
 def log_sell(
@@ -185,26 +372,57 @@ def log_sell(
     cost: float,
     pnl: float,
     portfolio: pd.DataFrame,
+    trade_log: TradeLogWriter | None = None,
+    ctx: PortfolioContext | None = None,
+    reason: str = SELL_REASONS[STOP_LOSS],
 ) -> pd.DataFrame:
-    """Record a stop-loss sale in ``TRADE_LOG_CSV`` and remove the ticker."""
-    log = {
-        "Date": today,
-        "Ticker": ticker,
-        "Shares Sold": shares,
-        "Sell Price": price,
-        "Cost Basis": cost,
-        "PnL": pnl,
-        "Reason": "AUTOMATED SELL - STOPLOSS TRIGGERED",
-    }
+    """Record a stop-loss sale in the trade log and remove the ticker.
+
+    The row is queued on ``trade_log`` when a session writer is given,
+    otherwise it is appended to the log straight away.
+    """
+    sells = pd.DataFrame(
+        [{"ticker": ticker, "shares": shares, "price": price, "cost": cost, "pnl": pnl, "reason": reason}]
+    )
+    return log_sells(sells, portfolio, trade_log, ctx)
 
-    portfolio = portfolio[portfolio["ticker"] != ticker]
 
-    if TRADE_LOG_CSV.exists():
-        df = pd.read_csv(TRADE_LOG_CSV)
-        df = pd.concat([df, pd.DataFrame([log])], ignore_index=True)
+def log_sells(
+    sells: pd.DataFrame,
+    portfolio: pd.DataFrame,
+    trade_log: TradeLogWriter | None = None,
+    ctx: PortfolioContext | None = None,
+) -> pd.DataFrame:
+    """Record automated sales in the trade log and remove the tickers.
+
+    ``sells`` has ``ticker``, ``shares``, ``price``, ``cost``, ``pnl`` and
+    ``reason`` columns, one row per position sold in full. The rows go to
+    the log in one batch and the portfolio is filtered once.
+    """
+    ctx = _context(ctx)
+    if sells.empty:
+        return portfolio
+    rows = [
+        {
+            "Date": ctx.today,
+            "Ticker": sell.ticker,
+            "Shares Sold": sell.shares,
+            "Sell Price": sell.price,
+            "Cost Basis": sell.cost,
+            "PnL": sell.pnl,
+            "Reason": sell.reason,
+        }
+        for sell in sells.itertuples(index=False)
+    ]
+    portfolio = portfolio[~portfolio["ticker"].isin(sells["ticker"])]
+
+    if trade_log is not None:
+        for log in rows:
+            trade_log.append(log)
     else:
-        df = pd.DataFrame([log])
-    df.to_csv(TRADE_LOG_CSV, index=False)
+        with ctx.storage.trade_log_writer() as writer:
+            for log in rows:
+                writer.append(log)
     return portfolio
 
 
@@ -215,6 +433,9 @@ def log_manual_buy(
     stoploss: float,
     cash: float,
     chatgpt_portfolio: pd.DataFrame,
+    trade_log: TradeLogWriter | None = None,
+    ctx: PortfolioContext | None = None,
+    ledger: PositionLedger | None = None,
 ) -> tuple[float, pd.DataFrame]:
     """Log a manual purchase and append to the portfolio."""
     check = input(
@@ -224,10 +445,33 @@ def log_manual_buy(
     if check == "1":
         raise SystemError("Please remove this function call.")
 
-    data = yf.download(ticker, period="1d")
-    data = cast(pd.DataFrame, data)
-    if data.empty:
+    if ticker not in download_history([ticker], period="1d"):
         raise SystemError(f"error, could not find ticker {ticker}")
+    return execute_buy(
+        buy_price, shares, ticker, stoploss, cash, chatgpt_portfolio, trade_log, ctx, ledger
+    )
+
+
+def execute_buy(
+    buy_price: float,
+    shares: float,
+    ticker: str,
+    stoploss: float,
+    cash: float,
+    chatgpt_portfolio: pd.DataFrame,
+    trade_log: TradeRows | None = None,
+    ctx: PortfolioContext | None = None,
+    ledger: PositionLedger | None = None,
+    verbose: bool = True,
+) -> tuple[float, pd.DataFrame]:
+    """Apply a purchase to the portfolio and trade log without prompting.
+
+    The purchase is kept as its own lot in ``ledger``, which is built from
+    ``chatgpt_portfolio`` when not given. The returned portfolio has one
+    row per ticker with ``buy_price`` at the position's average cost.
+    ``verbose=False`` skips the confirmation message.
+    """
+    ctx = _context(ctx)
     if buy_price * shares > cash:
         raise SystemError(
             f"error, you have {cash} but are trying to spend {buy_price * shares}. Are you sure you can do this?"
@@ -235,7 +479,7 @@ def log_manual_buy(
     pnl = 0.0
 
     log = {
-        "Date": today,
+        "Date": ctx.today,
         "Ticker": ticker,
         "Shares Bought": shares,
         "Buy Price": buy_price,
@@ -244,38 +488,16 @@ def log_manual_buy(
         "Reason": "MANUAL BUY - New position",
     }
 
-    if os.path.exists(TRADE_LOG_CSV):
-        df = pd.read_csv(TRADE_LOG_CSV)
-        df = pd.concat([df, pd.DataFrame([log])], ignore_index=True)
-    else:
-        df = pd.DataFrame([log])
-    df.to_csv(TRADE_LOG_CSV, index=False)
-    # if the portfolio doesn't already contain ticker, create a new row.
-    
-    mask = chatgpt_portfolio["ticker"] == ticker
-
-    if not mask.any():
-        new_trade = {
-        "ticker": ticker,
-        "shares": shares,
-        "stop_loss": stoploss,
-        "buy_price": buy_price,
-        "cost_basis": buy_price * shares,
-    }
-        chatgpt_portfolio = pd.concat(
-            [chatgpt_portfolio, pd.DataFrame([new_trade])], ignore_index=True
-    )
-    # if the portfolio contains ticker already, update the row.
-    else:
-        row_index = chatgpt_portfolio[mask].index[0]
-        chatgpt_portfolio.loc[row_index, 'shares'] = chatgpt_portfolio.loc[row_index, "shares"] + shares # type: ignore
-        current_cost_basis =  float(chatgpt_portfolio.loc[row_index, 'cost_basis'].item()) # type: ignore
-        chatgpt_portfolio.loc[row_index, 'cost_basis'] = shares * buy_price + current_cost_basis
+    _record_trade(log, trade_log, ctx)
+    if ledger is None:
+        ledger = PositionLedger.from_frame(chatgpt_portfolio)
+    ledger.buy(ticker, shares, buy_price, stoploss, ctx.today)
     # update all stoploss for all shares
-        chatgpt_portfolio.loc[row_index, 'stop_loss'] = stoploss
+    ledger.set_stop(ticker, stoploss)
     cash = cash - shares * buy_price
-    print(f"Manual buy for {ticker} complete!")
-    return cash, chatgpt_portfolio
+    if verbose:
+        print(f"Manual buy for {ticker} complete!")
+    return cash, ledger.to_frame()
 
 
 def log_manual_sell(
@@ -284,6 +506,9 @@ def log_manual_sell(
     ticker: str,
     cash: float,
     chatgpt_portfolio: pd.DataFrame,
+    trade_log: TradeLogWriter | None = None,
+    ctx: PortfolioContext | None = None,
+    ledger: PositionLedger | None = None,
 ) -> tuple[float, pd.DataFrame]:
     """Log a manual sale and update the portfolio."""
     reason = input(
@@ -292,119 +517,149 @@ def log_manual_sell(
 
     if reason == "1":
         raise SystemError("Delete this function call from the program.")
+    return execute_sell(
+        sell_price, shares_sold, ticker, cash, chatgpt_portfolio, reason, trade_log, ctx,
+        ledger,
+    )
+
+
+def execute_sell(
+    sell_price: float,
+    shares_sold: float,
+    ticker: str,
+    cash: float,
+    chatgpt_portfolio: pd.DataFrame,
+    reason: str = "",
+    trade_log: TradeRows | None = None,
+    ctx: PortfolioContext | None = None,
+    ledger: PositionLedger | None = None,
+    verbose: bool = True,
+) -> tuple[float, pd.DataFrame]:
+    """Apply a sale to the portfolio and trade log without prompting.
+
+    ``reason`` is recorded in the log as ``MANUAL SELL - <reason>``. Cost
+    basis and PnL come from the lots the sale relieves in ``ledger``
+    (built from ``chatgpt_portfolio`` when not given). ``verbose=False``
+    skips the confirmation message.
+    """
+    ctx = _context(ctx)
     if isinstance(chatgpt_portfolio, list):
         chatgpt_portfolio = pd.DataFrame(chatgpt_portfolio)
-    if ticker not in chatgpt_portfolio["ticker"].values:
+    if ledger is None:
+        ledger = PositionLedger.from_frame(chatgpt_portfolio)
+    if ticker not in ledger:
         raise KeyError(f"error, could not find {ticker} in portfolio")
-    ticker_row = chatgpt_portfolio[chatgpt_portfolio["ticker"] == ticker]
-
-    total_shares = int(ticker_row["shares"].item())
-    if shares_sold > total_shares:
-        raise ValueError(
-            f"You are trying to sell {shares_sold} but only own {total_shares}."
-        )
-    buy_price = float(ticker_row["buy_price"].item())
-    cost_basis = buy_price * shares_sold
-    pnl = sell_price * shares_sold - cost_basis
+    relief = ledger.sell(ticker, shares_sold, sell_price)
     log = {
-        "Date": today,
+        "Date": ctx.today,
         "Ticker": ticker,
         "Shares Bought": "",
         "Buy Price": "",
-        "Cost Basis": cost_basis,
-        "PnL": pnl,
+        "Cost Basis": relief.cost_basis,
+        "PnL": relief.pnl,
         "Reason": f"MANUAL SELL - {reason}",
         "Shares Sold": shares_sold,
         "Sell Price": sell_price,
     }
-    if os.path.exists(TRADE_LOG_CSV):
-        df = pd.read_csv(TRADE_LOG_CSV)
-        df = pd.concat([df, pd.DataFrame([log])], ignore_index=True)
-    else:
-        df = pd.DataFrame([log])
-    df.to_csv(TRADE_LOG_CSV, index=False)
-
-    if total_shares == shares_sold:
-        chatgpt_portfolio = chatgpt_portfolio[chatgpt_portfolio["ticker"] != ticker]
-    else:
-        row_index = ticker_row.index[0]
-        chatgpt_portfolio.loc[row_index, "shares"] = total_shares - shares_sold
-        chatgpt_portfolio.loc[row_index, "cost_basis"] = chatgpt_portfolio.loc[row_index, "shares"] * chatgpt_portfolio.loc[row_index, "buy_price"]
+    _record_trade(log, trade_log, ctx)
 
     cash = cash + shares_sold * sell_price
-    print(f"manual sell for {ticker} complete!")
-    return cash, chatgpt_portfolio
+    if verbose:
+        print(f"manual sell for {ticker} complete!")
+    return cash, ledger.to_frame()
 
 
-def daily_results(chatgpt_portfolio: pd.DataFrame, cash: float) -> None:
-    """Print daily price updates and performance metrics."""
+def update_metrics_state(ctx: PortfolioContext | None = None) -> RunningStats:
+    """Fold the latest TOTAL row of the portfolio history into the saved metrics.
+
+    Only the newest day's rows are read. The state is rebuilt from the full
+    history when it is missing or does not end on the previous logged date
+    (for example after a skipped run or a manual edit).
+    """
+
+    ctx = _context(ctx)
+    with span("metrics.update") as sp:
+        dates = ctx.storage.portfolio_dates()
+        date = dates[-1]
+        latest = ctx.storage.read_portfolio(["Date", "Ticker", "Total Equity"], start=date, end=date)
+        total = latest[latest["Ticker"] == "TOTAL"].iloc[-1]
+        prior = dates[-2] if len(dates) > 1 else None
+
+        state_path = ctx.data_dir / METRICS_STATE_NAME
+        stats = RunningStats.load(state_path)
+        in_sync = stats is not None and (
+            stats.last_date == prior
+            or (stats.last_date == date and (stats.previous or {}).get("last_date") == prior)
+        )
+        if stats is not None and in_sync:
+            stats.update(date, float(total["Total Equity"]))
+            sp.set(mode="incremental")
+        else:
+            stats = rebuild_running_stats(ctx.storage)
+            sp.set(mode="rebuild")
+        stats.save(state_path)
+        sp.set(days=stats.n_days)
+    return stats
+
+
+def daily_results(
+    chatgpt_portfolio: pd.DataFrame,
+    cash: float,
+    session: MarketDataSession | None = None,
+    ctx: PortfolioContext | None = None,
+) -> None:
+    """Print daily price updates and performance metrics.
+
+    Holdings, benchmark indices and the S&P 500 series are read from
+    ``session``; anything it does not hold yet is fetched in one batch.
+    Tickers that fail to download are reported and skipped rather than
+    aborting the run.
+    """
+    ctx = _context(ctx)
+    if session is None:
+        session = MarketDataSession(start=SPX_START_DATE)
     if isinstance(chatgpt_portfolio, pd.DataFrame):
         portfolio_dict = chatgpt_portfolio.to_dict(orient="records")
-    print(f"prices and updates for {today}")
-    for stock in portfolio_dict + [{"ticker": "^RUT"}] + [{"ticker": "IWO"}] + [{"ticker": "XBI"}]:
-        ticker = stock["ticker"]
-        try:
-            data = yf.download(ticker, period="2d", progress=False)
-            data = cast(pd.DataFrame, data)
-            if data.empty or len(data) < 2:
-                print(f"Data for {ticker} was empty or incomplete.")
-                continue
-            price = float(data["Close"].iloc[-1].item())
-            last_price = float(data["Close"].iloc[-2].item())
-
-            percent_change = ((price - last_price) / last_price) * 100
-            volume = float(data["Volume"].iloc[-1].item())
-        except Exception as e:
-            raise Exception(f"Download for {ticker} failed. {e} Try checking internet connection.")
+    tickers = [str(stock["ticker"]) for stock in portfolio_dict] + BENCHMARK_TICKERS
+    # Tickers that fail to download are reported and skipped below
+    session.prefetch(tickers + [SPX_TICKER])
+    print(f"prices and updates for {ctx.today}")
+    for ticker in tickers:
+        price = session.close(ticker)
+        last_price = session.previous_close(ticker)
+        volume = session.volume(ticker)
+        if price is None or last_price is None or volume is None:
+            print(f"Data for {ticker} was empty or incomplete.")
+            continue
+        percent_change = ((price - last_price) / last_price) * 100
         print(f"{ticker} closing price: {price:.2f}")
         print(f"{ticker} volume for today: ${volume:,}")
         print(f"percent change from the day before: {percent_change:.2f}%")
-    chatgpt_df = pd.read_csv(PORTFOLIO_CSV)
-
-    # Filter TOTAL rows and get latest equity
-    chatgpt_totals = chatgpt_df[chatgpt_df["Ticker"] == "TOTAL"].copy()
-    chatgpt_totals["Date"] = pd.to_datetime(chatgpt_totals["Date"])
-    final_date = chatgpt_totals["Date"].max()
-    final_value = chatgpt_totals[chatgpt_totals["Date"] == final_date]
-    final_equity = float(final_value["Total Equity"].values[0])
-    equity_series = chatgpt_totals["Total Equity"].astype(float).reset_index(drop=True)
-
-    # Daily returns
-    daily_pct = equity_series.pct_change().dropna()
-
-    total_return = (equity_series.iloc[-1] - equity_series.iloc[0]) / equity_series.iloc[0]
+    # Fold only today's TOTAL row into the saved running statistics
+    stats = update_metrics_state(ctx)
+    final_date = pd.Timestamp(stats.last_date)
+    final_equity = stats.last_equity
 
     # Number of total trading days
-    n_days = len(chatgpt_totals)
-
-    # Risk-free return over total trading period (assuming 4.5% risk-free rate)
-    rf_annual = 0.045
-    rf_period = (1 + rf_annual) ** (n_days / 252) - 1
+    n_days = stats.n_days
 
-    # Standard deviation of daily returns
-    std_daily = daily_pct.std()
-    negative_pct = daily_pct[daily_pct < 0]
-    negative_std = negative_pct.std()
-    # Sharpe Ratio
-    sharpe_total = (total_return - rf_period) / (std_daily * np.sqrt(n_days))
-    # Sortino Ratio
-    sortino_total = (total_return - rf_period) / (negative_std * np.sqrt(n_days))
+    # Total-period ratios against a 4.5% risk-free rate
+    sharpe_total = stats.sharpe_ratio(RISK_FREE_ANNUAL)
+    sortino_total = stats.sortino_ratio(RISK_FREE_ANNUAL)
 
     # Output
     print(f"Total Sharpe Ratio over {n_days} days: {sharpe_total:.4f}")
     print(f"Total Sortino Ratio over {n_days} days: {sortino_total:.4f}")
     print(f"Latest ChatGPT Equity: ${final_equity:.2f}")
-    # Get S&P 500 data
-    spx = yf.download("^SPX", start="2025-06-27", end=final_date + pd.Timedelta(days=1), progress=False)
-    spx = cast(pd.DataFrame, spx)
-    spx = spx.reset_index()
-
-    # Normalize to $100
-    initial_price = spx["Close"].iloc[0].item()
-    price_now = spx["Close"].iloc[-1].item()
-    scaling_factor = 100 / initial_price
-    spx_value = price_now * scaling_factor
-    print(f"$100 Invested in the S&P 500: ${spx_value:.2f}")
+    # $100 in the S&P 500 from the first day up to the latest portfolio date,
+    # from the benchmark series saved next to the CSVs and extended with today's bars
+    benchmarks = load_benchmarks(ctx.data_dir, session, [SPX_TICKER] + BENCHMARK_TICKERS)
+    spx_value = benchmarks.value(SPX_TICKER, SPX_START_DATE, final_date)
+
+    if spx_value is None:
+        print("S&P 500 data was unavailable, skipping the $100 comparison.")
+    else:
+        print(f"$100 Invested in the S&P 500: ${spx_value:.2f}")
     print(f"today's portfolio: {chatgpt_portfolio}")
     print(f"cash balance: {cash}")
 
@@ -415,10 +670,65 @@ def daily_results(chatgpt_portfolio: pd.DataFrame, cash: float) -> None:
     )
 
 
-def main(
+def as_portfolio_frame(
     chatgpt_portfolio: list[dict[str, object]] | dict | pd.DataFrame,
+) -> pd.DataFrame:
+    """Return positions given as a list, mapping or DataFrame as a DataFrame."""
+
+    if isinstance(chatgpt_portfolio, list):
+        return pd.DataFrame(chatgpt_portfolio)
+    if isinstance(chatgpt_portfolio, dict):
+        return pd.DataFrame(chatgpt_portfolio)
+    if not isinstance(chatgpt_portfolio, pd.DataFrame):
+        raise KeyError("The format for portfolio wasn't a dict, list, or DataFrame.")
+    return chatgpt_portfolio
+
+
+def required_tickers(
+    chatgpt_portfolio: pd.DataFrame, orders: list[Order] | None = None
+) -> list[str]:
+    """Every symbol one run reads: holdings, ordered tickers and benchmarks."""
+
+    return (
+        list(chatgpt_portfolio["ticker"])
+        + [order.ticker for order in orders or []]
+        + BENCHMARK_TICKERS
+        + [SPX_TICKER]
+    )
+
+
+def run_portfolio(
+    chatgpt_portfolio: pd.DataFrame,
     cash: float,
+    session: MarketDataSession,
+    orders: list[Order] | None = None,
+    ctx: PortfolioContext | None = None,
+    rules: StopRules | None = None,
+) -> tuple[pd.DataFrame, float]:
+    """Process one portfolio and print its daily results.
+
+    Returns the updated positions and cash so callers running several
+    portfolios can report on each of them.
+    """
+
+    with span("run.process_portfolio", positions=len(chatgpt_portfolio)):
+        chatgpt_portfolio, cash = process_portfolio(
+            chatgpt_portfolio, cash, session, orders, ctx, rules
+        )
+    with span("run.daily_results", positions=len(chatgpt_portfolio)):
+        daily_results(chatgpt_portfolio, cash, session, ctx)
+    return chatgpt_portfolio, cash
+
+
+def main(
+    chatgpt_portfolio: list[dict[str, object]] | dict | pd.DataFrame | None,
+    cash: float | None,
     data_dir: Path | None = None,
+    offline: bool | None = None,
+    backend: str | None = None,
+    orders: OrderSource | None = None,
+    client: AsyncMarketDataClient | None = None,
+    rules: StopRules | None = None,
 ) -> None:
     """Run the trading script.
 
@@ -426,25 +736,51 @@ def main(
     ----------
     chatgpt_portfolio:
         Portfolio positions provided as a DataFrame, a mapping of column
-        names to lists, or a list of row dictionaries.
+        names to lists, or a list of row dictionaries. ``None`` rebuilds
+        positions and cash from the trade log in ``data_dir`` (see
+        ``state.py``).
     cash:
-        Starting cash balance.
+        Starting cash balance. ``None`` rebuilds it from the trade log.
     data_dir:
-        Directory where trade and portfolio CSVs will be stored.
+        Directory where trade and portfolio CSVs will be stored. ``None``
+        uses the directory last passed to ``set_data_dir``.
+    offline:
+        Serve prices only from the on-disk cache in ``data_dir``. ``None``
+        defers to the ``MICROCAP_OFFLINE`` environment variable.
+    backend:
+        Storage layout for the history, ``"csv"`` or ``"parquet"``. ``None``
+        keeps the layout already present in ``data_dir``.
+    orders:
+        Manual trades for a headless run, as a JSON/CSV order file or a
+        list of orders. They are validated before anything is written and
+        no prompts are shown. ``None`` asks for trades interactively.
+    client:
+        Market data client, for example one wrapping ``FakeProvider`` in
+        tests. ``None`` downloads from yfinance.
+    rules:
+        Trailing-stop and take-profit rules checked with every position's
+        own stop loss. ``None`` checks the stop losses only.
     """
 
-    if data_dir is not None:
-        set_data_dir(data_dir)
-
-    if isinstance(chatgpt_portfolio, list):
-        chatgpt_portfolio = pd.DataFrame(chatgpt_portfolio)
-    elif isinstance(chatgpt_portfolio, dict):
-        chatgpt_portfolio = pd.DataFrame(chatgpt_portfolio)
-    elif not isinstance(chatgpt_portfolio, pd.DataFrame):
-        raise KeyError("The format for portfolio wasn't a dict, list, or DataFrame.")
-
-    chatgpt_portfolio, cash = process_portfolio(chatgpt_portfolio, cash)
-    daily_results(chatgpt_portfolio, cash)
+    if data_dir is not None or backend is not None:
+        ctx = PortfolioContext.create(data_dir if data_dir is not None else DATA_DIR, backend)
+    else:
+        ctx = _context(None)
+
+    if chatgpt_portfolio is None or cash is None:
+        chatgpt_portfolio, cash = rebuild_state(ctx.data_dir, backend)
+    chatgpt_portfolio = as_portfolio_frame(chatgpt_portfolio)
+    if orders is not None:
+        orders = load_orders(orders)
+
+    # One download covers holdings, benchmarks and the S&P 500 history,
+    # limited to the bars the local cache does not already hold
+    cache = PriceCache(ctx.data_dir / PRICE_CACHE_NAME, offline=offline)
+    session = MarketDataSession(start=SPX_START_DATE, cache=cache, client=client)
+    tickers = required_tickers(chatgpt_portfolio, orders)
+    with span("run.prefetch", tickers=len(tickers)):
+        session.prefetch(tickers)
+    run_portfolio(chatgpt_portfolio, cash, session, orders, ctx, rules)
 
 
 if __name__ == "__main__":